@@ -1,11 +1,13 @@
 """Hydrodomain Item class."""
 
+import os
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Union
 import logging
 import fiona.errors
 import geopandas as gpd
-from pystac import Item
+from pystac import Asset, Item, MediaType
 from pystac.extensions.projection import ProjectionExtension
 from shapely.geometry import Polygon, mapping, shape, MultiPolygon
 
@@ -13,6 +15,8 @@ HYDRO_DOMAIN_DESCRIPTION = "hydro_domain:description"
 HYDRO_DOMAIN_TYPE = "hydro_domain:type"
 DATETIME_INFO = "datetime_info"
 PROJ_EPSG = "proj:epsg"
+SUBBASINS_ASSET = "subbasins"
+SUBBASIN_NAME_FIELD = "hydro_domain:subbasin_name_field"
 
 
 class HydroDomain(Item):
@@ -25,6 +29,9 @@ class HydroDomain(Item):
         hydro_domain_type (str): Hydrological domain type. Options include 'watershed', 'transposition_region', and 'valid_transposition_region'.
         relevant_datetime (str | datetime, optional): Datetime used for the item. If one is not provided then the item creation time is used.
         relevant_datetime_description (str): Description of the datetime.
+        subbasins (str, optional): Path to a vector file of the sub-basin polygons of a watershed, added as the
+            `subbasins` asset of the item.
+        subbasin_name_field (str, optional): The field of the sub-basins file holding sub-basin names.
         **kwargs (Any): Additional keyword arguments.
     """
 
@@ -35,6 +42,8 @@ class HydroDomain(Item):
         hydro_domain_type: str,
         relevant_datetime: str | datetime = None,
         relevant_datetime_description: str = None,
+        subbasins: str = None,
+        subbasin_name_field: str = None,
         **kwargs: Any,
     ):
         self.item_id = item_id
@@ -90,6 +99,17 @@ class HydroDomain(Item):
         self.properties[DATETIME_INFO] = self.relevant_datetime_description
         self.properties[PROJ_EPSG] = 4326
 
+        if subbasins:
+            if self.hydro_domain_type != "watershed":
+                raise ValueError(f"Sub-basins can only be added to a watershed, not a {self.hydro_domain_type}")
+            extra_fields = {SUBBASIN_NAME_FIELD: subbasin_name_field} if subbasin_name_field else None
+            self.add_asset(
+                SUBBASINS_ASSET,
+                Asset(
+                    _absolute_path(subbasins), media_type=MediaType.GEOJSON, roles=["data"], extra_fields=extra_fields
+                ),
+            )
+
     @classmethod
     def from_item(cls, item: Item) -> "HydroDomain":
         """Create a HydroDomain instance from a STAC item."""
@@ -141,3 +161,41 @@ class HydroDomain(Item):
             raise ValueError(f"Error converting CRS to EPSG:4326: {e}")
 
         return gdf.geometry.iloc[0]
+
+
+def _absolute_path(path: str) -> str:
+    """Make a local path absolute so it resolves from wherever the item is saved; URLs are returned as is."""
+    return path if "://" in path else os.path.abspath(path)
+
+
+@lru_cache(maxsize=8)
+def _read_subbasins(href: str, name_field: str | None) -> tuple[tuple[str, Polygon], ...]:
+    """Read the names and polygons of a sub-basins file, once per process for each file."""
+    try:
+        gdf = gpd.read_file(href)
+    except (fiona.errors.FionaValueError, fiona.errors.DriverError) as e:
+        raise ValueError(f"Error reading the sub-basins file: {e}")
+    if gdf.crs is not None and gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs("EPSG:4326")
+    names = gdf[name_field].astype(str) if name_field else gdf.index.astype(str)
+    return tuple(zip(names, gdf.geometry))
+
+
+def load_subbasins(item: Item) -> dict[str, Polygon] | None:
+    """
+    Load the sub-basins of a watershed item.
+
+    The file is read once by each process, so the storms of a catalog share one read.
+
+    Args:
+        item (Item): A watershed item, with sub-basins as its `subbasins` asset.
+
+    Returns
+    -------
+        dict[str, Polygon] | None: The sub-basin polygons, in EPSG:4326, by name (or by position in the file if no name
+        field was given). None if the item has no sub-basins.
+    """
+    asset = item.assets.get(SUBBASINS_ASSET)
+    if asset is None:
+        return None
+    return dict(_read_subbasins(asset.get_absolute_href() or asset.href, asset.extra_fields.get(SUBBASIN_NAME_FIELD)))
@@ -4,10 +4,11 @@ import datetime
 import json
 import logging
 import os
-from typing import Any
+from collections import deque
+from typing import Any, Iterator
 
 import numpy as np
-import s3fs
+import pandas as pd
 import xarray as xr
 from affine import Affine
 from matplotlib import patches
@@ -17,19 +18,26 @@ from pyproj import CRS
 from pystac import Asset, Item, MediaType
 from pystac.extensions.projection import ProjectionExtension
 from pystac.extensions.storage import CloudPlatform, StorageExtension
-from shapely import Polygon, to_geojson
+from shapely import Point, Polygon, to_geojson
+from shapely.affinity import affine_transform
 from shapely.geometry import shape
 
-from stormhub.met.transpose import Transpose
+from stormhub.met.aorc.clip import clip_region
+from stormhub.met.aorc.cumulative import CumulativeCube
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import aorc_source
+from stormhub.met.aorc.store import local_aorc_paths
+from stormhub.met.rotation import local_rotation, max_rotated_transpose, top_rotated_transpositions
+from stormhub.met.transpose import Transpose, TranspositionPlan, max_transpose_watersheds
 
 NULL_POLYGON = Polygon()
 
 from stormhub.met.consts import (
     AORC_PRECIP_VARIABLE,
+    AORC_PRECISIONS,
     AORC_X_VAR,
     AORC_Y_VAR,
     MM_TO_INCH_CONVERSION_FACTOR,
-    NOAA_AORC_S3_BASE_URL,
 )
 
 
@@ -45,6 +53,25 @@ class AORCItem(Item):
         local_directory (str): Local directory path
         watershed_name (str, optional): Name of watershed.
         transposition_domain_name (str, optional): Name of transposition name.
+        transpose_engine (str, optional): Engine used by `Transpose.max_transpose`. Defaults to the exact "loop"
+            search of translations; the FFT based "convolution" engine is much faster but may break near-ties
+            differently. Rotations default to the "convolution" engine, as the angles are searched on threads that the
+            GIL would serialize in the "loop" engine.
+        rank_by (str, optional): Statistic used to rank transpositions, e.g. "mean" or "p90".
+        plan_dir (str, optional): Directory of cached transposition plans. If provided the watershed mask is loaded from
+            (or saved to) a `TranspositionPlan` rather than rasterized for each item.
+        precision (str, optional): Float dtype of the summed precipitation and the transposition, "float64" or
+            "float32".
+        scratch_dir (str, optional): Directory for memory-mapped scratch files backing large transposition grids.
+        rotation_angles (list[float], optional): Rotations of the watershed, in degrees counterclockwise, searched along
+            with translations by `max_transpose` and `alternate_transpositions`. Rotations are about the watershed
+            centroid in a local equal-scale frame (see `local_rotation`). If not provided only translations are
+            searched.
+        aorc_store_dir (str, optional): Directory of a local AORC store from `extract_aorc_region`. The AORC data is
+            read from it rather than from S3 when it covers the item.
+        variables (list[str], optional): Variables of the AORC dataset read along with precipitation, e.g. for DSS
+            export. If provided, `aorc_source_data` reads every variable of the window into memory in one pass with
+            `read_aorc_window`, rather than opening precipitation lazily.
         **kwargs (Any): Additional keyword arguments.
     """
 
@@ -58,9 +85,29 @@ class AORCItem(Item):
         local_directory: str,
         watershed_name: str = None,
         transposition_domain_name: str = None,
+        transpose_engine: str = None,
+        rank_by: str = "mean",
+        plan_dir: str = None,
+        precision: str = "float64",
+        scratch_dir: str = None,
+        rotation_angles: list[float] = None,
+        aorc_store_dir: str = None,
+        variables: list[str] = None,
         **kwargs: Any,
     ):
         self.item_id = item_id
+        self.transpose_engine = transpose_engine
+        self.rank_by = rank_by
+        self.plan_dir = plan_dir
+        if precision not in AORC_PRECISIONS:
+            raise ValueError(f"precision must be one of: {', '.join(AORC_PRECISIONS)}, not {precision}")
+        self.precision = precision
+        self.scratch_dir = scratch_dir
+        self.rotation_angles = rotation_angles
+        self.aorc_store_dir = aorc_store_dir
+        self.variables = [AORC_PRECIP_VARIABLE] + [
+            name for name in (getattr(v, "value", v) for v in variables or []) if name != AORC_PRECIP_VARIABLE
+        ]
         self.duration_hours = f"{duration_hours}hrs"
         self.duration = duration_hours
         if not watershed_name:
@@ -114,6 +161,13 @@ class AORCItem(Item):
         self._transposed_watershed: Polygon | None = None
         self._transposition_transform: Affine | None = None
         self._stats: dict | None = None
+        self._rotation_angle: float | None = None
+
+    def _search_engine(self) -> str:
+        """Get the engine of the transposition search, by default "loop" for translations and "convolution" for rotations."""
+        if self.transpose_engine is not None:
+            return self.transpose_engine
+        return "loop" if self.rotation_angles is None else "convolution"
 
     def _register_extensions(self) -> None:
         """Register item extensions."""
@@ -124,15 +178,7 @@ class AORCItem(Item):
     def aorc_paths(self) -> list[str]:
         """Construct s3 paths for AORC datasets for given start time and duration."""
         if self._aorc_paths is None:
-            if self.end_datetime.year == self.start_datetime.year:
-                self._aorc_paths = [f"{NOAA_AORC_S3_BASE_URL}/{self.start_datetime.year}.zarr"]
-            else:
-                year_list = []
-                current_year = self.start_datetime.year
-                while current_year <= self.end_datetime.year:
-                    year_list.append(current_year)
-                    current_year += 1
-                self._aorc_paths = [f"{NOAA_AORC_S3_BASE_URL}/{year}.zarr" for year in year_list]
+            self._aorc_paths = aorc_year_paths(self.start_datetime, self.end_datetime)
             logging.debug("year_list for %s: %s", self.start_datetime, self._aorc_paths)
         return self._aorc_paths
 
@@ -140,63 +186,104 @@ class AORCItem(Item):
     def aorc_source_data(self) -> xr.Dataset:
         """Extract AORC source data.
 
-        - reads AORC data into memory as multifile dataset using s3 paths
+        - reads AORC data into memory as multifile dataset using s3 paths, or the local AORC store if it covers the item
         - doesn't read the entire ZARR files, instead just reads slice of data corresponding to transposition domain geometry and limited to start and end time
         - adds ZARR files to assets if they don't exist already
+        - with additional `variables`, reads all of them into memory together, so the stats and a DSS export of the
+          item share one read of the window
         """
         if self._aorc_source_data is None:
-            s3_out = s3fs.S3FileSystem(anon=True)
-            fileset = [s3fs.S3Map(root=aorc_path, s3=s3_out, check=False) for aorc_path in self.aorc_paths]
-            ds = xr.open_mfdataset(fileset, engine="zarr", chunks="auto", consolidated=True)
-
-            transposition_geom_for_clip = self.transposition_domain_geometry
-            bounds = transposition_geom_for_clip.bounds
-            # adjust start slice to make sure start datetime is exclusive minimum (get data > start not data >= start)
-            start_timeslice_value = self.start_datetime + datetime.timedelta(hours=1)
-            subsection = ds.sel(
-                time=slice(start_timeslice_value, self.end_datetime),
-                longitude=slice(bounds[0], bounds[2]),
-                latitude=slice(bounds[1], bounds[3]),
-            )
-            self._aorc_source_data = subsection.rio.clip([transposition_geom_for_clip], drop=True, all_touched=True)
-            for aorc_path in self.aorc_paths:
-                aorc_year = int(os.path.basename(aorc_path).replace(".zarr", ""))
-                aorc_start_datetime = datetime.datetime(
-                    year=aorc_year, month=1, day=1, hour=0, tzinfo=datetime.timezone.utc
+            read_paths = (
+                local_aorc_paths(
+                    self.aorc_store_dir,
+                    self.start_datetime,
+                    self.end_datetime,
+                    self.transposition_domain_geometry,
+                    self.variables,
                 )
-                aorc_end_datetime = datetime.datetime(
-                    year=aorc_year + 1, month=1, day=1, hour=0, tzinfo=datetime.timezone.utc
+                or self.aorc_paths
+            )
+            if len(self.variables) > 1:
+                self._aorc_source_data = read_aorc_window(
+                    read_paths,
+                    self.start_datetime,
+                    self.end_datetime,
+                    self.transposition_domain_geometry,
+                    self.variables,
                 )
-                asset = Asset(
-                    aorc_path,
-                    media_type=MediaType.ZARR,
-                    extra_fields={
-                        "start_datetime": aorc_start_datetime.isoformat(),
-                        "end_datetime": aorc_end_datetime.isoformat(),
-                    },
-                    roles=[MediaType.ZARR],
+            else:
+                self._aorc_source_data = open_aorc_region(
+                    read_paths, self.start_datetime, self.end_datetime, self.transposition_domain_geometry
                 )
-                storage = StorageExtension.ext(asset)
-                storage.platform = CloudPlatform.AWS
-                self.add_asset(f"AORC_{aorc_year}", asset)
+            self._add_aorc_assets()
 
         return self._aorc_source_data
 
+    def _add_aorc_assets(self) -> None:
+        """Add the yearly AORC datasets of the item to its assets."""
+        for aorc_path in self.aorc_paths:
+            aorc_year = int(os.path.basename(aorc_path).replace(".zarr", ""))
+            aorc_start_datetime = datetime.datetime(
+                year=aorc_year, month=1, day=1, hour=0, tzinfo=datetime.timezone.utc
+            )
+            aorc_end_datetime = datetime.datetime(
+                year=aorc_year + 1, month=1, day=1, hour=0, tzinfo=datetime.timezone.utc
+            )
+            asset = Asset(
+                aorc_path,
+                media_type=MediaType.ZARR,
+                extra_fields={
+                    "start_datetime": aorc_start_datetime.isoformat(),
+                    "end_datetime": aorc_end_datetime.isoformat(),
+                },
+                roles=[MediaType.ZARR],
+            )
+            if aorc_path.startswith("s3://"):
+                storage = StorageExtension.ext(asset)
+                storage.platform = CloudPlatform.AWS
+            self.add_asset(f"AORC_{aorc_year}", asset)
+
     @property
     def transpose(self) -> Transpose:
         """Create transpose class to use for transposition functions."""
         if self._transpose is None:
             watershed_geom_for_transpose = self.watershed_geometry
+            data_array = self.sum_aorc["APCP_surface"]
+            plan = None
+            if self.plan_dir:
+                plan = TranspositionPlan.load_or_create(
+                    self.plan_dir, data_array, watershed_geom_for_transpose, self.transposition_domain_geometry
+                )
             self._transpose = Transpose(
-                self.sum_aorc["APCP_surface"], watershed_geom_for_transpose, AORC_X_VAR, AORC_Y_VAR
+                data_array,
+                watershed_geom_for_transpose,
+                AORC_X_VAR,
+                AORC_Y_VAR,
+                engine=self._search_engine(),
+                plan=plan,
+                dtype=self.precision,
+                scratch_dir=self.scratch_dir,
             )
         return self._transpose
 
     @property
-    def sum_aorc(self) -> xr.DataArray:
-        """Sum AORC precipitation data over the duration."""
+    def sum_aorc(self) -> xr.Dataset:
+        """Sum AORC precipitation data over the duration.
+
+        When the local AORC store has a cumulative cube covering the item, the sum is the difference of two hours of
+        the cube rather than a sum of every hour.
+        """
         if self._sum_aorc is None:
-            self._sum_aorc = self.aorc_source_data.sum(dim="time", skipna=True, min_count=1)
+            cube = CumulativeCube.from_store(self.aorc_store_dir)
+            geom = self.transposition_domain_geometry
+            if cube is not None and cube.covers([self.start_datetime], self.duration, geom):
+                window = cube.window_sums([self.start_datetime], self.duration, geom).isel(time=0, drop=True)
+                window = clip_region(window, geom).astype(self.precision)
+                self._sum_aorc = window.to_dataset(name=AORC_PRECIP_VARIABLE)
+                self._add_aorc_assets()
+            else:
+                source_data = self.aorc_source_data[[AORC_PRECIP_VARIABLE]].astype(self.precision)
+                self._sum_aorc = source_data.sum(dim="time", skipna=True, min_count=1)
         return self._sum_aorc
 
     @staticmethod
@@ -210,30 +297,97 @@ class AORCItem(Item):
             # "sum": float(np.nansum(array)) * MM_TO_INCH_CONVERSION_FACTOR,
         }
 
+    @staticmethod
+    def _transform_properties(transform: Affine) -> dict:
+        """Create item properties from an affine transform."""
+        return {
+            "a": float(transform.a),
+            "b": float(transform.b),
+            "c": float(transform.c),
+            "d": float(transform.d),
+            "e": float(transform.e),
+            "f": float(transform.f),
+        }
+
+    def alternate_transpositions(
+        self, count: int, min_separation: int = 0, add_properties: bool = True
+    ) -> list[tuple[Polygon, Affine, dict]]:
+        """Get the runner-up transpositions after the max transpose.
+
+        - rank the count + 1 highest transpositions at least `min_separation` cells apart in one scan, across all
+          `rotation_angles` when rotations are searched
+        - drop the highest, which is the max transpose
+        - record transforms (and rotations), and stats of the rest to item properties
+        - return polygon, transform, and stats of each
+        """
+        if self.rotation_angles is not None:
+            ranked = top_rotated_transpositions(
+                self.sum_aorc["APCP_surface"],
+                self.watershed_geometry,
+                AORC_X_VAR,
+                AORC_Y_VAR,
+                self.rotation_angles,
+                count + 1,
+                min_separation,
+                func=self._create_stats,
+                rank_by=self.rank_by,
+                engine=self._search_engine(),
+                dtype=self.precision,
+            )[1:]
+        else:
+            ranked = [
+                (*transposition, None)
+                for transposition in self.transpose.top_transpositions(
+                    count + 1, min_separation, self._create_stats, rank_by=self.rank_by
+                )[1:]
+            ]
+        if add_properties:
+            alternate_properties = []
+            for rank, (_, transform, stats, angle) in enumerate(ranked, start=2):
+                properties = {"rank": rank, "transform": self._transform_properties(transform), "statistics": stats}
+                if angle is not None:
+                    properties["rotation"] = angle
+                alternate_properties.append(properties)
+            self.properties["aorc:alternate_transforms"] = alternate_properties
+        return [(polygon, transform, stats) for polygon, transform, stats, _ in ranked]
+
     def max_transpose(self, add_properties: bool = True) -> tuple[Polygon, Affine, dict]:
         """Get max transpose.
 
         - convert max array to polygon
         - add stats object to item properties
         - record transpose centroid as item geometry
-        - record max shift (as affine transform) to item properties
+        - record max shift (as affine transform, including any rotation) to item properties
         - return polygon, transform, and stats
         """
         if not all([self._transposed_watershed, self._transposition_transform, self._stats]):
-            self._transposed_watershed, self._transposition_transform, self._stats = self.transpose.max_transpose(
-                self._create_stats
-            )
+            if self.rotation_angles is not None:
+                (
+                    self._transposed_watershed,
+                    self._transposition_transform,
+                    self._stats,
+                    self._rotation_angle,
+                ) = max_rotated_transpose(
+                    self.sum_aorc["APCP_surface"],
+                    self.watershed_geometry,
+                    AORC_X_VAR,
+                    AORC_Y_VAR,
+                    self.rotation_angles,
+                    func=self._create_stats,
+                    rank_by=self.rank_by,
+                    engine=self._search_engine(),
+                    dtype=self.precision,
+                )
+            else:
+                self._transposed_watershed, self._transposition_transform, self._stats = self.transpose.max_transpose(
+                    self._create_stats, rank_by=self.rank_by
+                )
         if add_properties:
             self.geometry = json.loads(to_geojson(self._transposed_watershed.centroid))
             self.properties["aorc:statistics"] = self._stats
-            self.properties["aorc:transform"] = {
-                "a": self._transposition_transform.a,
-                "b": self._transposition_transform.b,
-                "c": self._transposition_transform.c,
-                "d": self._transposition_transform.d,
-                "e": self._transposition_transform.e,
-                "f": self._transposition_transform.f,
-            }
+            self.properties["aorc:transform"] = self._transform_properties(self._transposition_transform)
+            if self._rotation_angle is not None:
+                self.properties["aorc:rotation"] = self._rotation_angle
         return (
             self._transposed_watershed,
             self._transposition_transform,
@@ -241,6 +395,92 @@ class AORCItem(Item):
             self._transposed_watershed.centroid,
         )
 
+    def max_transpose_watersheds(
+        self, watershed_geometries: list[Polygon]
+    ) -> list[tuple[Polygon, Affine, dict, Point] | None]:
+        """Get the max transpose of several watersheds from the one read of this item's AORC data.
+
+        - sum the AORC data for the item once
+        - correlate every watershed mask with the summed grid in one batched pass
+        - return polygon, transform, stats, and centroid per watershed (None where no transposition is valid)
+        """
+        data_array = self.sum_aorc["APCP_surface"]
+        plans = None
+        if self.plan_dir:
+            plans = [
+                TranspositionPlan.load_or_create(
+                    self.plan_dir, data_array, watershed_geometry, self.transposition_domain_geometry
+                )
+                for watershed_geometry in watershed_geometries
+            ]
+        results = max_transpose_watersheds(
+            data_array,
+            watershed_geometries,
+            AORC_X_VAR,
+            AORC_Y_VAR,
+            func=self._create_stats,
+            plans=plans,
+            dtype=self.precision,
+        )
+        return [None if result is None else (*result, result[0].centroid) for result in results]
+
+    def subbasin_hyetographs(self, subbasins: dict[str, Polygon], add_asset: bool = True) -> pd.DataFrame:
+        """Get the hourly precipitation of each sub-basin of the watershed at the max transpose.
+
+        - rasterize the sub-basins into a label grid aligned with the watershed window (rotated with the watershed
+          when rotations are searched), once per catalog when the labels are kept by a cached `TranspositionPlan`
+        - average every sub-basin for every hour in one bincount over the transposed window of the AORC data
+        - write the hyetographs (inches) to a CSV asset
+        - return a DataFrame indexed by time with a column per sub-basin
+        """
+        self.max_transpose(add_properties=False)
+        transpose = self.transpose
+        polygons = list(subbasins.values())
+        rotation = Affine.identity()
+        if self._rotation_angle is not None:
+            rotation = local_rotation(self.watershed_geometry.centroid, self._rotation_angle)
+            rotated_watershed = affine_transform(self.watershed_geometry, rotation.to_shapely())
+            plan = None
+            if self.plan_dir:
+                plan = TranspositionPlan.load_or_create(
+                    self.plan_dir, self.sum_aorc["APCP_surface"], rotated_watershed, self.transposition_domain_geometry
+                )
+            transpose = Transpose(
+                self.sum_aorc["APCP_surface"],
+                rotated_watershed,
+                AORC_X_VAR,
+                AORC_Y_VAR,
+                plan=plan,
+                dtype=self.precision,
+            )
+            polygons = [affine_transform(polygon, rotation.to_shapely()) for polygon in polygons]
+        translation = self._transposition_transform * ~rotation
+        x_delta = int(round(translation.c / transpose.x_cellsize))
+        y_delta = int(round(translation.f / transpose.y_cellsize))
+
+        labels = transpose.subbasin_labels(polygons)
+        hourly = self.aorc_source_data[AORC_PRECIP_VARIABLE].astype(self.precision)
+        means = transpose.subbasin_means(labels, hourly, x_delta, y_delta, count=len(polygons))
+        hyetographs = pd.DataFrame(
+            means * MM_TO_INCH_CONVERSION_FACTOR,
+            index=pd.DatetimeIndex(hourly["time"].to_numpy(), name="time"),
+            columns=list(subbasins.keys()),
+        )
+
+        if add_asset:
+            if not os.path.isdir(self.local_directory):
+                os.makedirs(self.local_directory)
+            filename = f"{self.item_id}.subbasin-hyetographs.csv"
+            hyetographs.to_csv(os.path.join(self.local_directory, filename))
+            asset = Asset(
+                filename,
+                media_type="text/csv",
+                roles=["data"],
+                description="Hourly mean precipitation (inches) of each sub-basin at the max transpose",
+            )
+            self.add_asset("subbasin_hyetographs", asset)
+        return hyetographs
+
     def aorc_thumbnail(
         self,
         scale_max: float,
@@ -257,9 +497,7 @@ class AORCItem(Item):
         - original transposition domain
         """
         if self._transposed_watershed is None:
-            self._transposed_watershed, self._transposition_transform, self._stats = self.transpose.max_transpose(
-                self._create_stats
-            )
+            self.max_transpose(add_properties=False)
         fig, ax = plt.subplots(figsize=(5, 5))
         fig.set_facecolor("w")
         colormap = plt.get_cmap("Spectral_r")
@@ -304,25 +542,192 @@ class AORCItem(Item):
             plt.close()
 
 
-def valid_spaces_item(watershed: Item, transposition_region: Item, storm_duration: int = 72) -> Polygon:
-    """Search a sample zarr dataset to identify valid spaces for transposition. datetime.datetime(1980, 5, 1) is used as a start time for the search."""
-    s3 = s3fs.S3FileSystem(anon=True)
-    start_time = datetime.datetime(1980, 5, 1)
-    sample_data = s3fs.S3Map(root=f"{NOAA_AORC_S3_BASE_URL}/{start_time.year}.zarr", s3=s3)
-    ds = xr.open_dataset(sample_data, engine="zarr", chunks="auto", consolidated=True)
-    bounds = shape(transposition_region.geometry).bounds
-
-    subset = ds.sel(
-        time=slice(start_time, start_time + datetime.timedelta(hours=storm_duration)),
-        longitude=slice(bounds[0], bounds[2]),
-        latitude=slice(bounds[1], bounds[3]),
+def aorc_year_paths(start_datetime: datetime.datetime, end_datetime: datetime.datetime) -> list[str]:
+    """Construct paths of the AORC source for the yearly AORC datasets covering a start and end time."""
+    return aorc_source().year_paths(start_datetime, end_datetime)
+
+
+def open_aorc_region(
+    aorc_paths: list[str],
+    start_datetime: datetime.datetime,
+    end_datetime: datetime.datetime,
+    transposition_geom: Polygon,
+) -> xr.Dataset:
+    """Open AORC data lazily for the hours after a start time up to an end time, clipped to a transposition domain.
+
+    The yearly datasets are drawn from the AORC dataset registry of the process, so their metadata is read once.
+    """
+    ds = aorc_registry().open(aorc_paths)
+
+    # adjust start slice to make sure start datetime is exclusive minimum (get data > start not data >= start)
+    start_timeslice_value = start_datetime + datetime.timedelta(hours=1)
+    return clip_region(ds.sel(time=slice(start_timeslice_value, end_datetime)), transposition_geom)
+
+
+def read_aorc_window(
+    aorc_paths: list[str],
+    start_datetime: datetime.datetime,
+    end_datetime: datetime.datetime,
+    transposition_geom: Polygon,
+    variables: list,
+) -> xr.Dataset:
+    """Read several AORC variables of a storm window into memory in one pass, clipped to a region.
+
+    The variables are opened and clipped together and computed in one dask graph, so the yearly datasets, coordinates
+    and region mask are shared rather than opened once per variable, and each chunk is read once. The in-memory window
+    can feed both the stats of an `AORCItem` and a DSS export.
+
+    Args:
+        aorc_paths (list[str]): The paths of the yearly AORC stores covering the window.
+        start_datetime (datetime.datetime): The start of the window, exclusive.
+        end_datetime (datetime.datetime): The end of the window, inclusive.
+        transposition_geom (Polygon): The region read.
+        variables (list): The variables, as names or as `NOAADataVariable` members.
+
+    Returns
+    -------
+        xr.Dataset: The variables of the window.
+    """
+    names = list(dict.fromkeys(getattr(variable, "value", variable) for variable in variables))
+    return open_aorc_region(aorc_paths, start_datetime, end_datetime, transposition_geom)[names].load()
+
+
+def accumulation_stack(
+    start_datetimes: list[datetime.datetime],
+    duration: datetime.timedelta,
+    transposition_geom: Polygon,
+    precision: str = "float64",
+    store_dir: str = None,
+) -> xr.DataArray:
+    """Sum AORC precipitation over the duration following each start time into a lazy (time, y, x) stack.
+
+    The source data for the whole block of start times is opened once, so consecutive start times share reads. It is
+    read from the local AORC store in `store_dir` when that covers the block, and each sum is the difference of two
+    hours of the cumulative cube of the store when it has one covering the block.
+    """
+    start_datetimes = sorted(start_datetimes)
+    cube = CumulativeCube.from_store(store_dir)
+    if cube is not None and cube.covers(start_datetimes, duration, transposition_geom):
+        return clip_region(cube.window_sums(start_datetimes, duration, transposition_geom), transposition_geom).astype(
+            precision
+        )
+    end_datetime = start_datetimes[-1] + duration
+    paths = local_aorc_paths(store_dir, start_datetimes[0], end_datetime, transposition_geom) or aorc_year_paths(
+        start_datetimes[0], end_datetime
     )
+    source_data = open_aorc_region(paths, start_datetimes[0], end_datetime, transposition_geom)
+    precip = source_data[AORC_PRECIP_VARIABLE].astype(precision)
+    sums = [
+        precip.sel(time=slice(start + datetime.timedelta(hours=1), start + duration)).sum(
+            dim="time", skipna=True, min_count=1
+        )
+        for start in start_datetimes
+    ]
+    return xr.concat(sums, dim=pd.Index(start_datetimes, name="time")).astype(precision)
+
+
+def rolling_accumulations(
+    start_datetimes: list[datetime.datetime],
+    duration: datetime.timedelta,
+    transposition_geom: Polygon,
+    precision: str = "float64",
+    store_dir: str = None,
+    read_hours: int = 24 * 30,
+) -> Iterator[tuple[datetime.datetime, xr.DataArray]]:
+    """Stream AORC precipitation in time order, summing the duration following each start time with a rolling window.
+
+    Each hour is read once, in blocks of `read_hours` that may span years, and added to a running sum and count of
+    finite hours, while the hour leaving the window is subtracted. The sum is emitted when the window following a start
+    time is complete, so consecutive start times share every read. Start times further apart than the duration start a
+    new window rather than streaming the hours between them. Sums are kept in float64 and emitted like
+    `sum(skipna=True, min_count=1)`, with cells without a finite hour as NaN. Windows missing hours of the data, such
+    as their final hour, are logged as warnings and not emitted.
 
-    clipped_data = subset.rio.clip([shape(transposition_region.geometry)], drop=True, all_touched=True)
+    Args:
+        start_datetimes (list[datetime.datetime]): The start times of the windows.
+        duration (datetime.timedelta): The duration of the windows.
+        transposition_geom (Polygon): The transposition domain.
+        precision (str): Float dtype of the emitted sums, "float64" or "float32".
+        store_dir (str, optional): Directory of a local AORC store, read in place of S3 where it covers the hours.
+        read_hours (int): Hours read at a time.
+
+    Yields
+    ------
+        tuple[datetime.datetime, xr.DataArray]: Each start time, in time order, and its summed grid.
+    """
+    start_datetimes = sorted(set(start_datetimes))
+    segments = []
+    for start in start_datetimes:
+        if segments and start - segments[-1][-1] <= duration:
+            segments[-1].append(start)
+        else:
+            segments.append([start])
+
+    for segment in segments:
+        pending = deque(pd.DatetimeIndex(segment))
+        window = deque()
+        sums = counts = None
+        read_start = segment[0]
+        segment_end = segment[-1] + duration
+        while pending and read_start < segment_end:
+            read_end = min(read_start + datetime.timedelta(hours=read_hours), segment_end)
+            paths = local_aorc_paths(store_dir, read_start, read_end, transposition_geom) or aorc_year_paths(
+                read_start, read_end
+            )
+            block = open_aorc_region(paths, read_start, read_end, transposition_geom)[AORC_PRECIP_VARIABLE]
+            if block.sizes["time"] == 0:
+                read_start = read_end
+                continue
+            template = block.isel(time=0, drop=True)
+            hours = block.to_numpy().astype(np.float64)
+            for time, hour in zip(block.indexes["time"], hours):
+                finite = np.isfinite(hour)
+                hour = np.where(finite, hour, 0.0)
+                if sums is None:
+                    sums, counts = np.zeros_like(hour), np.zeros(hour.shape, dtype=np.int32)
+                sums += hour
+                counts += finite
+                window.append((time, hour, finite))
+                while window[0][0] <= time - duration:
+                    _, old_hour, old_finite = window.popleft()
+                    sums -= old_hour
+                    counts -= old_finite
+                    # clear the rounding left where no finite hours remain
+                    sums[counts == 0] = 0.0
+                while pending and pending[0] + duration < time:
+                    logging.warning("Hours missing from the AORC data for the window after %s", pending.popleft())
+                if pending and pending[0] + duration == time:
+                    grid = np.where(counts > 0, sums, np.nan).astype(precision)
+                    yield pending.popleft().to_pydatetime(), template.copy(data=grid)
+            read_start = read_end
+        # the data ended before the final hour of these windows
+        for start in pending:
+            logging.warning("Hours missing from the AORC data for the window after %s", start)
+
+
+def valid_spaces_item(
+    watershed: Item, transposition_region: Item, storm_duration: int = 72, plan_dir: str = None
+) -> Polygon:
+    """Search a sample zarr dataset to identify valid spaces for transposition. datetime.datetime(1980, 5, 1) is used as a start time for the search.
+
+    If `plan_dir` is provided the watershed mask is loaded from (or saved to) a cached `TranspositionPlan`.
+    """
+    start_time = datetime.datetime(1980, 5, 1)
+    ds = aorc_registry().dataset(aorc_source().year_path(start_time.year))
+    subset = ds.sel(time=slice(start_time, start_time + datetime.timedelta(hours=storm_duration)))
+    clipped_data = clip_region(subset, shape(transposition_region.geometry))
+    data_array = clipped_data[AORC_PRECIP_VARIABLE].sum(dim="time", skipna=True, min_count=1)
+    plan = None
+    if plan_dir:
+        plan = TranspositionPlan.load_or_create(
+            plan_dir, data_array, shape(watershed.geometry), shape(transposition_region.geometry)
+        )
     transpose = Transpose(
-        clipped_data[AORC_PRECIP_VARIABLE].sum(dim="time", skipna=True, min_count=1),
+        data_array,
         shape(watershed.geometry),
         AORC_X_VAR,
         AORC_Y_VAR,
+        engine="convolution",
+        plan=plan,
     )
     return transpose.valid_spaces_polygon
@@ -0,0 +1,304 @@
+"""On-disk least recently used cache of the chunks of AORC Zarr stores."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+
+from fsspec import FSMap
+from fsspec.asyn import sync
+from zarr.storage import BaseStore
+
+AORC_CHUNK_CACHE_BYTES = 20 * 2**30
+"""Default size cap of the chunk cache, about a decade of a large transposition region"""
+AORC_CHUNK_CACHE_LOG_EVERY = 1000
+"""Number of chunk reads between log records of the hits and misses of a cache"""
+AORC_PREFETCH_CONCURRENCY = 32
+"""Number of chunks fetched at once when prefetching into a cache"""
+
+
+class AORCChunkCache(BaseStore):
+    """
+    A read-only Zarr store serving the chunks of another store from a local directory, fetching them on a miss.
+
+    Chunks are written to `cache_dir` under a directory named for the wrapped store, so re-runs and resumed
+    collections read each chunk from S3 once. Files are written to a temporary name and renamed, so processes sharing
+    the directory never read a partial chunk. A hit marks the file as recently used, and once more than a twentieth of
+    the cap was written the least recently used files of the whole directory are removed until it is below 90% of the
+    cap. Metadata keys are not cached, so a store that is still being appended to is not read stale.
+
+    Attributes
+    ----------
+        store (MutableMapping): The wrapped store, e.g. an `s3fs.S3Map`.
+        cache_dir (str): The directory of the cache, which may be shared by processes and stores.
+        max_bytes (int): The size cap of the cache directory.
+        hits (int): The chunk reads served from the cache by this object.
+        misses (int): The chunk reads fetched from the wrapped store by this object.
+    """
+
+    _readable = True
+    _writeable = False
+    _erasable = False
+    _listable = True
+
+    def __init__(
+        self,
+        store: MutableMapping,
+        cache_dir: str,
+        max_bytes: int = AORC_CHUNK_CACHE_BYTES,
+        name: str = None,
+        log_every: int = AORC_CHUNK_CACHE_LOG_EVERY,
+    ) -> None:
+        """
+        Initialize the AORCChunkCache class.
+
+        Args:
+            store (MutableMapping): The wrapped store.
+            cache_dir (str): The directory of the cache.
+            max_bytes (int): The size cap of the cache directory.
+            name (str, optional): A name identifying the wrapped store. Defaults to the root of an fsspec mapping.
+            log_every (int): Number of chunk reads between log records of the hits and misses.
+        """
+        if max_bytes < 1:
+            raise ValueError(f"max_bytes must be at least 1, not {max_bytes}")
+        name = name or getattr(store, "root", None)
+        if not name:
+            raise ValueError("A name is required to cache a store that is not an fsspec mapping")
+        self.store = store
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.log_every = log_every
+        self.hits = 0
+        self.misses = 0
+        self.fetched_bytes = 0
+        self._name = name
+        self._store_dir = os.path.join(cache_dir, hashlib.sha256(name.encode()).hexdigest()[:16])
+        self._written = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_metadata(key: str) -> bool:
+        """Check whether a key is Zarr metadata rather than a chunk."""
+        return key.rsplit("/", 1)[-1].startswith(".")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._store_dir, *key.split("/"))
+
+    def _read(self, key: str) -> bytes | None:
+        """Read a cached chunk and mark it recently used, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        """Cache a chunk, renaming it into place once written."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning("Error caching AORC chunk %s/%s: %s", self._name, key, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._written += len(data)
+            evict = self._written >= self.max_bytes // 20
+            if evict:
+                self._written = 0
+        if evict:
+            self.evict()
+
+    def _count(self, hits: int, misses: int, fetched_bytes: int) -> None:
+        with self._lock:
+            before = (self.hits + self.misses) // self.log_every
+            self.hits += hits
+            self.misses += misses
+            self.fetched_bytes += fetched_bytes
+            log = (self.hits + self.misses) // self.log_every > before
+        if log:
+            self.log_stats()
+
+    def log_stats(self) -> None:
+        """Log the hits and misses of the cache."""
+        reads = self.hits + self.misses
+        logging.info(
+            "AORC chunk cache %s: %d hits, %d misses (%.1f%% hit rate), %.1f MB fetched",
+            self._name,
+            self.hits,
+            self.misses,
+            100 * self.hits / reads if reads else 0.0,
+            self.fetched_bytes / 2**20,
+        )
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used files of the cache directory until it is below 90% of the size cap.
+
+        Files removed by another process in the meantime are skipped.
+
+        Returns
+        -------
+            int: The number of files removed.
+        """
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if ".tmp-" in name:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        logging.debug("Evicted %d files from the AORC chunk cache %s", removed, self.cache_dir)
+        return removed
+
+    def _fetch(self, keys: list[str]) -> dict[str, bytes]:
+        """Fetch keys from the wrapped store, concurrently for fsspec mappings, omitting missing keys."""
+        if isinstance(self.store, FSMap):
+            return self.store.getitems(keys, on_error="omit")
+        fetched = {}
+        for key in keys:
+            try:
+                fetched[key] = self.store[key]
+            except KeyError:
+                pass
+        return fetched
+
+    def _get_or_none(self, key: str) -> bytes | None:
+        try:
+            return self.store[key]
+        except KeyError:
+            return None
+
+    async def _fetch_async(self, keys: list[str], max_concurrency: int) -> dict[str, bytes | None]:
+        """Fetch keys from an async file system, with at most `max_concurrency` requests in flight."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(key: str) -> tuple[str, bytes | None]:
+            async with semaphore:
+                try:
+                    return key, await self.store.fs._cat_file(f"{self.store.root}/{key}")
+                except FileNotFoundError:
+                    return key, None
+
+        return dict(await asyncio.gather(*(fetch(key) for key in keys)))
+
+    def prefetch(self, keys: list[str], max_concurrency: int = AORC_PREFETCH_CONCURRENCY) -> int:
+        """
+        Fetch the chunks of keys that are not cached, with bounded concurrency, so later reads are hits.
+
+        Chunks are fetched with the event loop of an async file system such as S3, or with a pool of threads
+        otherwise.
+
+        Args:
+            keys (list[str]): The chunk keys.
+            max_concurrency (int): The greatest number of chunks fetched at once.
+
+        Returns
+        -------
+            int: The number of chunks fetched.
+        """
+        missing = [key for key in dict.fromkeys(keys) if not os.path.exists(self._path(key))]
+        if not missing:
+            return 0
+        fs = getattr(self.store, "fs", None)
+        if isinstance(self.store, FSMap) and getattr(fs, "async_impl", False):
+            fetched = sync(fs.loop, self._fetch_async, missing, max_concurrency)
+        else:
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                fetched = dict(zip(missing, executor.map(self._get_or_none, missing)))
+        fetched = {key: bytes(data) for key, data in fetched.items() if data is not None}
+        for key, data in fetched.items():
+            self._write(key, data)
+        self._count(0, len(fetched), sum(len(data) for data in fetched.values()))
+        return len(fetched)
+
+    def getitems(self, keys: list[str], *, contexts=None) -> dict[str, bytes]:
+        """
+        Get several keys, reading cached chunks and fetching the others from the wrapped store together.
+
+        Args:
+            keys (list[str]): The keys.
+            contexts (optional): The Zarr contexts of the keys, unused.
+
+        Returns
+        -------
+            dict[str, bytes]: The values of the keys that exist.
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            data = None if self._is_metadata(key) else self._read(key)
+            if data is None:
+                missing.append(key)
+            else:
+                values[key] = data
+        fetched = self._fetch(missing) if missing else {}
+        for key, data in fetched.items():
+            data = bytes(data)
+            if not self._is_metadata(key):
+                self._write(key, data)
+            values[key] = data
+        chunk_misses = sum(not self._is_metadata(key) for key in missing)
+        self._count(len(keys) - len(missing), chunk_misses, sum(len(data) for data in fetched.values()))
+        return values
+
+    def __getitem__(self, key: str) -> bytes:
+        """Get a key, from the cache if it is a cached chunk."""
+        values = self.getitems([key])
+        if key not in values:
+            raise KeyError(key)
+        return values[key]
+
+    def __contains__(self, key: str) -> bool:
+        """Check whether the wrapped store has a key."""
+        if not self._is_metadata(key) and os.path.exists(self._path(key)):
+            return True
+        return key in self.store
+
+    def __iter__(self):
+        """Iterate over the keys of the wrapped store."""
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        """Count the keys of the wrapped store."""
+        return len(self.store)
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        """Refuse writes, as the cache is read-only."""
+        raise PermissionError("The AORC chunk cache is read-only")
+
+    def __delitem__(self, key: str) -> None:
+        """Refuse deletes, as the cache is read-only."""
+        raise PermissionError("The AORC chunk cache is read-only")
@@ -0,0 +1,156 @@
+"""Clipping of AORC grids to a region, with the rasterized region mask cached per region and grid."""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from rasterio.features import rasterize
+from shapely import Polygon
+
+from stormhub.met.consts import AORC_X_VAR, AORC_Y_VAR
+
+REGION_MASK_CACHE_SIZE = 32
+"""Number of region masks kept by each process, enough for the regions and grids of a catalog"""
+
+
+class RegionMask:
+    """
+    The cells of a grid touched by a region, as integer slices of the grid and a boolean mask within them.
+
+    Attributes
+    ----------
+        rows (slice): The rows of the grid spanned by the touched cells.
+        cols (slice): The columns of the grid spanned by the touched cells.
+        mask (np.ndarray): Whether each cell of the rows and columns is touched by the region.
+    """
+
+    def __init__(self, rows: slice, cols: slice, mask: np.ndarray) -> None:
+        """
+        Initialize the RegionMask class.
+
+        Args:
+            rows (slice): The rows of the grid spanned by the touched cells.
+            cols (slice): The columns of the grid spanned by the touched cells.
+            mask (np.ndarray): Whether each cell of the rows and columns is touched by the region.
+        """
+        self.rows = rows
+        self.cols = cols
+        self.mask = mask
+
+    @classmethod
+    def rasterize(cls, data: xr.Dataset | xr.DataArray, region: Polygon) -> "RegionMask":
+        """
+        Rasterize the cells of a grid touched by a region, among cells with centres within the region's bounds.
+
+        Args:
+            data (xr.Dataset | xr.DataArray): Data on the grid, with latitude and longitude coordinates.
+            region (Polygon): The region, in the CRS of the grid.
+
+        Returns
+        -------
+            RegionMask: The mask of the touched cells.
+        """
+        min_x, min_y, max_x, max_y = region.bounds
+        x = data[AORC_X_VAR].to_numpy()
+        y = data[AORC_Y_VAR].to_numpy()
+        x_within = np.flatnonzero((x >= min_x) & (x <= max_x))
+        y_within = np.flatnonzero((y >= min_y) & (y <= max_y))
+        if x_within.size == 0 or y_within.size == 0:
+            raise ValueError(f"No cells of the grid are within the bounds {region.bounds}")
+        cols = slice(x_within[0], x_within[-1] + 1)
+        rows = slice(y_within[0], y_within[-1] + 1)
+        subsection = data.isel({AORC_X_VAR: cols, AORC_Y_VAR: rows})
+        mask = rasterize(
+            [region],
+            out_shape=(rows.stop - rows.start, cols.stop - cols.start),
+            transform=subsection.rio.transform(recalc=True),
+            fill=0,
+            default_value=1,
+            all_touched=True,
+            dtype="uint8",
+        ).astype(bool)
+        touched_rows = np.flatnonzero(mask.any(axis=1))
+        touched_cols = np.flatnonzero(mask.any(axis=0))
+        if touched_rows.size == 0:
+            raise ValueError(f"No cells of the grid are touched by the region with bounds {region.bounds}")
+        mask = mask[touched_rows[0] : touched_rows[-1] + 1, touched_cols[0] : touched_cols[-1] + 1]
+        return cls(
+            slice(rows.start + touched_rows[0], rows.start + touched_rows[-1] + 1),
+            slice(cols.start + touched_cols[0], cols.start + touched_cols[-1] + 1),
+            mask,
+        )
+
+    def apply(self, data: xr.Dataset | xr.DataArray) -> xr.Dataset | xr.DataArray:
+        """
+        Slice data on the grid to the touched cells and mask the others, lazily for dask-backed data.
+
+        Args:
+            data (xr.Dataset | xr.DataArray): Data on the grid the mask was rasterized on.
+
+        Returns
+        -------
+            xr.Dataset | xr.DataArray: The clipped data, with the cells not touched as NaN.
+        """
+        clipped = data.isel({AORC_Y_VAR: self.rows, AORC_X_VAR: self.cols})
+        clipped = clipped.where(xr.DataArray(self.mask, dims=(AORC_Y_VAR, AORC_X_VAR)))
+        # any transform recorded for the whole grid no longer applies
+        return clipped.rio.write_transform(clipped.rio.transform(recalc=True))
+
+
+_masks: OrderedDict[tuple, RegionMask] = OrderedDict()
+_masks_lock = threading.Lock()
+
+
+def _grid_key(data: xr.Dataset | xr.DataArray) -> tuple:
+    """Identify a grid by the extent and size of its coordinates."""
+    x = data[AORC_X_VAR].to_numpy()
+    y = data[AORC_Y_VAR].to_numpy()
+    return (float(x[0]), float(x[-1]), x.size, float(y[0]), float(y[-1]), y.size)
+
+
+def region_mask(data: xr.Dataset | xr.DataArray, region: Polygon) -> RegionMask:
+    """
+    Get the mask of the cells of a grid touched by a region, rasterizing it on first use.
+
+    Masks are kept per region and grid by each process, so the storms of a catalog rasterize their transposition
+    domain once.
+
+    Args:
+        data (xr.Dataset | xr.DataArray): Data on the grid, with latitude and longitude coordinates.
+        region (Polygon): The region, in the CRS of the grid.
+
+    Returns
+    -------
+        RegionMask: The mask of the touched cells.
+    """
+    key = (region.wkb, _grid_key(data))
+    with _masks_lock:
+        mask = _masks.get(key)
+        if mask is not None:
+            _masks.move_to_end(key)
+            return mask
+    mask = RegionMask.rasterize(data, region)
+    with _masks_lock:
+        _masks[key] = mask
+        while len(_masks) > REGION_MASK_CACHE_SIZE:
+            _masks.popitem(last=False)
+    return mask
+
+
+def clip_region(data: xr.Dataset | xr.DataArray, region: Polygon) -> xr.Dataset | xr.DataArray:
+    """
+    Select AORC data within the bounds of a region, masking cells it does not touch.
+
+    Matches `rio.clip(all_touched=True, drop=True)` of the data within the bounds, but with the mask cached, so
+    clipping is an integer slice and a lazy `where` rather than rasterizing the region against the data each time.
+
+    Args:
+        data (xr.Dataset | xr.DataArray): The data, with latitude and longitude coordinates.
+        region (Polygon): The region, in the CRS of the data.
+
+    Returns
+    -------
+        xr.Dataset | xr.DataArray: The clipped data.
+    """
+    return region_mask(data, region).apply(data)
@@ -0,0 +1,252 @@
+"""Cumulative precipitation cube, giving the accumulation of any window of hours from two reads."""
+
+import datetime
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+from shapely import Polygon
+
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.store import AORC_STORE_ATTR, local_year_path
+from stormhub.met.consts import AORC_PRECIP_VARIABLE, AORC_X_VAR, AORC_Y_VAR
+
+CUMULATIVE_PRECIP_VARIABLE = "cumulative_precip"
+"""Running sum of precipitation, NaN hours counting as zero, up to and including each hour"""
+CUMULATIVE_COUNT_VARIABLE = "finite_count"
+"""Running count of hours with finite precipitation, up to and including each hour"""
+CUMULATIVE_CUBE_ATTR = "stormhub:cumulative"
+"""Zarr attribute recording the bounds and years of a cumulative cube"""
+
+_cubes: dict[str, tuple[dict, "CumulativeCube"]] = {}
+_cubes_lock = threading.Lock()
+
+
+def cumulative_cube_path(store_dir: str) -> str:
+    """Build the path of the cumulative precipitation cube of a local AORC store."""
+    return os.path.join(store_dir, "cumulative.zarr")
+
+
+def _cube_attrs(path: str) -> dict | None:
+    """Read the record of a cumulative cube, or None if there is no cube."""
+    try:
+        with open(os.path.join(path, ".zattrs"), encoding="utf-8") as f:
+            return json.load(f).get(CUMULATIVE_CUBE_ATTR)
+    except (OSError, ValueError):
+        return None
+
+
+def build_cumulative_cube(store_dir: str, start_year: int, end_year: int, time_chunk: int = 24 * 90) -> str:
+    """
+    Build the cumulative precipitation cube of the years of a local AORC store.
+
+    The cube holds the running sum of precipitation and the running count of finite hours of each cell, starting
+    from zero the hour before the first year. Years are appended in turn, each carrying on from the last hour of the
+    year before, so the cube is built chunk by chunk. A year is recorded in the cube attributes only once it is
+    written, and hours of a year that was interrupted are truncated, so a build resumes from the first year not
+    appended. Sums are kept in float64 so differences stay exact to well below the precision of the data.
+
+    Args:
+        store_dir (str): The directory of the local AORC store, from `extract_aorc_region`.
+        start_year (int): The first year of the cube.
+        end_year (int): The last year of the cube.
+        time_chunk (int): Hours in each chunk of the cube.
+
+    Returns
+    -------
+        str: The path of the cube.
+    """
+    path = cumulative_cube_path(store_dir)
+    attrs = _cube_attrs(path)
+    if attrs is not None and attrs["years"][0] != start_year:
+        raise ValueError(f"The cumulative cube at {path} starts in {attrs['years'][0]}, not {start_year}")
+    years = [] if attrs is None else attrs["years"]
+    for year in range(start_year, end_year + 1):
+        if year in years:
+            logging.info("AORC %d already in the cumulative cube %s", year, path)
+            continue
+        if years and year != years[-1] + 1:
+            raise ValueError(f"Cannot append {year} to the cumulative cube at {path}, which ends in {years[-1]}")
+        year_path = local_year_path(store_dir, year)
+        precip = aorc_registry().dataset(year_path)[AORC_PRECIP_VARIABLE]
+        with open(os.path.join(year_path, ".zattrs"), encoding="utf-8") as f:
+            bounds = json.load(f)[AORC_STORE_ATTR]["bounds"]
+
+        hours = 0
+        if years:
+            hours = attrs["hours"]
+            _truncate(path, hours)
+            cube = xr.open_zarr(path)
+            time_chunk = cube[CUMULATIVE_PRECIP_VARIABLE].encoding["chunks"][0]
+            last = cube.isel(time=-1)
+            carry_sum = last[CUMULATIVE_PRECIP_VARIABLE].compute()
+            carry_count = last[CUMULATIVE_COUNT_VARIABLE].compute()
+        else:
+            carry_sum = xr.zeros_like(precip.isel(time=0), dtype=np.float64)
+            carry_count = xr.zeros_like(precip.isel(time=0), dtype=np.int32)
+
+        finite = precip.notnull()
+        year_cube = xr.Dataset(
+            {
+                CUMULATIVE_PRECIP_VARIABLE: precip.fillna(0).astype(np.float64).cumsum("time") + carry_sum.data,
+                CUMULATIVE_COUNT_VARIABLE: finite.astype(np.int32).cumsum("time") + carry_count.data,
+            }
+        )
+        if not years:
+            # start from zero the hour before the first hour, so windows may start at the start of the cube
+            first_time = pd.Timestamp(precip["time"].values[0]) - pd.Timedelta(hours=1)
+            start = xr.Dataset(
+                {
+                    CUMULATIVE_PRECIP_VARIABLE: carry_sum.expand_dims(time=[first_time]),
+                    CUMULATIVE_COUNT_VARIABLE: carry_count.expand_dims(time=[first_time]),
+                }
+            )
+            year_cube = xr.concat([start, year_cube], dim="time")
+        year_cube = year_cube.drop_vars([name for name in year_cube.coords if name not in year_cube.dims])
+        year_cube = year_cube.chunk({"time": _aligned_chunks(hours, year_cube.sizes["time"], time_chunk)})
+        for name in year_cube.variables:
+            year_cube[name].encoding = {}
+        logging.info("Appending AORC %d to the cumulative cube %s", year, path)
+        if years:
+            year_cube.to_zarr(path, append_dim="time", consolidated=True)
+        else:
+            year_cube.to_zarr(path, mode="w", consolidated=True)
+        years = years + [year]
+        attrs = {
+            "bounds": bounds,
+            "years": years,
+            "hours": hours + year_cube.sizes["time"],
+            "crs": str(precip.rio.crs or "EPSG:4326"),
+        }
+        zarr.open_group(path, mode="r+").attrs[CUMULATIVE_CUBE_ATTR] = attrs
+        zarr.consolidate_metadata(path)
+    return path
+
+
+def _aligned_chunks(offset: int, length: int, chunk: int) -> tuple[int, ...]:
+    """Split hours appended after `offset` hours into chunks ending on the chunk boundaries of the store."""
+    first = min((-offset) % chunk or chunk, length)
+    rest = length - first
+    return (first,) + (chunk,) * (rest // chunk) + ((rest % chunk,) if rest % chunk else ())
+
+
+def _truncate(path: str, hours: int) -> None:
+    """Drop hours beyond those recorded in a cube, left by an append that was interrupted."""
+    group = zarr.open_group(path, mode="r+")
+    truncated = False
+    for name, array in group.arrays():
+        if array.attrs.get("_ARRAY_DIMENSIONS", [None])[0] == "time" and array.shape[0] > hours:
+            logging.warning("Truncating %s of the cumulative cube %s to %d hours", name, path, hours)
+            array.resize((hours, *array.shape[1:]))
+            truncated = True
+    if truncated:
+        zarr.consolidate_metadata(path)
+
+
+class CumulativeCube:
+    """
+    A cumulative precipitation cube, from which the accumulation of any window of hours is two reads and a subtraction.
+
+    Attributes
+    ----------
+        path (str): The path of the cube.
+        dataset (xr.Dataset): The lazily opened cube.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the CumulativeCube class.
+
+        Args:
+            path (str): The path of a cube built by `build_cumulative_cube`.
+        """
+        self.path = path
+        self.dataset = xr.open_zarr(path)
+        self._attrs = self.dataset.attrs[CUMULATIVE_CUBE_ATTR]
+        self._times = self.dataset.indexes["time"]
+
+    @classmethod
+    def from_store(cls, store_dir: str) -> "CumulativeCube | None":
+        """
+        Open the cumulative cube of a local AORC store.
+
+        Each cube is opened once per process and shared by the storms read from it, and opened again once years are
+        appended to it.
+
+        Args:
+            store_dir (str): The directory of the local AORC store.
+
+        Returns
+        -------
+            CumulativeCube | None: The cube, or None if the store has no cube.
+        """
+        if not store_dir:
+            return None
+        path = cumulative_cube_path(store_dir)
+        attrs = _cube_attrs(path)
+        if attrs is None:
+            return None
+        with _cubes_lock:
+            cached = _cubes.get(path)
+        if cached is not None and cached[0] == attrs:
+            return cached[1]
+        cube = cls(path)
+        with _cubes_lock:
+            _cubes[path] = (attrs, cube)
+        return cube
+
+    def covers(self, start_datetimes: list[datetime.datetime], duration: datetime.timedelta, geom: Polygon) -> bool:
+        """
+        Check whether the cube covers windows of a duration following start times, within a region.
+
+        Args:
+            start_datetimes (list[datetime.datetime]): The start times of the windows.
+            duration (datetime.timedelta): The duration of the windows.
+            geom (Polygon): The region of the windows.
+
+        Returns
+        -------
+            bool: Whether the start and end of every window are hours of the cube and the region is within its bounds.
+        """
+        min_x, min_y, max_x, max_y = self._attrs["bounds"]
+        bounds = geom.bounds
+        if not (min_x <= bounds[0] and min_y <= bounds[1] and max_x >= bounds[2] and max_y >= bounds[3]):
+            return False
+        starts = pd.DatetimeIndex(start_datetimes)
+        return bool(starts.isin(self._times).all() and (starts + duration).isin(self._times).all())
+
+    def window_sums(
+        self, start_datetimes: list[datetime.datetime], duration: datetime.timedelta, geom: Polygon
+    ) -> xr.DataArray:
+        """
+        Sum precipitation over the duration following each start time, as `sum(skipna=True, min_count=1)` would.
+
+        Args:
+            start_datetimes (list[datetime.datetime]): The start times of the windows.
+            duration (datetime.timedelta): The duration of the windows.
+            geom (Polygon): The region of the windows. Cells are selected within its bounds.
+
+        Returns
+        -------
+            xr.DataArray: A lazy (time, y, x) stack of the sums, indexed by start time. Cells without a finite hour in
+            a window are NaN.
+        """
+        bounds = geom.bounds
+        region = self.dataset.sel({AORC_X_VAR: slice(bounds[0], bounds[2]), AORC_Y_VAR: slice(bounds[1], bounds[3])})
+        starts = pd.DatetimeIndex(start_datetimes)
+        before = region.sel(time=starts)
+        after = region.sel(time=starts + duration)
+        sums = after[CUMULATIVE_PRECIP_VARIABLE].data - before[CUMULATIVE_PRECIP_VARIABLE].data
+        counts = after[CUMULATIVE_COUNT_VARIABLE].data - before[CUMULATIVE_COUNT_VARIABLE].data
+        stack = xr.DataArray(
+            sums,
+            dims=("time", AORC_Y_VAR, AORC_X_VAR),
+            coords={"time": starts, AORC_Y_VAR: region[AORC_Y_VAR], AORC_X_VAR: region[AORC_X_VAR]},
+            name=AORC_PRECIP_VARIABLE,
+        )
+        return stack.where(counts > 0).rio.write_crs(self._attrs["crs"])
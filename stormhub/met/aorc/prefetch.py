@@ -0,0 +1,135 @@
+"""Planning and prefetching of the AORC Zarr chunks read by a batch of storm windows."""
+
+import datetime
+import json
+import logging
+
+import numpy as np
+import xarray as xr
+from fsspec import get_mapper
+from shapely import Polygon
+
+from stormhub.met.aorc.cache import AORC_CHUNK_CACHE_BYTES, AORC_PREFETCH_CONCURRENCY, AORCChunkCache
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import aorc_source, resolve_aorc_store
+from stormhub.met.aorc.store import local_aorc_paths
+from stormhub.met.consts import AORC_PRECIP_VARIABLE, AORC_X_VAR, AORC_Y_VAR
+
+
+def _within(values: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Get the positions of coordinate values within bounds."""
+    return np.flatnonzero((values >= low) & (values <= high))
+
+
+def _chunk_range(positions: np.ndarray, chunk: int) -> range:
+    """Get the chunk indices spanned by sorted positions along a dimension."""
+    return range(int(positions[0]) // chunk, int(positions[-1]) // chunk + 1)
+
+
+def _variable_chunk_keys(
+    store, ds: xr.Dataset, variable: str, time_positions: set[int], y_positions: np.ndarray, x_positions: np.ndarray
+) -> set[str]:
+    """Build the keys of the chunks of one variable holding the positions, from its Zarr array metadata."""
+    zarray = json.loads(store[f"{variable}/.zarray"])
+    chunks = dict(zip(ds[variable].dims, zarray["chunks"]))
+    separator = zarray.get("dimension_separator") or "."
+    ranges = {
+        "time": sorted({position // chunks["time"] for position in time_positions}),
+        AORC_Y_VAR: _chunk_range(y_positions, chunks[AORC_Y_VAR]),
+        AORC_X_VAR: _chunk_range(x_positions, chunks[AORC_X_VAR]),
+    }
+    keys = [[]]
+    for dim in ds[variable].dims:
+        keys = [key + [index] for key in keys for index in ranges[dim]]
+    return {f"{variable}/{separator.join(str(index) for index in key)}" for key in keys}
+
+
+def plan_chunk_fetch(
+    windows: list[tuple[datetime.datetime, datetime.timedelta]],
+    transposition_geom: Polygon,
+    variables: list[str] = None,
+    store_dir: str = None,
+) -> dict[str, list[str]]:
+    """
+    Find the chunks of the yearly AORC stores read by a batch of storm windows, without reading any chunk.
+
+    Each window covers the hours after its start up to its end, as `open_aorc_region` reads them, and the cells with
+    centres within the bounds of the region. Chunks shared by windows are listed once. Windows covered by the local
+    AORC store in `store_dir` need no fetch and are left out.
+
+    Args:
+        windows (list[tuple[datetime.datetime, datetime.timedelta]]): The start and duration of each window.
+        transposition_geom (Polygon): The region read.
+        variables (list[str], optional): The variables read. Defaults to precipitation.
+        store_dir (str, optional): Directory of a local AORC store.
+
+    Returns
+    -------
+        dict[str, list[str]]: The sorted chunk keys of each yearly store path of the AORC source.
+    """
+    variables = variables or [AORC_PRECIP_VARIABLE]
+    min_x, min_y, max_x, max_y = transposition_geom.bounds
+    hours: dict[str, set[int]] = {}
+    datasets = {}
+    for start, duration in windows:
+        end = start + duration
+        if local_aorc_paths(store_dir, start, end, transposition_geom, variables):
+            continue
+        for path in aorc_source().year_paths(start, end):
+            if path not in datasets:
+                datasets[path] = aorc_registry().dataset(path)
+            times = datasets[path].indexes["time"]
+            positions = times.slice_indexer(start + datetime.timedelta(hours=1), end)
+            hours.setdefault(path, set()).update(range(positions.start, positions.stop))
+
+    plan = {}
+    for path, time_positions in hours.items():
+        if not time_positions:
+            continue
+        ds = datasets[path]
+        y_positions = _within(ds[AORC_Y_VAR].to_numpy(), min_y, max_y)
+        x_positions = _within(ds[AORC_X_VAR].to_numpy(), min_x, max_x)
+        if y_positions.size == 0 or x_positions.size == 0:
+            continue
+        store, _ = resolve_aorc_store(path)
+        if isinstance(store, str):
+            store = get_mapper(store)
+        keys = set()
+        for variable in variables:
+            keys |= _variable_chunk_keys(store, ds, variable, time_positions, y_positions, x_positions)
+        plan[path] = sorted(keys)
+    return plan
+
+
+def prefetch_chunks(
+    plan: dict[str, list[str]],
+    cache_dir: str,
+    cache_bytes: int = AORC_CHUNK_CACHE_BYTES,
+    max_concurrency: int = AORC_PREFETCH_CONCURRENCY,
+) -> int:
+    """
+    Fetch the planned chunks of remote stores into the on-disk chunk cache, before any computation reads them.
+
+    Stores the cache would not keep, such as local mirrors, are skipped. The cache is named as the dataset registry
+    names it, so the registry reads the prefetched chunks as hits.
+
+    Args:
+        plan (dict[str, list[str]]): The chunk keys of each store path, from `plan_chunk_fetch`.
+        cache_dir (str): The directory of the chunk cache.
+        cache_bytes (int): The size cap of the chunk cache.
+        max_concurrency (int): The greatest number of chunks fetched at once from each store.
+
+    Returns
+    -------
+        int: The number of chunks fetched.
+    """
+    fetched = 0
+    for path, keys in plan.items():
+        store, cacheable = resolve_aorc_store(path)
+        if not cacheable:
+            continue
+        cache = AORCChunkCache(store, cache_dir, cache_bytes, name=path)
+        count = cache.prefetch(keys, max_concurrency)
+        logging.info("Prefetched %d of %d AORC chunks of %s", count, len(keys), path)
+        fetched += count
+    return fetched
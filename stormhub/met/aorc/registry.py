@@ -0,0 +1,208 @@
+"""Process-wide registry of opened AORC year datasets."""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import xarray as xr
+
+from stormhub.met.aorc.cache import AORC_CHUNK_CACHE_BYTES, AORCChunkCache
+from stormhub.met.aorc.source import resolve_aorc_store
+
+AORC_REGISTRY_SIZE = 64
+"""Number of opened AORC year datasets kept by the registry of each process, enough for the period of record"""
+
+
+class AORCDatasetRegistry:
+    """
+    A thread-safe, least recently used registry of lazily opened AORC year datasets.
+
+    Opening a yearly AORC Zarr store reads its consolidated metadata, which costs several round trips to S3. The
+    registry opens each store once and shares the lazy dataset between every storm of a process, so only the chunks
+    of data read by each storm are fetched. The least recently used datasets are forgotten once more than
+    `max_datasets` are open, without closing them, as other threads may still be reading them; each is closed once
+    no longer referenced. Paths are resolved to stores by the AORC source of the process. With a `cache_dir`, the
+    chunks of remote stores of past years are kept in an on-disk `AORCChunkCache`, so they are downloaded once across
+    runs.
+
+    Attributes
+    ----------
+        max_datasets (int): The greatest number of datasets kept open.
+        cache_dir (str | None): The directory of the chunk cache, or None to read S3 directly.
+        cache_bytes (int): The size cap of the chunk cache.
+    """
+
+    def __init__(
+        self, max_datasets: int = AORC_REGISTRY_SIZE, cache_dir: str = None, cache_bytes: int = AORC_CHUNK_CACHE_BYTES
+    ) -> None:
+        """
+        Initialize the AORCDatasetRegistry class.
+
+        Args:
+            max_datasets (int): The greatest number of datasets kept open.
+            cache_dir (str, optional): The directory of the chunk cache, or None to read S3 directly.
+            cache_bytes (int): The size cap of the chunk cache.
+        """
+        if max_datasets < 1:
+            raise ValueError(f"max_datasets must be at least 1, not {max_datasets}")
+        self.max_datasets = max_datasets
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_bytes
+        self._caches: list[AORCChunkCache] = []
+        self._datasets: OrderedDict[str, xr.Dataset] = OrderedDict()
+        self._opening: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Count the open datasets."""
+        return len(self._datasets)
+
+    def __contains__(self, path: str) -> bool:
+        """Check whether the dataset of a path is open."""
+        return path in self._datasets
+
+    def _open(self, path: str) -> xr.Dataset:
+        """Open one yearly Zarr store of the AORC source, or a local store."""
+        store, cacheable = resolve_aorc_store(path)
+        if self.cache_dir and cacheable:
+            store = AORCChunkCache(store, self.cache_dir, self.cache_bytes, name=path)
+            self._caches.append(store)
+        path = store
+        # decode grid mappings as coordinates, so the CRS of stores written by xarray is found by rioxarray
+        return xr.open_dataset(path, engine="zarr", chunks="auto", consolidated=True, decode_coords="all")
+
+    def _cached(self, path: str) -> xr.Dataset | None:
+        """Get an open dataset and mark it most recently used. Must be called holding the lock."""
+        ds = self._datasets.get(path)
+        if ds is not None:
+            self._datasets.move_to_end(path)
+        return ds
+
+    def dataset(self, path: str) -> xr.Dataset:
+        """
+        Get the lazily opened dataset of a yearly AORC Zarr store, opening it on first use.
+
+        Threads asking for the same store wait for one open, while stores of other years open concurrently.
+
+        Args:
+            path (str): The path of the yearly Zarr store, e.g. from `aorc_year_paths`.
+
+        Returns
+        -------
+            xr.Dataset: The lazily opened dataset.
+        """
+        with self._lock:
+            ds = self._cached(path)
+            if ds is not None:
+                return ds
+            path_lock = self._opening.setdefault(path, threading.Lock())
+        with path_lock:
+            with self._lock:
+                ds = self._cached(path)
+            if ds is not None:
+                return ds
+            logging.debug("Opening AORC dataset %s", path)
+            ds = self._open(path)
+            with self._lock:
+                self._datasets[path] = ds
+                self._opening.pop(path, None)
+                while len(self._datasets) > self.max_datasets:
+                    evicted_path, _ = self._datasets.popitem(last=False)
+                    logging.debug("Evicting AORC dataset %s", evicted_path)
+        return ds
+
+    def open(self, paths: list[str]) -> xr.Dataset:
+        """
+        Get the datasets of consecutive yearly AORC Zarr stores as one dataset along time.
+
+        Args:
+            paths (list[str]): The paths of the yearly Zarr stores, in time order.
+
+        Returns
+        -------
+            xr.Dataset: The lazily opened dataset.
+        """
+        datasets = [self.dataset(path) for path in paths]
+        if len(datasets) == 1:
+            return datasets[0]
+        return xr.concat(datasets, dim="time", data_vars="minimal", coords="minimal", compat="override")
+
+    def warm(self, paths: list[str]) -> None:
+        """
+        Open the datasets of yearly AORC Zarr stores ahead of use.
+
+        Args:
+            paths (list[str]): The paths of the yearly Zarr stores.
+        """
+        for path in paths:
+            try:
+                self.dataset(path)
+            except Exception as e:
+                logging.error("Error opening AORC dataset %s: %s", path, e)
+
+    def clear(self) -> None:
+        """Close and forget every open dataset."""
+        with self._lock:
+            for ds in self._datasets.values():
+                ds.close()
+            self._datasets.clear()
+            self._caches.clear()
+
+    def configure_cache(self, cache_dir: str | None, cache_bytes: int = AORC_CHUNK_CACHE_BYTES) -> None:
+        """
+        Set the chunk cache of datasets opened from now on, closing open datasets if the cache changes.
+
+        Args:
+            cache_dir (str | None): The directory of the chunk cache, or None to read S3 directly.
+            cache_bytes (int): The size cap of the chunk cache.
+        """
+        if (cache_dir, cache_bytes) == (self.cache_dir, self.cache_bytes):
+            return
+        self.clear()
+        self.cache_dir = cache_dir
+        self.cache_bytes = cache_bytes
+
+    def log_cache_stats(self) -> None:
+        """Log the chunk cache hits and misses of the open datasets."""
+        for cache in self._caches:
+            cache.log_stats()
+
+
+_registry: AORCDatasetRegistry | None = None
+_registry_pid: int | None = None
+_registry_lock = threading.Lock()
+
+
+def aorc_registry() -> AORCDatasetRegistry:
+    """
+    Get the AORC dataset registry of the current process.
+
+    A process forked from one with a registry gets a registry of its own, rather than sharing the S3 connections of
+    its parent.
+
+    Returns
+    -------
+        AORCDatasetRegistry: The registry of the current process.
+    """
+    global _registry, _registry_pid
+    with _registry_lock:
+        if _registry is None or _registry_pid != os.getpid():
+            _registry = AORCDatasetRegistry()
+            _registry_pid = os.getpid()
+        return _registry
+
+
+def warm_aorc_registry(paths: list[str], cache_dir: str = None, cache_bytes: int = AORC_CHUNK_CACHE_BYTES) -> None:
+    """
+    Open yearly AORC datasets in the registry of the current process, e.g. as the initializer of worker processes.
+
+    Args:
+        paths (list[str]): The paths of the yearly Zarr stores.
+        cache_dir (str, optional): The directory of the chunk cache, shared by the processes, or None to read S3
+            directly.
+        cache_bytes (int): The size cap of the chunk cache.
+    """
+    registry = aorc_registry()
+    registry.configure_cache(cache_dir, cache_bytes)
+    registry.warm(paths)
@@ -0,0 +1,249 @@
+"""Sources of the yearly AORC Zarr stores: the NOAA S3 bucket, a local mirror, or memory."""
+
+import datetime
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+
+import s3fs
+import xarray as xr
+from zarr.storage import MemoryStore
+
+from stormhub.met.consts import NOAA_AORC_S3_BASE_URL
+
+AORC_SOURCE_ENV_VAR = "STORMHUB_AORC_SOURCE"
+"""Environment variable holding the S3 URL or local directory of the AORC source, inherited by worker processes"""
+
+
+class AORCSource(ABC):
+    """
+    A source of yearly AORC Zarr stores, resolving a year to a path and a path to a store xarray can open.
+
+    Paths are strings, so they can be passed to worker processes and used as keys of the dataset registry.
+    """
+
+    @abstractmethod
+    def year_path(self, year: int) -> str:
+        """Build the path of the store of one year."""
+
+    @abstractmethod
+    def store(self, path: str) -> MutableMapping | str:
+        """Resolve a path of this source to a Zarr store or a local path."""
+
+    def year_paths(self, start_datetime: datetime.datetime, end_datetime: datetime.datetime) -> list[str]:
+        """
+        Build the paths of the stores of every year from a start to an end time.
+
+        Args:
+            start_datetime (datetime.datetime): The start time.
+            end_datetime (datetime.datetime): The end time.
+
+        Returns
+        -------
+            list[str]: The paths, in time order.
+        """
+        return [self.year_path(year) for year in range(start_datetime.year, end_datetime.year + 1)]
+
+    def owns(self, path: str) -> bool:
+        """Check whether a path is one of this source."""
+        return path.startswith(self.year_path(0).rsplit("/", 1)[0] + "/")
+
+    def cacheable(self, path: str) -> bool:
+        """Check whether the chunks of a path are worth keeping in an on-disk cache, i.e. are remote and final."""
+        return False
+
+
+class S3AORCSource(AORCSource):
+    """
+    The yearly AORC Zarr stores of an S3 bucket, read anonymously.
+
+    Attributes
+    ----------
+        base_url (str): The S3 URL of the directory of the yearly stores.
+    """
+
+    def __init__(self, base_url: str = NOAA_AORC_S3_BASE_URL) -> None:
+        """
+        Initialize the S3AORCSource class.
+
+        Args:
+            base_url (str): The S3 URL of the directory of the yearly stores.
+        """
+        if not base_url.startswith("s3://"):
+            raise ValueError(f"Expected an s3:// URL, got {base_url}")
+        self.base_url = base_url.rstrip("/")
+        self._s3 = None
+        self._s3_pid = None
+
+    def year_path(self, year: int) -> str:
+        """Build the S3 URL of the store of one year."""
+        return f"{self.base_url}/{year}.zarr"
+
+    def store(self, path: str) -> MutableMapping:
+        """Map an S3 URL of this source, with a file system of the current process."""
+        if self._s3 is None or self._s3_pid != os.getpid():
+            self._s3 = s3fs.S3FileSystem(anon=True)
+            self._s3_pid = os.getpid()
+        return s3fs.S3Map(root=path, s3=self._s3, check=False)
+
+    def cacheable(self, path: str) -> bool:
+        """Check whether a store is of a past year, as the store of the current year is still appended to."""
+        return not path.rstrip("/").endswith(f"{datetime.date.today().year}.zarr")
+
+
+class LocalAORCSource(AORCSource):
+    """
+    A local directory mirroring the yearly AORC Zarr stores of the bucket, e.g. synced nightly for offline compute.
+
+    Attributes
+    ----------
+        directory (str): The directory of the yearly stores, named `<year>.zarr` as in the bucket.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Initialize the LocalAORCSource class.
+
+        Args:
+            directory (str): The directory of the yearly stores.
+        """
+        self.directory = os.path.abspath(directory)
+
+    def year_path(self, year: int) -> str:
+        """Build the path of the store of one year."""
+        return os.path.join(self.directory, f"{year}.zarr")
+
+    def owns(self, path: str) -> bool:
+        """Check whether a path is in the mirror directory."""
+        return os.path.dirname(os.path.abspath(path)) == self.directory
+
+    def store(self, path: str) -> str:
+        """Check that a year was mirrored, returning its path."""
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"AORC store {path} is missing from the local mirror {self.directory}")
+        return path
+
+
+class MemoryAORCSource(AORCSource):
+    """
+    Yearly AORC datasets held in memory as Zarr stores, for tests and benchmarks without a network or disk.
+
+    Datasets are only visible to the process that added them, and to processes forked after.
+
+    Attributes
+    ----------
+        name (str): The name of the source, distinguishing its paths from those of other memory sources.
+    """
+
+    def __init__(self, datasets: dict[int, xr.Dataset] = None, name: str = "aorc") -> None:
+        """
+        Initialize the MemoryAORCSource class.
+
+        Args:
+            datasets (dict[int, xr.Dataset], optional): Datasets of years to add.
+            name (str): The name of the source.
+        """
+        self.name = name
+        self._stores: dict[str, MemoryStore] = {}
+        self._lock = threading.Lock()
+        for year, ds in (datasets or {}).items():
+            self.add(year, ds)
+
+    def year_path(self, year: int) -> str:
+        """Build the memory path of the store of one year."""
+        return f"memory://{self.name}/{year}.zarr"
+
+    def add(self, year: int, ds: xr.Dataset) -> str:
+        """
+        Write the dataset of a year to a Zarr store in memory.
+
+        Args:
+            year (int): The year.
+            ds (xr.Dataset): The dataset, with time, latitude and longitude dimensions like the bucket.
+
+        Returns
+        -------
+            str: The memory path of the year.
+        """
+        path = self.year_path(year)
+        store = MemoryStore()
+        ds.to_zarr(store, mode="w", consolidated=True)
+        with self._lock:
+            self._stores[path] = store
+        return path
+
+    def store(self, path: str) -> MemoryStore:
+        """Get the memory store of a path."""
+        with self._lock:
+            if path not in self._stores:
+                raise FileNotFoundError(f"AORC store {path} was not added to the memory source {self.name}")
+            return self._stores[path]
+
+
+def aorc_source_from_url(url: str) -> AORCSource:
+    """
+    Create the source of an S3 URL or local directory.
+
+    Args:
+        url (str): An s3:// URL or the path of a local mirror directory.
+
+    Returns
+    -------
+        AORCSource: The source.
+    """
+    if url.startswith("s3://"):
+        return S3AORCSource(url)
+    return LocalAORCSource(url)
+
+
+_source: AORCSource | None = None
+_source_lock = threading.Lock()
+
+
+def aorc_source() -> AORCSource:
+    """
+    Get the AORC source of the process, by default the NOAA bucket or the location in `STORMHUB_AORC_SOURCE`.
+
+    Returns
+    -------
+        AORCSource: The source.
+    """
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = aorc_source_from_url(os.environ.get(AORC_SOURCE_ENV_VAR, NOAA_AORC_S3_BASE_URL))
+        return _source
+
+
+def set_aorc_source(source: AORCSource | str | None) -> None:
+    """
+    Set the AORC source of the process, inherited by worker processes forked after.
+
+    Args:
+        source (AORCSource | str | None): The source, an S3 URL or local directory, or None to restore the default.
+    """
+    global _source
+    if isinstance(source, str):
+        source = aorc_source_from_url(source)
+    with _source_lock:
+        _source = source
+
+
+def resolve_aorc_store(path: str) -> tuple[MutableMapping | str, bool]:
+    """
+    Resolve a path of the process's AORC source, an S3 URL or a local path to a store xarray can open.
+
+    Args:
+        path (str): The path.
+
+    Returns
+    -------
+        tuple[MutableMapping | str, bool]: The store, and whether its chunks are worth caching on disk.
+    """
+    source = aorc_source()
+    if not source.owns(path):
+        if not path.startswith("s3://"):
+            return path, False
+        source = S3AORCSource(path.rsplit("/", 1)[0])
+    return source.store(path), source.cacheable(path)
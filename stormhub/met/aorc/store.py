@@ -0,0 +1,166 @@
+"""Extraction of a region of the AORC dataset into a local, time-chunked Zarr store."""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+
+import numcodecs
+import xarray as xr
+from shapely import Polygon
+
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import AORCSource, aorc_source
+from stormhub.met.consts import AORC_PRECIP_VARIABLE
+
+AORC_STORE_TIME_CHUNK = 24 * 90
+"""Hours in each chunk of a local AORC store, so storm windows read few chunks"""
+AORC_STORE_SPACE_CHUNK = 32
+"""Cells along latitude and longitude in each chunk of a local AORC store"""
+AORC_STORE_ATTR = "stormhub:extract"
+"""Zarr attribute recording the extracted bounds and variables of a completed year"""
+
+
+def local_year_path(store_dir: str, year: int) -> str:
+    """Build the path of the local Zarr store of one year."""
+    return os.path.join(store_dir, f"{year}.zarr")
+
+
+def _default_compressor() -> numcodecs.abc.Codec:
+    """Compress precipitation with zstd and bit shuffling, which suits the many zeros and NaNs of the grids."""
+    return numcodecs.Blosc(cname="zstd", clevel=5, shuffle=numcodecs.Blosc.BITSHUFFLE)
+
+
+def _open_source_year(source: AORCSource, year: int) -> xr.Dataset:
+    """Open the store of one year of a source, through the dataset registry if it is the source of the process."""
+    path = source.year_path(year)
+    if source is aorc_source():
+        return aorc_registry().dataset(path)
+    return xr.open_dataset(source.store(path), engine="zarr", chunks="auto", consolidated=True, decode_coords="all")
+
+
+def _extract_attrs(path: str) -> dict | None:
+    """Read the extraction record of a local year store, or None if the year was not completely extracted."""
+    try:
+        with open(os.path.join(path, ".zattrs"), encoding="utf-8") as f:
+            return json.load(f).get(AORC_STORE_ATTR)
+    except (OSError, ValueError):
+        return None
+
+
+def _covers(attrs: dict | None, bounds: tuple[float, float, float, float], variables: list[str]) -> bool:
+    """Check whether an extraction record covers bounds and variables."""
+    if attrs is None:
+        return False
+    min_x, min_y, max_x, max_y = attrs["bounds"]
+    return (
+        min_x <= bounds[0]
+        and min_y <= bounds[1]
+        and max_x >= bounds[2]
+        and max_y >= bounds[3]
+        and set(variables) <= set(attrs["variables"])
+    )
+
+
+def local_aorc_paths(
+    store_dir: str,
+    start_datetime: datetime.datetime,
+    end_datetime: datetime.datetime,
+    transposition_geom: Polygon,
+    variables: list[str] = None,
+) -> list[str] | None:
+    """
+    Get the local year stores covering a request, if the local store covers all of it.
+
+    Args:
+        store_dir (str): The directory of the local AORC store.
+        start_datetime (datetime.datetime): The start of the request.
+        end_datetime (datetime.datetime): The end of the request.
+        transposition_geom (Polygon): The region of the request.
+        variables (list[str], optional): The variables of the request. Defaults to precipitation.
+
+    Returns
+    -------
+        list[str] | None: The paths of the local year stores, or None if any year, area or variable of the request
+        was not extracted.
+    """
+    if not store_dir:
+        return None
+    variables = variables or [AORC_PRECIP_VARIABLE]
+    paths = [local_year_path(store_dir, year) for year in range(start_datetime.year, end_datetime.year + 1)]
+    if all(_covers(_extract_attrs(path), transposition_geom.bounds, variables) for path in paths):
+        return paths
+    return None
+
+
+def extract_aorc_region(
+    store_dir: str,
+    transposition_geom: Polygon,
+    start_year: int,
+    end_year: int,
+    variables: list[str] = None,
+    time_chunk: int = AORC_STORE_TIME_CHUNK,
+    space_chunk: int = AORC_STORE_SPACE_CHUNK,
+    compressor: numcodecs.abc.Codec = None,
+    overwrite: bool = False,
+    source: AORCSource = None,
+) -> list[str]:
+    """
+    Copy the AORC data of a region into a local Zarr store per year, for storm searches to read instead of S3.
+
+    Each year is written to a temporary store which is renamed once complete, so an interrupted extraction resumes
+    from the first year that was not completed. Years already extracted for the region and variables are skipped.
+
+    Args:
+        store_dir (str): The directory of the local AORC store.
+        transposition_geom (Polygon): The region to extract. Its bounding box is extracted.
+        start_year (int): The first year to extract.
+        end_year (int): The last year to extract.
+        variables (list[str], optional): The variables to extract. Defaults to precipitation.
+        time_chunk (int): Hours in each chunk.
+        space_chunk (int): Cells along latitude and longitude in each chunk.
+        compressor (numcodecs.abc.Codec, optional): The compressor of the variables. Defaults to zstd with bit
+            shuffling.
+        overwrite (bool): Whether to extract years that were already extracted.
+        source (AORCSource, optional): The source of the yearly AORC Zarr stores extracted from. Defaults to the AORC
+            source of the process.
+
+    Returns
+    -------
+        list[str]: The paths of the local year stores.
+    """
+    variables = variables or [AORC_PRECIP_VARIABLE]
+    compressor = compressor or _default_compressor()
+    source = source or aorc_source()
+    bounds = transposition_geom.bounds
+    os.makedirs(store_dir, exist_ok=True)
+    paths = []
+    for year in range(start_year, end_year + 1):
+        path = local_year_path(store_dir, year)
+        paths.append(path)
+        if not overwrite and _covers(_extract_attrs(path), bounds, variables):
+            logging.info("AORC %d already extracted to %s", year, path)
+            continue
+
+        logging.info("Extracting AORC %d to %s", year, path)
+        ds = _open_source_year(source, year)
+        crs = ds.rio.crs or "EPSG:4326"
+        subset = ds[variables].sel(longitude=slice(bounds[0], bounds[2]), latitude=slice(bounds[1], bounds[3]))
+        subset = subset.chunk({"time": time_chunk, "latitude": space_chunk, "longitude": space_chunk})
+        for name in subset.variables:
+            subset[name].encoding = {}
+        subset = subset.rio.write_crs(crs)
+        subset.attrs = {AORC_STORE_ATTR: {"bounds": list(bounds), "variables": list(variables)}}
+
+        partial_path = f"{path}.partial"
+        shutil.rmtree(partial_path, ignore_errors=True)
+        subset.to_zarr(
+            partial_path,
+            mode="w",
+            consolidated=True,
+            encoding={name: {"compressor": compressor} for name in variables},
+        )
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(partial_path, path)
+    return paths
@@ -0,0 +1,81 @@
+"""Testing the AORC item and window reads."""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import xarray as xr
+
+from stormhub.met.aorc.aorc import AORCItem, open_aorc_region, read_aorc_window
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import MemoryAORCSource, set_aorc_source
+from stormhub.met.tests.transpose_test import (
+    create_test_aorc_stores,
+    create_test_transposition_domain_polygon,
+    create_test_watershed_polygon,
+)
+
+TEMPERATURE_VARIABLE = "TMP_2maboveground"
+
+
+class TestReadAORCWindow(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        datasets = {}
+        for year, path in zip([2000, 2001], create_test_aorc_stores(self.directory.name, [2000, 2001])):
+            ds = xr.open_zarr(path).load()
+            ds[TEMPERATURE_VARIABLE] = 270 + 10 * ds["APCP_surface"]
+            datasets[year] = ds
+        self.source = MemoryAORCSource(datasets)
+        set_aorc_source(self.source)
+        self.domain = create_test_transposition_domain_polygon()
+        self.start = datetime(2000, 1, 1, 12)
+        self.duration = timedelta(hours=24)
+        self.paths = self.source.year_paths(self.start, self.start + self.duration)
+
+    def tearDown(self):
+        set_aorc_source(None)
+        aorc_registry().clear()
+        self.directory.cleanup()
+
+    def test_window_matches_each_variable(self):
+        """
+        Test that the variables read together match each variable opened on its own.
+        """
+        end = self.start + self.duration
+        window = read_aorc_window(self.paths, self.start, end, self.domain, ["APCP_surface", TEMPERATURE_VARIABLE])
+        self.assertEqual(list(window.data_vars), ["APCP_surface", TEMPERATURE_VARIABLE])
+        self.assertEqual(window.sizes["time"], 24)
+        for name in window.data_vars:
+            self.assertIsNone(window[name].chunks)
+            xr.testing.assert_equal(window[name], open_aorc_region(self.paths, self.start, end, self.domain)[name])
+
+    def test_item_stats_use_window(self):
+        """
+        Test that an item with additional variables reads them with its precipitation, summing the same precipitation.
+        """
+        items = [
+            AORCItem(
+                "test",
+                self.start,
+                self.duration,
+                create_test_watershed_polygon(),
+                self.domain,
+                os.path.join(self.directory.name, "item"),
+                "watershed",
+                "domain",
+                variables=variables,
+            )
+            for variables in (None, [TEMPERATURE_VARIABLE])
+        ]
+        precipitation, window = items
+        self.assertIsNotNone(precipitation.aorc_source_data["APCP_surface"].chunks)
+        self.assertEqual(list(window.aorc_source_data.data_vars), ["APCP_surface", TEMPERATURE_VARIABLE])
+        self.assertIsNone(window.aorc_source_data[TEMPERATURE_VARIABLE].chunks)
+        xr.testing.assert_allclose(window.sum_aorc, precipitation.sum_aorc)
+        self.assertEqual(window.max_transpose()[2], precipitation.max_transpose()[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
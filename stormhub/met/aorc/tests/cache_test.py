@@ -0,0 +1,78 @@
+"""Testing the on-disk cache of the chunks of AORC Zarr stores."""
+
+import os
+import tempfile
+import unittest
+
+import fsspec
+import numpy as np
+import xarray as xr
+
+from stormhub.met.aorc.cache import AORCChunkCache
+from stormhub.met.tests.transpose_test import create_test_aorc_stores
+
+
+class TestAORCChunkCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, "cache")
+        (source_path,) = create_test_aorc_stores(self.directory.name, [2000], hours=96)
+        # a local store standing in for the bucket, chunked by day
+        source = xr.open_zarr(source_path).chunk({"time": 24})
+        for name in source.variables:
+            source[name].encoding = {}
+        self.path = os.path.join(self.directory.name, "bucket", "2000.zarr")
+        source.to_zarr(self.path, consolidated=True)
+        self.expected = source["APCP_surface"].to_numpy()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cached_precip(self, max_bytes: int = 2**30) -> tuple[AORCChunkCache, xr.DataArray]:
+        """Open the precipitation of the bucket through a chunk cache."""
+        store = AORCChunkCache(fsspec.get_mapper(self.path), self.cache_dir, max_bytes)
+        ds = xr.open_dataset(store, engine="zarr", chunks={}, consolidated=True)
+        return store, ds["APCP_surface"].reset_coords(drop=True)
+
+    def cache_size(self) -> int:
+        """Sum the size of the files of the cache directory."""
+        return sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(self.cache_dir) for name in names
+        )
+
+    def test_rerun_reads_cached_chunks(self):
+        """
+        Test that a re-run reads the same values from cached chunks without fetching them.
+        """
+        store, precip = self.cached_precip()
+        np.testing.assert_array_equal(precip.to_numpy(), self.expected)
+        self.assertGreater(store.misses, 0)
+
+        rerun, precip = self.cached_precip()
+        np.testing.assert_array_equal(precip.to_numpy(), self.expected)
+        self.assertEqual(rerun.misses, 0)
+        self.assertGreaterEqual(rerun.hits, store.misses)
+
+    def test_evicts_least_recently_used_chunks(self):
+        """
+        Test that the cache stays under its cap by removing the least recently used chunks.
+        """
+        store, precip = self.cached_precip()
+        precip.isel(time=slice(0, 48)).load()
+        day_bytes = self.cache_size() // 2
+        store, precip = self.cached_precip(max_bytes=int(2.5 * day_bytes))
+        precip.isel(time=slice(0, 24)).load()
+        precip.isel(time=slice(48, 96)).load()
+        self.assertLessEqual(self.cache_size(), store.max_bytes)
+
+        # the most recently used days are kept, while the second day, unused since the first run, is not
+        rerun, precip = self.cached_precip()
+        misses = rerun.misses
+        np.testing.assert_array_equal(precip.isel(time=slice(48, 96)).to_numpy(), self.expected[48:])
+        self.assertEqual(rerun.misses, misses)
+        precip.isel(time=slice(24, 48)).load()
+        self.assertEqual(rerun.misses, misses + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
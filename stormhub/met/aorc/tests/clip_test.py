@@ -0,0 +1,50 @@
+"""Testing the clipping of AORC grids to a region with a cached mask."""
+
+import tempfile
+import unittest
+
+import rioxarray
+import xarray as xr
+
+from stormhub.met.aorc.clip import clip_region, region_mask
+from stormhub.met.tests.transpose_test import (
+    create_test_aorc_stores,
+    create_test_transposition_domain_polygon,
+    create_test_watershed_polygon,
+)
+
+
+class TestClipRegion(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        (path,) = create_test_aorc_stores(self.directory.name, [2000])
+        self.ds = xr.open_zarr(path, decode_coords="all")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_rio_clip(self):
+        """
+        Test that clipping with the cached mask matches rio.clip of the data within the region's bounds.
+        """
+        for region in (create_test_watershed_polygon(), create_test_transposition_domain_polygon().buffer(-0.6)):
+            bounds = region.bounds
+            subsection = self.ds.sel(longitude=slice(bounds[0], bounds[2]), latitude=slice(bounds[1], bounds[3]))
+            expected = subsection.rio.clip([region], drop=True, all_touched=True)
+            clipped = clip_region(self.ds, region)
+            self.assertIsNotNone(clipped["APCP_surface"].chunks)
+            xr.testing.assert_allclose(clipped["APCP_surface"].compute(), expected["APCP_surface"].compute())
+            self.assertEqual(clipped.rio.transform(), expected.rio.transform())
+
+    def test_mask_is_cached_per_region_and_grid(self):
+        """
+        Test that a region is rasterized once per grid.
+        """
+        region = create_test_watershed_polygon()
+        mask = region_mask(self.ds, region)
+        self.assertIs(region_mask(self.ds.isel(time=slice(0, 5)), region), mask)
+        self.assertIsNot(region_mask(self.ds.isel(longitude=slice(1, None)), region), mask)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Testing the cumulative precipitation cube of a local AORC store."""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import zarr
+
+from stormhub.met.aorc.aorc import accumulation_stack, open_aorc_region, rolling_accumulations
+from stormhub.met.aorc.clip import clip_region
+from stormhub.met.aorc.cumulative import CumulativeCube, build_cumulative_cube
+from stormhub.met.aorc.source import LocalAORCSource
+from stormhub.met.aorc.store import extract_aorc_region
+from stormhub.met.tests.transpose_test import create_test_aorc_stores, create_test_transposition_domain_polygon
+
+
+class TestCumulativeCube(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.directory.name, "source")
+        self.store_dir = os.path.join(self.directory.name, "store")
+        os.makedirs(self.source_dir)
+        self.source_paths = create_test_aorc_stores(self.source_dir, [2000, 2001], hours=24 * 366)
+        self.domain = create_test_transposition_domain_polygon()
+        extract_aorc_region(self.store_dir, self.domain, 2000, 2001, source=LocalAORCSource(self.source_dir))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def expected_sums(self, starts: list[datetime], duration: timedelta) -> np.ndarray:
+        """Sum every hour of each window of the source data."""
+        sums = []
+        for start in starts:
+            source = open_aorc_region(self.source_paths, start, start + duration, self.domain)
+            sums.append(source["APCP_surface"].sum(dim="time", skipna=True, min_count=1).to_numpy())
+        return np.stack(sums)
+
+    def test_window_sums_match_hourly_sums(self):
+        """
+        Test windows of the cube, including one crossing a year, against sums of every hour.
+        """
+        build_cumulative_cube(self.store_dir, 2000, 2001, time_chunk=100)
+        starts = [datetime(2000, 1, 1, 0), datetime(2000, 6, 1, 6), datetime(2000, 12, 31, 12)]
+        duration = timedelta(hours=72)
+        stack = accumulation_stack(starts, duration, self.domain, store_dir=self.store_dir)
+        np.testing.assert_allclose(stack.to_numpy(), self.expected_sums(starts, duration))
+
+    def test_resumes_and_truncates_interrupted_years(self):
+        """
+        Test that a cube extended a year at a time, after an interrupted append, matches one built at once, and is
+        opened again once extended.
+        """
+        build_cumulative_cube(self.store_dir, 2000, 2000)
+        first = CumulativeCube.from_store(self.store_dir)
+        self.assertIs(CumulativeCube.from_store(self.store_dir), first)
+        self.assertFalse(first.covers([datetime(2000, 12, 31)], timedelta(hours=72), self.domain))
+        group = zarr.open_group(os.path.join(self.store_dir, "cumulative.zarr"), mode="r+")
+        hours = group["time"].shape[0]
+        for name in ("time", "cumulative_precip", "finite_count"):
+            group[name].resize((hours + 5, *group[name].shape[1:]))
+        build_cumulative_cube(self.store_dir, 2000, 2001)
+        cube = CumulativeCube.from_store(self.store_dir)
+        self.assertIsNot(cube, first)
+        self.assertTrue(cube.covers([datetime(2000, 12, 31)], timedelta(hours=72), self.domain))
+        self.assertTrue(cube.dataset.indexes["time"].is_unique)
+        starts = [datetime(2000, 12, 31)]
+        sums = clip_region(cube.window_sums(starts, timedelta(hours=72), self.domain), self.domain)
+        np.testing.assert_allclose(sums.to_numpy(), self.expected_sums(starts, timedelta(hours=72)))
+
+    def test_rolling_accumulations_match_hourly_sums(self):
+        """
+        Test streamed windows, including one crossing a year and one after a gap, against sums of every hour.
+        """
+        starts = [
+            datetime(2000, 3, 1, 0),
+            datetime(2000, 3, 1, 5),
+            datetime(2000, 3, 2, 0),
+            datetime(2000, 9, 1, 0),
+            datetime(2000, 12, 30, 12),
+        ]
+        duration = timedelta(hours=48)
+        streamed = list(rolling_accumulations(starts, duration, self.domain, store_dir=self.store_dir, read_hours=30))
+        self.assertEqual([start for start, _ in streamed], starts)
+        np.testing.assert_allclose(
+            np.stack([grid.to_numpy() for _, grid in streamed]), self.expected_sums(starts, duration)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Testing the AORC chunk-fetch planner."""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import fsspec
+import numpy as np
+import xarray as xr
+from shapely import box
+
+from stormhub.met.aorc.cache import AORCChunkCache
+from stormhub.met.aorc.prefetch import plan_chunk_fetch, prefetch_chunks
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import LocalAORCSource, set_aorc_source
+from stormhub.met.tests.transpose_test import create_test_aorc_stores
+
+
+class TestChunkFetchPlan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mirror_dir = os.path.join(self.directory.name, "mirror")
+        self.cache_dir = os.path.join(self.directory.name, "cache")
+        # a mirror chunked by day and by 4 cells, like the bucket is chunked by larger blocks
+        for path in create_test_aorc_stores(self.directory.name, [2000, 2001]):
+            ds = xr.open_zarr(path).chunk({"time": 24, "latitude": 4, "longitude": 4})
+            for name in ds.variables:
+                ds[name].encoding = {}
+            ds.to_zarr(os.path.join(self.mirror_dir, os.path.basename(path)), consolidated=True)
+        set_aorc_source(LocalAORCSource(self.mirror_dir))
+        self.region = box(1.2, 1.2, 2.8, 2.8)
+        self.windows = [
+            (datetime(2000, 1, 1, 0), timedelta(hours=12)),
+            (datetime(2000, 1, 1, 20), timedelta(hours=12)),
+            (datetime(2001, 1, 1, 0), timedelta(hours=3)),
+        ]
+
+    def tearDown(self):
+        set_aorc_source(None)
+        aorc_registry().clear()
+        self.directory.cleanup()
+
+    def test_plans_deduplicated_chunk_keys(self):
+        """
+        Test that the plan lists each chunk read by the windows once, per yearly store.
+        """
+        plan = plan_chunk_fetch(self.windows, self.region)
+        cells = ["0.0", "0.1", "1.0", "1.1"]
+        self.assertEqual(
+            plan,
+            {
+                os.path.join(self.mirror_dir, "2000.zarr"): [
+                    f"APCP_surface/{t}.{cell}" for t in (0, 1) for cell in cells
+                ],
+                os.path.join(self.mirror_dir, "2001.zarr"): [f"APCP_surface/0.{cell}" for cell in cells],
+            },
+        )
+        # local mirrors are read in place rather than cached
+        self.assertEqual(prefetch_chunks(plan, self.cache_dir), 0)
+
+    def test_prefetched_chunks_are_read_from_cache(self):
+        """
+        Test that prefetched chunks are fetched once and then read from the cache.
+        """
+        path = os.path.join(self.mirror_dir, "2000.zarr")
+        keys = plan_chunk_fetch(self.windows[:2], self.region)[path]
+        cache = AORCChunkCache(fsspec.get_mapper(path), self.cache_dir)
+        self.assertEqual(cache.prefetch(keys, max_concurrency=4), len(keys))
+        self.assertEqual(cache.prefetch(keys, max_concurrency=4), 0)
+
+        rerun = AORCChunkCache(fsspec.get_mapper(path), self.cache_dir)
+        precip = xr.open_dataset(rerun, engine="zarr", chunks={}, consolidated=True)["APCP_surface"]
+        precip = precip.reset_coords(drop=True).isel(time=slice(1, 33), latitude=slice(2, 6), longitude=slice(2, 6))
+        misses = rerun.misses
+        expected = xr.open_zarr(path)["APCP_surface"].isel(
+            time=slice(1, 33), latitude=slice(2, 6), longitude=slice(2, 6)
+        )
+        np.testing.assert_array_equal(precip.to_numpy(), expected.to_numpy())
+        self.assertEqual(rerun.misses, misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
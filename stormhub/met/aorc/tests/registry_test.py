@@ -0,0 +1,63 @@
+"""Testing the registry of opened AORC year datasets."""
+
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from stormhub.met.aorc.registry import AORCDatasetRegistry
+from stormhub.met.tests.transpose_test import create_test_aorc_stores
+
+
+class TestAORCDatasetRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = create_test_aorc_stores(self.directory.name, [2000, 2001, 2002])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_opens_each_store_once(self):
+        """
+        Test that threads share one open dataset per store.
+        """
+        registry = AORCDatasetRegistry()
+        datasets = []
+        threads = [threading.Thread(target=lambda: datasets.append(registry.dataset(self.paths[0]))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(registry), 1)
+        self.assertTrue(all(ds is datasets[0] for ds in datasets))
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the least recently used dataset is forgotten once the registry is full, without closing it.
+        """
+        registry = AORCDatasetRegistry(max_datasets=2)
+        registry.warm(self.paths[:2])
+        evicted = registry.dataset(self.paths[1])
+        registry.dataset(self.paths[0])
+        with mock.patch.object(xr.Dataset, "close") as close:
+            registry.dataset(self.paths[2])
+        close.assert_not_called()
+        self.assertTrue(np.isfinite(evicted["APCP_surface"].isel(time=0).to_numpy()).any())
+        self.assertIn(self.paths[0], registry)
+        self.assertNotIn(self.paths[1], registry)
+        self.assertIn(self.paths[2], registry)
+
+    def test_open_spans_years(self):
+        """
+        Test that consecutive years open as one dataset along time.
+        """
+        ds = AORCDatasetRegistry().open(self.paths[:2])
+        self.assertEqual(ds.sizes["time"], 96)
+        self.assertTrue(ds["time"].to_index().is_monotonic_increasing)
+
+
+if __name__ == "__main__":
+    unittest.main()
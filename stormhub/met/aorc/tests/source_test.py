@@ -0,0 +1,68 @@
+"""Testing the sources of the yearly AORC Zarr stores."""
+
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+from stormhub.met.aorc.aorc import aorc_year_paths, open_aorc_region
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import LocalAORCSource, MemoryAORCSource, S3AORCSource, aorc_source, set_aorc_source
+from stormhub.met.tests.transpose_test import create_test_aorc_stores, create_test_transposition_domain_polygon
+
+
+class TestAORCSource(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = create_test_aorc_stores(self.directory.name, [2000, 2001])
+        self.domain = create_test_transposition_domain_polygon()
+        self.start, self.end = datetime(2000, 1, 1, 12), datetime(2001, 1, 1, 12)
+
+    def tearDown(self):
+        set_aorc_source(None)
+        aorc_registry().clear()
+        self.directory.cleanup()
+
+    def read_region(self) -> np.ndarray:
+        """Read the test window across the years from the AORC source of the process."""
+        paths = aorc_year_paths(self.start, self.end)
+        return open_aorc_region(paths, self.start, self.end, self.domain)["APCP_surface"].to_numpy()
+
+    def test_sources_read_the_same_data(self):
+        """
+        Test that a local mirror and an in-memory source resolve years to the same data.
+        """
+        set_aorc_source(self.directory.name)
+        self.assertEqual(aorc_year_paths(self.start, self.end), self.paths)
+        expected = self.read_region()
+
+        datasets = {year: xr.open_zarr(path).load() for year, path in zip([2000, 2001], self.paths)}
+        set_aorc_source(MemoryAORCSource(datasets, name="test"))
+        self.assertEqual(aorc_year_paths(self.start, self.end), ["memory://test/2000.zarr", "memory://test/2001.zarr"])
+        np.testing.assert_array_equal(self.read_region(), expected)
+
+    def test_missing_year_of_mirror(self):
+        """
+        Test that a year missing from a local mirror is reported as missing from the mirror.
+        """
+        set_aorc_source(LocalAORCSource(self.directory.name))
+        with self.assertRaisesRegex(FileNotFoundError, "local mirror"):
+            aorc_registry().dataset(aorc_source().year_path(2002))
+
+    def test_s3_source_caches_past_years(self):
+        """
+        Test that only S3 stores of past years are worth caching.
+        """
+        source = S3AORCSource("s3://bucket/aorc/")
+        self.assertEqual(source.year_path(2000), "s3://bucket/aorc/2000.zarr")
+        self.assertTrue(source.owns(source.year_path(2000)))
+        self.assertFalse(source.owns("s3://other/2000.zarr"))
+        self.assertTrue(source.cacheable(source.year_path(2000)))
+        self.assertFalse(source.cacheable(source.year_path(datetime.now().year)))
+        self.assertFalse(LocalAORCSource(self.directory.name).cacheable(self.paths[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
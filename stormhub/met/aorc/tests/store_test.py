@@ -0,0 +1,77 @@
+"""Testing the extraction of a region of the AORC dataset into a local store."""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import xarray as xr
+
+from stormhub.met.aorc.aorc import open_aorc_region
+from stormhub.met.aorc.source import LocalAORCSource, MemoryAORCSource
+from stormhub.met.aorc.store import extract_aorc_region, local_aorc_paths
+from stormhub.met.tests.transpose_test import create_test_aorc_stores, create_test_transposition_domain_polygon
+
+
+class TestAORCStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.directory.name, "source")
+        self.store_dir = os.path.join(self.directory.name, "store")
+        os.makedirs(self.source_dir)
+        create_test_aorc_stores(self.source_dir, [2000, 2001])
+        self.domain = create_test_transposition_domain_polygon()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_local_store_matches_source(self):
+        """
+        Test that the local store is read in place of the source when it covers the request.
+        """
+        start, end = datetime(2000, 1, 1, 12), datetime(2000, 1, 2, 12)
+        self.assertIsNone(local_aorc_paths(self.store_dir, start, end, self.domain))
+        extract_aorc_region(
+            self.store_dir,
+            self.domain,
+            2000,
+            2001,
+            time_chunk=24,
+            space_chunk=4,
+            source=LocalAORCSource(self.source_dir),
+        )
+        paths = local_aorc_paths(self.store_dir, start, end, self.domain)
+        self.assertEqual(paths, [os.path.join(self.store_dir, "2000.zarr")])
+        local = open_aorc_region(paths, start, end, self.domain)
+        source = open_aorc_region([os.path.join(self.source_dir, "2000.zarr")], start, end, self.domain)
+        xr.testing.assert_equal(local["APCP_surface"], source["APCP_surface"])
+        # requests beyond the extracted area, years or variables fall back to the source
+        self.assertIsNone(local_aorc_paths(self.store_dir, start, end, self.domain.buffer(1)))
+        self.assertIsNone(local_aorc_paths(self.store_dir, start, datetime(2002, 1, 1, 12), self.domain))
+        self.assertIsNone(local_aorc_paths(self.store_dir, start, end, self.domain, variables=["TMP_2maboveground"]))
+
+    def test_extraction_resumes(self):
+        """
+        Test that completed years are not extracted again and partial years are.
+        """
+        extract_aorc_region(self.store_dir, self.domain, 2000, 2000, source=LocalAORCSource(self.source_dir))
+        completed = os.path.getmtime(os.path.join(self.store_dir, "2000.zarr", ".zattrs"))
+        os.makedirs(os.path.join(self.store_dir, "2001.zarr.partial"))
+        extract_aorc_region(self.store_dir, self.domain, 2000, 2001, source=LocalAORCSource(self.source_dir))
+        self.assertEqual(os.path.getmtime(os.path.join(self.store_dir, "2000.zarr", ".zattrs")), completed)
+        self.assertEqual(sorted(os.listdir(self.store_dir)), ["2000.zarr", "2001.zarr"])
+
+    def test_extracts_from_given_source(self):
+        """
+        Test that a region is extracted from the given source rather than the source of the process.
+        """
+        ds = xr.open_zarr(os.path.join(self.source_dir, "2000.zarr")).load()
+        extract_aorc_region(self.store_dir, self.domain, 2000, 2000, source=MemoryAORCSource({2000: ds}, name="given"))
+        start, end = datetime(2000, 1, 1, 12), datetime(2000, 1, 2, 12)
+        local = open_aorc_region(local_aorc_paths(self.store_dir, start, end, self.domain), start, end, self.domain)
+        source = open_aorc_region([os.path.join(self.source_dir, "2000.zarr")], start, end, self.domain)
+        xr.testing.assert_equal(local["APCP_surface"], source["APCP_surface"])
+
+
+if __name__ == "__main__":
+    unittest.main()
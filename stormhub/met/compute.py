@@ -0,0 +1,118 @@
+"""Policies for the dask, BLAS and numba threads of each process, so process pools do not oversubscribe cores.
+
+Each worker process of a pool otherwise runs a dask threaded scheduler and BLAS and numba thread pools sized to every
+core, so a pool of one process per core runs many threads per core. When threadpoolctl is not importable the BLAS
+pools already loaded are left as they are, and only libraries loaded later see the thread environment variables.
+"""
+
+import logging
+import os
+
+import dask
+
+from stormhub.met import numba_backend
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+COMPUTE_POLICIES = ("synchronous", "threads", "shared")
+"""Compute policies: synchronous dask per process, a bounded thread count per process, or one shared process.
+A policy of None leaves the dask scheduler and thread pools of each process as they are."""
+COMPUTE_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+"""Environment variables sizing the thread pools of BLAS and other native libraries"""
+DEFAULT_POLICY_THREADS = 2
+"""Threads per process of the "threads" policy when no count is given"""
+
+
+def compute_threads(policy: str, threads: int = None) -> int:
+    """
+    Get the number of threads of each process under a compute policy.
+
+    Args:
+        policy (str): The compute policy, one of `COMPUTE_POLICIES`.
+        threads (int, optional): The threads of each process of the "threads" or "shared" policy. Defaults to 2 for
+            "threads" and to every core for "shared".
+
+    Returns
+    -------
+        int: The threads of each process.
+    """
+    if policy not in COMPUTE_POLICIES:
+        raise ValueError(f"Unsupported compute policy {policy}, expected one of {COMPUTE_POLICIES}")
+    if threads is not None and threads < 1:
+        raise ValueError(f"threads must be at least 1, not {threads}")
+    if policy == "synchronous":
+        return 1
+    if policy == "threads":
+        return threads or DEFAULT_POLICY_THREADS
+    return threads or os.cpu_count()
+
+
+def compute_processes(policy: str | None, num_workers: int) -> int:
+    """
+    Get the number of worker processes of a pool under a compute policy, one for the "shared" policy.
+
+    Args:
+        policy (str | None): The compute policy, one of `COMPUTE_POLICIES`, or None to keep the defaults.
+        num_workers (int): The number of worker processes asked for.
+
+    Returns
+    -------
+        int: The number of worker processes.
+    """
+    if policy is None:
+        return num_workers
+    compute_threads(policy)
+    return 1 if policy == "shared" else num_workers
+
+
+def dask_config(policy: str | None, threads: int = None) -> dict:
+    """
+    Build the dask configuration of a compute policy, e.g. for `dask.config.set`.
+
+    Args:
+        policy (str | None): The compute policy, one of `COMPUTE_POLICIES`, or None to keep the defaults.
+        threads (int, optional): The threads of each process.
+
+    Returns
+    -------
+        dict: The dask scheduler and its number of workers, empty for no policy.
+    """
+    if policy is None:
+        return {}
+    threads = compute_threads(policy, threads)
+    if policy == "synchronous":
+        return {"scheduler": "synchronous"}
+    return {"scheduler": "threads", "num_workers": threads}
+
+
+def configure_compute(policy: str | None, threads: int = None) -> None:
+    """
+    Apply a compute policy to the current process, e.g. in the initializer of worker processes.
+
+    Sets the dask scheduler, the thread environment variables inherited by libraries and processes started later,
+    the BLAS thread pools already loaded (when threadpoolctl is available) and the numba thread count.
+
+    Args:
+        policy (str | None): The compute policy, one of `COMPUTE_POLICIES`, or None to leave the process as it is.
+        threads (int, optional): The threads of each process.
+    """
+    if policy is None:
+        return
+    count = compute_threads(policy, threads)
+    dask.config.set(dask_config(policy, threads))
+    for name in COMPUTE_THREAD_ENV_VARS:
+        os.environ[name] = str(count)
+    if threadpool_limits is not None:
+        threadpool_limits(limits=count)
+    if numba_backend.NUMBA_AVAILABLE:
+        numba_backend.numba.set_num_threads(min(count, numba_backend.numba.config.NUMBA_NUM_THREADS))
+    logging.debug("Compute policy %s with %d threads in process %d", policy, count, os.getpid())
@@ -0,0 +1,197 @@
+"""Statistic kernels evaluated under a watershed mask for many shifts at once."""
+
+import warnings
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+from scipy.signal import fftconvolve
+
+STATISTIC_KINDS = ("mean", "sum", "volume", "wet_fraction", "min", "max", "percentile")
+"""Kinds of statistic available to `StatisticKernel`."""
+
+ORDER_STATISTIC_KINDS = ("min", "max", "percentile")
+"""Kinds of statistic evaluated from the gathered cell values of each window rather than by correlation."""
+
+
+class StatisticKernel:
+    """
+    A declarative statistic of the data under a watershed mask.
+
+    Additive statistics (mean, sum, volume and wet cell fraction) are evaluated for every window origin at once by
+    correlating the grid with the mask. Order statistics (min, max and percentiles) are evaluated from sliding window
+    views of the grid gathered at the requested origins, sharing one gather between all order statistics.
+
+    Attributes
+    ----------
+        kind (str): The kind of statistic, one of `STATISTIC_KINDS`.
+        q (float): The percentile, for the "percentile" kind.
+        threshold (float): Values above the threshold are wet, for the "wet_fraction" kind.
+        cell_area (float): The area of a cell, for the "volume" kind. `Transpose.shift_statistics` fills this from
+            the grid when it is not given.
+        name (str): The name of the statistic in results.
+    """
+
+    def __init__(
+        self, kind: str, q: float = None, threshold: float = 0.0, cell_area: float = None, name: str = None
+    ) -> None:
+        if kind not in STATISTIC_KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(STATISTIC_KINDS)}, not {kind}")
+        if kind == "percentile" and (q is None or not 0 <= q <= 100):
+            raise ValueError(f"A percentile between 0 and 100 is required for percentile kernels, not {q}")
+        self.kind = kind
+        self.q = q
+        self.threshold = threshold
+        self.cell_area = cell_area
+        if name:
+            self.name = name
+        elif kind == "percentile":
+            self.name = f"p{q:g}"
+        else:
+            self.name = kind
+
+    def __repr__(self) -> str:
+        """Return the kernel representation."""
+        return f"StatisticKernel({self.name!r})"
+
+    @property
+    def is_order_statistic(self) -> bool:
+        """Whether the statistic is evaluated from gathered cell values."""
+        return self.kind in ORDER_STATISTIC_KINDS
+
+    @classmethod
+    def from_spec(cls, spec: "str | StatisticKernel") -> "StatisticKernel":
+        """Create a kernel from a name such as "mean", "max", "wet_fraction" or "p90"."""
+        if isinstance(spec, StatisticKernel):
+            return spec
+        if spec.startswith("p") and spec[1:].replace(".", "", 1).isdigit():
+            return cls("percentile", q=float(spec[1:]), name=spec)
+        return cls(spec)
+
+
+def correlate_mask(grid: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Correlate a grid, or a stack of grids, with a mask.
+
+    Args:
+        grid (np.ndarray): A 2D array, or a 3D array of 2D layers.
+        mask (np.ndarray): A 2D boolean mask.
+
+    Returns
+    -------
+        np.ndarray: The sum of the grid under the mask for every window origin (row, column) that keeps the
+        window within the grid, per layer for a 3D array.
+    """
+    if grid.dtype == bool:
+        grid = grid.astype(np.float64)
+    # correlation is convolution with the kernel flipped along both spatial axes
+    kernel = mask[::-1, ::-1].astype(grid.dtype)
+    kernel = kernel.reshape((1,) * (grid.ndim - 2) + kernel.shape)
+    return fftconvolve(grid, kernel, mode="valid", axes=(-2, -1))
+
+
+def correlate_masks(grid: np.ndarray, masks: list[np.ndarray]) -> list[np.ndarray]:
+    """
+    Correlate a grid with several masks, transforming the grid only once.
+
+    Args:
+        grid (np.ndarray): A 2D array.
+        masks (list[np.ndarray]): 2D boolean masks, each no larger than the grid.
+
+    Returns
+    -------
+        list[np.ndarray]: For each mask, the sum of the grid under the mask for every window origin (row, column) that
+        keeps the window within the grid, as from `correlate_mask`.
+    """
+    if not masks:
+        return []
+    if grid.dtype == bool:
+        grid = grid.astype(np.float64)
+    # pad so the circular convolution of the largest mask equals the linear convolution
+    fft_shape = [
+        fft.next_fast_len(grid.shape[axis] + max(mask.shape[axis] for mask in masks) - 1, real=True) for axis in (0, 1)
+    ]
+    grid_fft = fft.rfft2(grid, s=fft_shape)
+    correlations = []
+    for mask in masks:
+        kernel = mask[::-1, ::-1].astype(grid.dtype)
+        full = fft.irfft2(grid_fft * fft.rfft2(kernel, s=fft_shape), s=fft_shape)
+        height, width = mask.shape
+        correlations.append(full[height - 1 : grid.shape[0], width - 1 : grid.shape[1]].astype(grid.dtype, copy=False))
+    return correlations
+
+
+def evaluate_kernels(
+    data: np.ndarray,
+    mask: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    kernels: list["str | StatisticKernel"],
+    max_gather_size: int = 2**24,
+) -> dict[str, np.ndarray]:
+    """
+    Evaluate statistic kernels under a mask placed at many window origins.
+
+    Args:
+        data (np.ndarray): A 2D grid.
+        mask (np.ndarray): A 2D boolean mask.
+        rows (np.ndarray): The row of the window origin (top left of the mask) for each placement.
+        cols (np.ndarray): The column of the window origin for each placement.
+        kernels (list[str | StatisticKernel]): The statistics to evaluate.
+        max_gather_size (int): The maximum number of cell values gathered at once for order statistics.
+
+    Returns
+    -------
+        dict[str, np.ndarray]: The values of each statistic, by name, aligned with the window origins.
+    """
+    kernels = [StatisticKernel.from_spec(kernel) for kernel in kernels]
+    for kernel in kernels:
+        if kernel.kind == "volume" and kernel.cell_area is None:
+            raise ValueError(f"A cell area is required to evaluate the volume kernel {kernel.name}")
+    results = {}
+    finite = np.isfinite(data)
+    counts = None
+    sums = None
+    for kernel in kernels:
+        if kernel.is_order_statistic:
+            continue
+        if counts is None:
+            counts = np.rint(correlate_mask(finite, mask))[rows, cols]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if kernel.kind == "wet_fraction":
+                wet = np.rint(correlate_mask(finite & (np.where(finite, data, 0) > kernel.threshold), mask))
+                results[kernel.name] = np.where(counts > 0, wet[rows, cols] / counts, np.nan)
+                continue
+            if sums is None:
+                sums = correlate_mask(np.where(finite, data, 0), mask)[rows, cols]
+            if kernel.kind == "mean":
+                results[kernel.name] = np.where(counts > 0, sums / counts, np.nan)
+            elif kernel.kind == "sum":
+                results[kernel.name] = np.where(counts > 0, sums, np.nan)
+            else:
+                results[kernel.name] = np.where(counts > 0, sums * kernel.cell_area, np.nan)
+
+    order_kernels = [kernel for kernel in kernels if kernel.is_order_statistic]
+    if order_kernels:
+        for kernel in order_kernels:
+            results[kernel.name] = np.full(len(rows), np.nan)
+        windows = sliding_window_view(data, mask.shape)
+        chunk_size = max(1, max_gather_size // mask.size)
+        for start in range(0, len(rows), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            values = windows[rows[chunk], cols[chunk]][:, mask]
+            has_nan = bool(np.isnan(values).any())
+            with warnings.catch_warnings():
+                # windows without any finite values reduce to NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                for kernel in order_kernels:
+                    if kernel.kind == "min":
+                        reduced = np.nanmin(values, axis=1) if has_nan else values.min(axis=1)
+                    elif kernel.kind == "max":
+                        reduced = np.nanmax(values, axis=1) if has_nan else values.max(axis=1)
+                    elif has_nan:
+                        reduced = np.nanpercentile(values, kernel.q, axis=1)
+                    else:
+                        reduced = np.percentile(values, kernel.q, axis=1)
+                    results[kernel.name][chunk] = reduced
+    return {kernel.name: results[kernel.name] for kernel in kernels}
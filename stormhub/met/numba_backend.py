@@ -0,0 +1,98 @@
+"""Optional numba compiled kernels for the transposition shift search.
+
+The kernels walk the cells of the watershed mask for each window origin, so memory use stays flat regardless of the
+size of the grid. When numba is not importable `NUMBA_AVAILABLE` is False and `Transpose` falls back to NumPy.
+"""
+
+import numpy as np
+
+try:
+    import numba
+
+    NUMBA_AVAILABLE = True
+    prange = numba.prange
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
+    prange = range
+
+
+def _jit(func):
+    """Compile a kernel with numba when it is available."""
+    if NUMBA_AVAILABLE:
+        return numba.njit(parallel=True, nogil=True, cache=True)(func)
+    return func
+
+
+@_jit
+def _valid_origins(data: np.ndarray, mask_rows: np.ndarray, mask_cols: np.ndarray, height: int, width: int):
+    n_rows = data.shape[0] - height + 1
+    n_cols = data.shape[1] - width + 1
+    valid = np.zeros((n_rows, n_cols), dtype=np.bool_)
+    for row in prange(n_rows):
+        for col in range(n_cols):
+            is_valid = True
+            for cell in range(mask_rows.shape[0]):
+                if not np.isfinite(data[row + mask_rows[cell], col + mask_cols[cell]]):
+                    is_valid = False
+                    break
+            valid[row, col] = is_valid
+    return valid
+
+
+@_jit
+def _origin_means(
+    data: np.ndarray, mask_rows: np.ndarray, mask_cols: np.ndarray, origin_rows: np.ndarray, origin_cols: np.ndarray
+):
+    means = np.empty(origin_rows.shape[0], dtype=np.float64)
+    for origin in prange(origin_rows.shape[0]):
+        total = 0.0
+        count = 0
+        for cell in range(mask_rows.shape[0]):
+            value = data[origin_rows[origin] + mask_rows[cell], origin_cols[origin] + mask_cols[cell]]
+            if np.isfinite(value):
+                total += value
+                count += 1
+        means[origin] = total / count if count > 0 else np.nan
+    return means
+
+
+def valid_origins(data: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Find the window origins where every cell under the mask is finite.
+
+    Args:
+        data (np.ndarray): A 2D grid.
+        mask (np.ndarray): A 2D boolean mask.
+
+    Returns
+    -------
+        np.ndarray: A boolean array indexed by window origin (row, column), for origins that keep the window within
+        the grid.
+    """
+    mask_rows, mask_cols = np.nonzero(mask)
+    return _valid_origins(np.ascontiguousarray(data), mask_rows, mask_cols, mask.shape[0], mask.shape[1])
+
+
+def origin_means(data: np.ndarray, mask: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Calculate the mean of the finite values under the mask at each window origin.
+
+    Args:
+        data (np.ndarray): A 2D grid.
+        mask (np.ndarray): A 2D boolean mask.
+        rows (np.ndarray): The row of each window origin.
+        cols (np.ndarray): The column of each window origin.
+
+    Returns
+    -------
+        np.ndarray: The mean for each window origin, NaN where no values are finite.
+    """
+    mask_rows, mask_cols = np.nonzero(mask)
+    return _origin_means(
+        np.ascontiguousarray(data),
+        mask_rows,
+        mask_cols,
+        np.ascontiguousarray(rows, dtype=np.int64),
+        np.ascontiguousarray(cols, dtype=np.int64),
+    )
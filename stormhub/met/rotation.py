@@ -0,0 +1,236 @@
+"""Rotation plus translation search for storm transposition."""
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import numpy as np
+import xarray as xr
+from affine import Affine
+from shapely import Point, Polygon
+from shapely.affinity import affine_transform
+
+from stormhub.met.kernels import StatisticKernel
+from stormhub.met.transpose import Transpose
+
+
+def rotation_angles(max_angle: float, step: float) -> np.ndarray:
+    """
+    Create the angles of a symmetric rotation search, in degrees.
+
+    Args:
+        max_angle (float): The greatest rotation either way, in degrees.
+        step (float): The spacing between angles, in degrees.
+
+    Returns
+    -------
+        np.ndarray: Angles from -max_angle to max_angle, ordered by magnitude so ties favour the smaller rotation.
+    """
+    if step <= 0:
+        raise ValueError(f"step must be positive, not {step}")
+    half = np.arange(step, max_angle + step / 2, step)
+    angles = np.empty(2 * len(half) + 1)
+    angles[0] = 0.0
+    angles[1::2] = -half
+    angles[2::2] = half
+    return angles
+
+
+def local_rotation(pivot: Point, angle: float) -> Affine:
+    """
+    Create the rotation of longitude, latitude coordinates about a pivot in a local equal-scale frame.
+
+    A degree of longitude is shorter than a degree of latitude by the cosine of the latitude, so rotating in degree
+    space shears and stretches a watershed. Instead x is scaled by the cosine of the pivot latitude, the coordinates
+    are rotated, and x is unscaled, so the rotation (and any following translation) is a rigid motion in the local
+    frame and preserves the projected shape and area of the watershed.
+
+    Args:
+        pivot (Point): The point rotated about, in longitude and latitude.
+        angle (float): The rotation in degrees counterclockwise.
+
+    Returns
+    -------
+        Affine: The rotation in longitude, latitude coordinates.
+    """
+    # python floats, so the terms of the transform can be saved to JSON item properties
+    scale = math.cos(math.radians(pivot.y))
+    rotation = Affine.rotation(angle)
+    # the product of unscale, rotation and scale about the pivot, written out so no rotation is exactly the identity
+    a, b, d, e = rotation.a, rotation.b / scale, rotation.d * scale, rotation.e
+    return Affine(a, b, pivot.x - a * pivot.x - b * pivot.y, d, e, pivot.y - d * pivot.x - e * pivot.y)
+
+
+def _rotated_transposes(
+    data_array: xr.DataArray,
+    watershed: Polygon,
+    x_var: str,
+    y_var: str,
+    angles: list[float],
+    engine: str,
+    dtype: str | np.dtype | None,
+) -> tuple[list[Affine], list[Transpose]]:
+    """Create the rotation and the `Transpose` of the rotated watershed at each angle, sharing one numpy grid."""
+    if len(angles) == 0:
+        raise ValueError("At least one rotation angle is required")
+    centroid = watershed.centroid
+    rotations = [local_rotation(centroid, angle) for angle in angles]
+    transposes = [
+        Transpose(
+            data_array,
+            affine_transform(watershed, rotation.to_shapely()),
+            x_var,
+            y_var,
+            engine=engine,
+            dtype=dtype,
+        )
+        for rotation in rotations
+    ]
+    data = transposes[0].np_data_array
+    for transpose in transposes[1:]:
+        transpose._np_data_array = data
+    return rotations, transposes
+
+
+def _best_translation(
+    transpose: Transpose, rank_by: str | StatisticKernel
+) -> tuple[float, tuple[int, int]] | tuple[None, None]:
+    """Find the greatest ranking value and its shift for one rotated watershed."""
+    shifts = transpose.valid_shifts
+    if len(shifts) == 0:
+        return None, None
+    values = transpose._ranking_values(rank_by)
+    index = int(np.argmax(values))
+    return float(values[index]), (int(shifts[index][0]), int(shifts[index][1]))
+
+
+def max_rotated_transpose(
+    data_array: xr.DataArray,
+    watershed: Polygon,
+    x_var: str,
+    y_var: str,
+    angles: list[float],
+    func: Callable[[np.ndarray], Any] | None = None,
+    rank_by: str | StatisticKernel = "mean",
+    engine: str = "convolution",
+    num_workers: int = None,
+    dtype: str | np.dtype | None = None,
+) -> tuple[Polygon, Affine, Any | None, float]:
+    """
+    Calculate the maximum transposition of a watershed over a data array, allowing rotation as well as translation.
+
+    The watershed is rotated about its centroid to each angle (see `local_rotation`), and the translation search of
+    `Transpose` is run for each rotated watershed. The numpy grid is read once and shared, and angles are searched in a thread pool, where
+    the FFT correlations of the vectorized engines release the GIL so angles run in parallel across cores. Ties
+    between angles are broken by the order of `angles`.
+
+    Args:
+        data_array (xr.DataArray): The data array to be transposed.
+        watershed (Polygon): The watershed polygon.
+        x_var (str): The x variable name in the data array.
+        y_var (str): The y variable name in the data array.
+        angles (list[float]): The rotations to search, in degrees counterclockwise, e.g. from `rotation_angles`.
+        func (Callable[[np.ndarray], Any] | None): A callable to apply to the data under the transposed watershed.
+        rank_by (str | StatisticKernel): The statistic used to rank transpositions, e.g. "mean", "max" or "p90".
+        engine (str): The `Transpose` engine used to evaluate the shifts of each rotated watershed.
+        num_workers (int, optional): Number of threads searching angles. Defaults to the `ThreadPoolExecutor`
+            default.
+        dtype (str | np.dtype, optional): The dtype the data array is converted to.
+
+    Returns
+    -------
+        tuple[Polygon, Affine, Any | None, float]: The resulting polygon, the affine transformation (rotation about
+        the watershed centroid followed by translation) of the watershed, the results, and the angle in degrees.
+    """
+    rotations, transposes = _rotated_transposes(data_array, watershed, x_var, y_var, angles, engine, dtype)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        searches = list(executor.map(lambda transpose: _best_translation(transpose, rank_by), transposes))
+
+    best = None
+    for angle, rotation, transpose, (value, shift) in zip(angles, rotations, transposes, searches):
+        if value is None:
+            logging.debug("No valid shifts for the watershed rotated %s degrees", angle)
+            continue
+        if best is None or value > best[0]:
+            best = (value, angle, rotation, transpose, shift)
+    if best is None:
+        raise ValueError("No valid shifts found for the watershed at any rotation within the data array")
+
+    _, angle, rotation, transpose, (x_delta, y_delta) = best
+    polygon, translation = transpose._shift_to_geometry(x_delta, y_delta)
+    aff = translation * rotation
+    results = func(transpose._shifted_window(x_delta, y_delta)) if func else None
+    return polygon, aff, results, float(angle)
+
+
+def top_rotated_transpositions(
+    data_array: xr.DataArray,
+    watershed: Polygon,
+    x_var: str,
+    y_var: str,
+    angles: list[float],
+    k: int,
+    min_separation: int = 0,
+    func: Callable[[np.ndarray], Any] | None = None,
+    rank_by: str | StatisticKernel = "mean",
+    engine: str = "convolution",
+    num_workers: int = None,
+    dtype: str | np.dtype | None = None,
+) -> list[tuple[Polygon, Affine, Any | None, float]]:
+    """
+    Calculate the k highest ranked transpositions of a watershed over a data array across all rotations.
+
+    The valid shifts of every rotated watershed are ranked together, with ties broken by the order of `angles` and
+    then of the valid shifts, and accepted in order as in `Transpose.top_transpositions`. Each rotation is about the
+    watershed centroid, so shifts are compared across angles and `min_separation` keeps accepted transpositions apart
+    whatever their rotation. The first transposition is the same as the one from `max_rotated_transpose`.
+
+    Args:
+        data_array (xr.DataArray): The data array to be transposed.
+        watershed (Polygon): The watershed polygon.
+        x_var (str): The x variable name in the data array.
+        y_var (str): The y variable name in the data array.
+        angles (list[float]): The rotations to search, in degrees counterclockwise, e.g. from `rotation_angles`.
+        k (int): The number of transpositions to return.
+        min_separation (int): The minimum distance in cells, along x or y, between accepted shifts.
+        func (Callable[[np.ndarray], Any] | None): A callable to apply to the data under each transposed watershed.
+        rank_by (str | StatisticKernel): The statistic used to rank transpositions, e.g. "mean", "max" or "p90".
+        engine (str): The `Transpose` engine used to evaluate the shifts of each rotated watershed.
+        num_workers (int, optional): Number of threads ranking angles. Defaults to the `ThreadPoolExecutor` default.
+        dtype (str | np.dtype, optional): The dtype the data array is converted to.
+
+    Returns
+    -------
+        list[tuple[Polygon, Affine, Any | None, float]]: The resulting polygon, affine transformation, results and
+        angle in degrees of each transposition, highest ranked first. Fewer than k are returned if the valid shifts run
+        out.
+    """
+    rotations, transposes = _rotated_transposes(data_array, watershed, x_var, y_var, angles, engine, dtype)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        values = list(executor.map(lambda transpose: transpose._ranking_values(rank_by), transposes))
+
+    angle_indices = np.concatenate([np.full(len(v), i, dtype=int) for i, v in enumerate(values)])
+    shifts = np.concatenate([transpose.valid_shifts for transpose in transposes])
+    # a stable sort keeps the order of angles, then of valid shifts, for ties, matching `max_rotated_transpose`
+    order = np.argsort(-np.concatenate(values), kind="stable")
+    accepted = []
+    for index in order:
+        if len(accepted) >= k:
+            break
+        if min_separation > 0 and accepted:
+            if np.abs(shifts[accepted] - shifts[index]).max(axis=1).min() < min_separation:
+                continue
+        accepted.append(index)
+
+    transpositions = []
+    for index in accepted:
+        angle_index = angle_indices[index]
+        transpose = transposes[angle_index]
+        x_delta, y_delta = int(shifts[index][0]), int(shifts[index][1])
+        polygon, translation = transpose._shift_to_geometry(x_delta, y_delta)
+        results = func(transpose._shifted_window(x_delta, y_delta)) if func else None
+        transpositions.append((polygon, translation * rotations[angle_index], results, float(angles[angle_index])))
+    return transpositions
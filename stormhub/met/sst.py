@@ -0,0 +1,214 @@
+"""Stochastic storm transposition (SST) Monte Carlo sampling of basin-average depths."""
+
+import logging
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from shapely import Polygon
+from shapely.geometry import shape
+
+from stormhub.met.aorc.aorc import accumulation_stack
+from stormhub.met.consts import AORC_X_VAR, AORC_Y_VAR
+from stormhub.met.kernels import correlate_mask
+from stormhub.met.storm_catalog import StormCatalog
+from stormhub.met.transpose import Transpose
+
+
+def load_ranked_storms(csv_path: str, top_n: int = None) -> pd.DataFrame:
+    """
+    Load the ranked storms of a collection.
+
+    Args:
+        csv_path (str): Path to the `ranked-storms.csv` of a storm collection.
+        top_n (int, optional): Keep only storms with a period of record rank of at most `top_n`.
+
+    Returns
+    -------
+        pd.DataFrame: The ranked storms, ordered by period of record rank, with `storm_date` as datetimes.
+    """
+    ranked = pd.read_csv(csv_path)
+    ranked["storm_date"] = pd.to_datetime(ranked["storm_date"])
+    if top_n:
+        ranked = ranked[ranked["por_rank"] <= top_n]
+    return ranked.sort_values(by="por_rank").reset_index(drop=True)
+
+
+def _sample_indices(
+    storm_count: int,
+    shift_count: int,
+    storm_probabilities: np.ndarray | None,
+    seed: np.random.SeedSequence,
+    size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Draw the storm and shift indices of one block of realizations."""
+    rng = np.random.default_rng(seed)
+    storms = rng.choice(storm_count, size=size, p=storm_probabilities)
+    shifts = rng.integers(shift_count, size=size)
+    return storms, shifts
+
+
+class StochasticStormTransposition:
+    """
+    Monte Carlo sampling of storms and random valid transpositions of them over a watershed.
+
+    The storm accumulation grids are loaded once as a (storm, y, x) stack and correlated with the watershed mask,
+    giving a table of the basin-average depth of every storm at every valid shift. Realizations then only draw a storm
+    and a shift index and gather from that table, so any number of realizations are evaluated as array operations.
+
+    Attributes
+    ----------
+        stack (xr.DataArray): The (storm, y, x) stack of storm accumulation grids.
+        watershed (Polygon): The watershed polygon.
+        storm_dates (pd.DatetimeIndex): The start date of each storm.
+        transpose (Transpose): The transposition of the watershed over the grid of the stack.
+        valid_shifts (np.ndarray): The (x_delta, y_delta) shifts available to realizations.
+        depth_table (np.ndarray): The basin-average depth of each storm (rows) at each valid shift (columns).
+    """
+
+    def __init__(
+        self,
+        stack: xr.DataArray,
+        watershed: Polygon,
+        x_var: str,
+        y_var: str,
+        storm_dates: list = None,
+        storm_weights: np.ndarray = None,
+    ) -> None:
+        """
+        Initialize the StochasticStormTransposition class.
+
+        Args:
+            stack (xr.DataArray): A (storm, y, x) stack of storm accumulation grids on one grid.
+            watershed (Polygon): The watershed polygon.
+            x_var (str): The x variable name in the stack.
+            y_var (str): The y variable name in the stack.
+            storm_dates (list, optional): The start date of each storm. Defaults to the first coordinate of the stack.
+            storm_weights (np.ndarray, optional): The relative probability of sampling each storm. Defaults to
+                sampling storms uniformly.
+        """
+        self.stack = stack
+        self.watershed = watershed
+        storm_dim = stack.dims[0]
+        self.storm_dates = pd.DatetimeIndex(storm_dates if storm_dates is not None else stack[storm_dim].to_numpy())
+        if storm_weights is not None:
+            storm_weights = np.asarray(storm_weights, dtype=np.float64)
+            if storm_weights.shape != (len(stack),) or (storm_weights < 0).any() or storm_weights.sum() <= 0:
+                raise ValueError(f"Expected {len(stack)} non-negative storm weights with a positive sum")
+            storm_weights = storm_weights / storm_weights.sum()
+        self.storm_probabilities = storm_weights
+        self.transpose = Transpose(stack.isel({storm_dim: 0}), watershed, x_var, y_var, engine="convolution")
+        self._depth_table = None
+        self._valid_shifts = None
+
+    @classmethod
+    def from_collection(
+        cls,
+        catalog: StormCatalog,
+        storm_duration: int,
+        top_n: int = None,
+        collection_id: str = None,
+        precision: str = "float64",
+    ) -> "StochasticStormTransposition":
+        """
+        Load the ranked storms of a storm collection.
+
+        Args:
+            catalog (StormCatalog): The storm catalog.
+            storm_duration (int): The duration of the storms in hours.
+            top_n (int, optional): Keep only storms with a period of record rank of at most `top_n`.
+            collection_id (str, optional): The ID of the collection. Defaults to the collection for the duration.
+            precision (str): Float dtype of the storm accumulations, "float64" or "float32".
+
+        Returns
+        -------
+            StochasticStormTransposition: The storms of the collection transposed over the catalog watershed.
+        """
+        if not collection_id:
+            collection_id = catalog.spm.storm_collection_id(storm_duration)
+        csv_path = os.path.join(catalog.spm.collection_dir(collection_id), "ranked-storms.csv")
+        ranked = load_ranked_storms(csv_path, top_n)
+        if ranked.empty:
+            raise ValueError(f"No ranked storms found in {csv_path}")
+        logging.info("Loading %d ranked storms from %s", len(ranked), csv_path)
+        stack = accumulation_stack(
+            list(ranked["storm_date"].dt.to_pydatetime()),
+            timedelta(hours=storm_duration),
+            shape(catalog.valid_transposition_region.geometry),
+            precision=precision,
+            store_dir=catalog.spm.aorc_store_dir,
+        )
+        return cls(stack, shape(catalog.watershed.geometry), AORC_X_VAR, AORC_Y_VAR)
+
+    @property
+    def valid_shifts(self) -> np.ndarray:
+        """The (x_delta, y_delta) shifts where the watershed lies within the grid of every storm."""
+        if self._valid_shifts is None:
+            self._build_depth_table()
+        return self._valid_shifts
+
+    @property
+    def depth_table(self) -> np.ndarray:
+        """The basin-average depth of each storm at each valid shift."""
+        if self._depth_table is None:
+            self._build_depth_table()
+        return self._depth_table
+
+    def _build_depth_table(self) -> None:
+        """Correlate every storm grid with the watershed mask and gather the basin means at the valid shifts."""
+        grids = self.stack.to_numpy()
+        mask = self.transpose.watershed_mask_clipped
+        finite = np.isfinite(grids)
+        sums = correlate_mask(np.where(finite, grids, 0), mask)
+        nonfinite_counts = np.rint(correlate_mask(~finite, mask))
+        shifts = self.transpose.valid_shifts
+        rows = shifts[:, 1] + self.transpose.watershed_window.row_off
+        cols = shifts[:, 0] + self.transpose.watershed_window.col_off
+        # keep shifts where the watershed is within the data of every storm
+        complete = (nonfinite_counts[:, rows, cols] == 0).all(axis=0)
+        self._valid_shifts = shifts[complete]
+        self._depth_table = sums[:, rows[complete], cols[complete]] / mask.sum()
+
+    def sample(self, realizations: int, seed: int = None, block_size: int = 2**18) -> pd.DataFrame:
+        """
+        Sample storms and random valid shifts and gather their basin-average depths.
+
+        Realizations are drawn in blocks, each from its own generator spawned from one `np.random.SeedSequence`, so a
+        seed and block size give the same sample. Drawing indices is cheap next to building the depth table, so blocks
+        are drawn in this process, and the depths of all realizations are then gathered from the depth table at once.
+
+        Args:
+            realizations (int): The number of realizations.
+            seed (int, optional): The seed of the sample. A random seed is used if not provided.
+            block_size (int): Number of realizations drawn per block.
+
+        Returns
+        -------
+            pd.DataFrame: The storm date, storm index, shift (x_delta, y_delta, in cells) and basin-average depth of
+            each realization.
+        """
+        if len(self.valid_shifts) == 0:
+            raise ValueError("No valid shifts found for the watershed within the grid of every storm")
+        block_sizes = [min(block_size, realizations - start) for start in range(0, realizations, block_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(block_sizes))
+        storm_count, shift_count = self.depth_table.shape
+        blocks = [
+            _sample_indices(storm_count, shift_count, self.storm_probabilities, block_seed, size)
+            for block_seed, size in zip(seeds, block_sizes)
+        ]
+
+        empty = np.empty(0, dtype=int)
+        storms = np.concatenate([empty] + [block[0] for block in blocks])
+        shifts = np.concatenate([empty] + [block[1] for block in blocks])
+        depths = self.depth_table[storms, shifts]
+        return pd.DataFrame(
+            {
+                "storm_date": self.storm_dates[storms],
+                "storm_index": storms,
+                "x_delta": self.valid_shifts[shifts, 0],
+                "y_delta": self.valid_shifts[shifts, 1],
+                "depth": depths,
+            }
+        )
@@ -6,17 +6,35 @@ import os
 import traceback
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Any, List, Union
 
+import dask
+import numpy as np
 import pandas as pd
 import pystac
 from pystac import Asset, Collection, Item, Link, MediaType
+from shapely import union_all
 from shapely.geometry import mapping, shape
 
-from stormhub.hydro_domain import HydroDomain
+from stormhub.hydro_domain import HydroDomain, load_subbasins
 from stormhub.logger import initialize_logger
 from stormhub.met.analysis import StormAnalyzer
-from stormhub.met.aorc.aorc import AORCItem, valid_spaces_item
+from stormhub.met.aorc.aorc import (
+    AORCItem,
+    accumulation_stack,
+    aorc_year_paths,
+    rolling_accumulations,
+    valid_spaces_item,
+)
+from stormhub.met.aorc.cumulative import build_cumulative_cube
+from stormhub.met.aorc.cache import AORC_CHUNK_CACHE_BYTES
+from stormhub.met.aorc.prefetch import plan_chunk_fetch, prefetch_chunks
+from stormhub.met.aorc.registry import aorc_registry, warm_aorc_registry
+from stormhub.met.aorc.store import extract_aorc_region, local_aorc_paths
+from stormhub.met.compute import compute_processes, configure_compute, dask_config
+from stormhub.met.consts import AORC_X_VAR, AORC_Y_VAR
+from stormhub.met.transpose import Transpose, TranspositionPlan
 from stormhub.utils import (
     STORMHUB_REF_LINK,
     StacPathManager,
@@ -528,6 +546,12 @@ def storm_search(
     return_item: bool = False,
     scale_max: float = 12.0,
     collection_id: str = None,
+    alternate_transpositions: int = 0,
+    min_separation: int = 0,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    rotation_angles: list[float] = None,
+    transpose_engine: str = None,
 ) -> Union[dict, AORCItem]:
     """
     Search for a storm event.
@@ -539,6 +563,13 @@ def storm_search(
         return_item (bool): Whether to return the storm item.
         scale_max (float): The maximum scale for the thumbnail.
         collection_id (str): The ID of the collection.
+        alternate_transpositions (int): Number of runner-up transpositions to record on the storm item.
+        min_separation (int): Minimum distance in cells between recorded transpositions.
+        precision (str): Float dtype of the accumulation and transposition, "float64" or "float32".
+        scratch_dir (str): Directory for memory-mapped transposition scratch files.
+        rotation_angles (list[float]): Rotations of the watershed, in degrees, searched along with translations.
+        transpose_engine (str, optional): Engine of the transposition search, one of `TRANSPOSE_ENGINES`. Defaults to "loop"
+            for translations and "convolution" for rotations.
 
     Returns
     -------
@@ -570,6 +601,12 @@ def storm_search(
         item_dir,
         watershed.id,
         valid_transposition_domain.id,
+        plan_dir=catalog.spm.transposition_plan_dir,
+        precision=precision,
+        scratch_dir=scratch_dir,
+        rotation_angles=rotation_angles,
+        transpose_engine=transpose_engine,
+        aorc_store_dir=catalog.spm.aorc_store_dir,
         href=catalog.spm.collection_item(collection_id, item_id),
     )
 
@@ -581,6 +618,11 @@ def storm_search(
     if return_item:
         if not os.path.exists(item_dir):
             os.makedirs(item_dir)
+        if alternate_transpositions:
+            event_item.alternate_transpositions(alternate_transpositions, min_separation)
+        subbasins = load_subbasins(watershed)
+        if subbasins:
+            event_item.subbasin_hyetographs(subbasins)
         event_item.aorc_thumbnail(scale_max=scale_max)
         event_item.save_object(dest_href=catalog.spm.collection_item(collection_id, event_item.id))
         return event_item
@@ -592,6 +634,366 @@ def storm_search(
         }
 
 
+def storm_search_batch(
+    catalog: StormCatalog,
+    storm_start_dates: list[datetime],
+    storm_duration_hours: int,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    transpose_engine: str = None,
+) -> list[dict]:
+    """
+    Search for storm events for a block of start dates with one read and one batched transposition.
+
+    If reading or transposing the block fails, the error is logged with the date range of the block and each date is
+    searched alone with `storm_search`, so one bad read does not drop the whole block. When the process has an AORC
+    chunk cache, the chunks of the block are prefetched into it together before the read.
+
+    Args:
+        catalog (StormCatalog): The storm catalog.
+        storm_start_dates (list[datetime]): The start dates of the storms.
+        storm_duration_hours (int): The duration of the storms in hours.
+        precision (str): Float dtype of the accumulations and transposition, "float64" or "float32".
+        scratch_dir (str): Directory for memory-mapped transposition scratch files.
+        transpose_engine (str, optional): Engine of the dates searched alone with `storm_search`. The block itself is searched
+            with one batched correlation.
+
+    Returns
+    -------
+        list[dict]: The storm search results for each start date with a valid transposition.
+    """
+    watershed = catalog.watershed
+    valid_transposition_domain = catalog.valid_transposition_region
+    storm_start_dates = sorted(storm_start_dates)
+
+    logging.debug(
+        "%s - %s: searching %s - for max %d hr events.",
+        storm_start_dates[0].strftime("%Y-%m-%dT%H"),
+        storm_start_dates[-1].strftime("%Y-%m-%dT%H"),
+        watershed.id,
+        storm_duration_hours,
+    )
+    registry = aorc_registry()
+    _prefetch_windows(catalog, storm_start_dates, storm_duration_hours, registry.cache_dir, registry.cache_bytes)
+    try:
+        stack = accumulation_stack(
+            storm_start_dates,
+            timedelta(hours=storm_duration_hours),
+            shape(valid_transposition_domain.geometry),
+            precision=precision,
+            store_dir=catalog.spm.aorc_store_dir,
+        )
+        first_layer = stack.isel(time=0)
+        plan = TranspositionPlan.load_or_create(
+            catalog.spm.transposition_plan_dir,
+            first_layer,
+            shape(watershed.geometry),
+            shape(valid_transposition_domain.geometry),
+        )
+        transpose = Transpose(
+            first_layer,
+            shape(watershed.geometry),
+            AORC_X_VAR,
+            AORC_Y_VAR,
+            engine="convolution",
+            plan=plan,
+            dtype=precision,
+            scratch_dir=scratch_dir,
+        )
+        batch_results = transpose.max_transpose_batch(stack, AORCItem._create_stats)
+    except Exception as e:
+        logging.error(
+            "Error processing block %s - %s, searching %d dates individually: %s",
+            storm_start_dates[0].strftime("%Y-%m-%dT%H"),
+            storm_start_dates[-1].strftime("%Y-%m-%dT%H"),
+            len(storm_start_dates),
+            e,
+        )
+        results = []
+        for storm_start_date in storm_start_dates:
+            try:
+                results.append(
+                    storm_search(
+                        catalog,
+                        storm_start_date,
+                        storm_duration_hours,
+                        precision=precision,
+                        scratch_dir=scratch_dir,
+                        transpose_engine=transpose_engine,
+                    )
+                )
+            except Exception as date_error:
+                logging.error("Error processing %s: %s", storm_start_date.strftime("%Y-%m-%dT%H"), date_error)
+        return results
+
+    results = []
+    for storm_start_date, result in zip(storm_start_dates, batch_results):
+        if result is None:
+            logging.error("No valid transposition found for %s", storm_start_date.strftime("%Y-%m-%dT%H"))
+            continue
+        transposed_watershed, _, event_stats = result
+        results.append(
+            {
+                "storm_date": storm_start_date.strftime("%Y-%m-%dT%H"),
+                "centroid": transposed_watershed.centroid,
+                "aorc:statistics": event_stats,
+            }
+        )
+    return results
+
+
+def storm_search_stream(
+    catalog: StormCatalog,
+    storm_start_dates: list[datetime],
+    storm_duration_hours: int,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    batch_size: int = 32,
+    transpose_engine: str = None,
+) -> list[dict]:
+    """
+    Search for storm events for start dates in time order, streaming the AORC data once with a rolling window.
+
+    The accumulation following each start date is taken from `rolling_accumulations`, so overlapping storms share every
+    hour read, including storms crossing into the next year. Accumulations are transposed in batches with one correlation
+    per batch. If streaming fails, the error is logged and the dates not yet searched are searched alone with
+    `storm_search`.
+
+    Args:
+        catalog (StormCatalog): The storm catalog.
+        storm_start_dates (list[datetime]): The start dates of the storms.
+        storm_duration_hours (int): The duration of the storms in hours.
+        precision (str): Float dtype of the accumulation and transposition, "float64" or "float32".
+        scratch_dir (str): Directory for memory-mapped transposition scratch files.
+        batch_size (int): Number of accumulations transposed together.
+        transpose_engine (str, optional): Engine of the dates searched alone with `storm_search` after a failure.
+
+    Returns
+    -------
+        list[dict]: The storm search results of the dates with a valid transposition.
+    """
+    watershed = catalog.watershed
+    valid_transposition_domain = catalog.valid_transposition_region
+    storm_start_dates = sorted(storm_start_dates)
+    logging.debug(
+        "%s - %s: streaming %s - for max %d hr events.",
+        storm_start_dates[0].strftime("%Y-%m-%dT%H"),
+        storm_start_dates[-1].strftime("%Y-%m-%dT%H"),
+        watershed.id,
+        storm_duration_hours,
+    )
+
+    transpose = None
+    results = []
+    searched = set()
+
+    def search(batch: list[tuple[datetime, Any]]) -> None:
+        for (storm_start_date, _), result in zip(
+            batch,
+            transpose.max_transpose_batch(np.stack([grid.to_numpy() for _, grid in batch]), AORCItem._create_stats),
+        ):
+            searched.add(storm_start_date)
+            if result is None:
+                logging.error("No valid transposition found for %s", storm_start_date.strftime("%Y-%m-%dT%H"))
+                continue
+            transposed_watershed, _, event_stats = result
+            results.append(
+                {
+                    "storm_date": storm_start_date.strftime("%Y-%m-%dT%H"),
+                    "centroid": transposed_watershed.centroid,
+                    "aorc:statistics": event_stats,
+                }
+            )
+
+    try:
+        batch = []
+        for storm_start_date, grid in rolling_accumulations(
+            storm_start_dates,
+            timedelta(hours=storm_duration_hours),
+            shape(valid_transposition_domain.geometry),
+            precision=precision,
+            store_dir=catalog.spm.aorc_store_dir,
+        ):
+            if transpose is None:
+                plan = TranspositionPlan.load_or_create(
+                    catalog.spm.transposition_plan_dir,
+                    grid,
+                    shape(watershed.geometry),
+                    shape(valid_transposition_domain.geometry),
+                )
+                transpose = Transpose(
+                    grid,
+                    shape(watershed.geometry),
+                    AORC_X_VAR,
+                    AORC_Y_VAR,
+                    engine="convolution",
+                    plan=plan,
+                    dtype=precision,
+                    scratch_dir=scratch_dir,
+                )
+            batch.append((storm_start_date, grid))
+            if len(batch) == batch_size:
+                search(batch)
+                batch = []
+        if batch:
+            search(batch)
+    except Exception as e:
+        remaining = [storm_start_date for storm_start_date in storm_start_dates if storm_start_date not in searched]
+        logging.error(
+            "Error streaming %s - %s, searching %d remaining dates individually: %s",
+            storm_start_dates[0].strftime("%Y-%m-%dT%H"),
+            storm_start_dates[-1].strftime("%Y-%m-%dT%H"),
+            len(remaining),
+            e,
+        )
+        for storm_start_date in remaining:
+            try:
+                results.append(
+                    storm_search(
+                        catalog,
+                        storm_start_date,
+                        storm_duration_hours,
+                        precision=precision,
+                        scratch_dir=scratch_dir,
+                        transpose_engine=transpose_engine,
+                    )
+                )
+            except Exception as date_error:
+                logging.error("Error processing %s: %s", storm_start_date.strftime("%Y-%m-%dT%H"), date_error)
+    return results
+
+
+def storm_search_watersheds(
+    catalogs: list[StormCatalog],
+    storm_start_date: datetime,
+    storm_duration_hours: int,
+    precision: str = "float64",
+) -> list[dict | None]:
+    """
+    Search for a storm event for several catalogs that share a transposition region, reading AORC once.
+
+    The AORC data is read over the union of the valid transposition regions of the catalogs, which holds every valid
+    transposition of each watershed, so each catalog gets the transposition a search of that catalog alone finds.
+
+    Args:
+        catalogs (list[StormCatalog]): The storm catalogs, e.g. for nested or neighbouring sub-basins.
+        storm_start_date (datetime): The start date of the storm.
+        storm_duration_hours (int): The duration of the storm in hours.
+        precision (str): Float dtype of the accumulation and transposition, "float64" or "float32".
+
+    Returns
+    -------
+        list[dict | None]: The storm search results for each catalog, or None where no transposition is valid.
+    """
+    transposition_region = shape(catalogs[0].transposition_region.geometry)
+    for catalog in catalogs[1:]:
+        if not shape(catalog.transposition_region.geometry).equals(transposition_region):
+            raise ValueError(f"Catalog {catalog.id} does not share the transposition region of {catalogs[0].id}")
+    valid_transposition_domain = union_all([shape(catalog.valid_transposition_region.geometry) for catalog in catalogs])
+
+    event_item = AORCItem(
+        f"{storm_start_date.strftime('%Y-%m-%dT%H')}",
+        storm_start_date,
+        timedelta(hours=storm_duration_hours),
+        shape(catalogs[0].watershed.geometry),
+        valid_transposition_domain,
+        catalogs[0].spm.collection_dir(catalogs[0].spm.storm_collection_id(storm_duration_hours)),
+        catalogs[0].watershed.id,
+        catalogs[0].transposition_region.id,
+        plan_dir=catalogs[0].spm.transposition_plan_dir,
+        precision=precision,
+        aorc_store_dir=catalogs[0].spm.aorc_store_dir,
+    )
+    results = []
+    for catalog, result in zip(
+        catalogs, event_item.max_transpose_watersheds([shape(catalog.watershed.geometry) for catalog in catalogs])
+    ):
+        if result is None:
+            logging.error(
+                "No valid transposition found for %s on %s", catalog.id, storm_start_date.strftime("%Y-%m-%dT%H")
+            )
+            results.append(None)
+            continue
+        _, _, event_stats, centroid = result
+        results.append(
+            {
+                "storm_date": storm_start_date.strftime("%Y-%m-%dT%H"),
+                "centroid": centroid,
+                "aorc:statistics": event_stats,
+            }
+        )
+    return results
+
+
+def _dates_label(date: datetime | list[datetime]) -> str:
+    """Describe an event date, or a block of event dates, for log messages."""
+    if isinstance(date, list):
+        return f"{min(date).strftime('%Y-%m-%dT%H')} - {max(date).strftime('%Y-%m-%dT%H')}"
+    return date.strftime("%Y-%m-%dT%H")
+
+
+def _event_year_paths(
+    event_dates: list[datetime | list[datetime]], storm_duration: int, catalog: StormCatalog
+) -> list[str]:
+    """Get the paths of the yearly AORC datasets read by events, or blocks of events, preferring the local store."""
+    dates = [d for date in event_dates for d in (date if isinstance(date, list) else [date])]
+    if not dates:
+        return []
+    start, end = min(dates), max(dates) + timedelta(hours=storm_duration)
+    return local_aorc_paths(
+        catalog.spm.aorc_store_dir, start, end, shape(catalog.transposition_region.geometry)
+    ) or aorc_year_paths(start, end)
+
+
+def _prefetch_windows(
+    catalog: StormCatalog,
+    storm_start_dates: list[datetime],
+    storm_duration_hours: int,
+    cache_dir: str | None,
+    cache_bytes: int = AORC_CHUNK_CACHE_BYTES,
+) -> None:
+    """Fetch the AORC chunks read by storm windows into the chunk cache at once, if there is a cache."""
+    if not cache_dir or not storm_start_dates:
+        return
+    duration = timedelta(hours=storm_duration_hours)
+    try:
+        plan = plan_chunk_fetch(
+            [(pd.Timestamp(date).to_pydatetime(), duration) for date in storm_start_dates],
+            shape(catalog.valid_transposition_region.geometry),
+            store_dir=catalog.spm.aorc_store_dir,
+        )
+        prefetch_chunks(plan, cache_dir, cache_bytes)
+    except Exception as e:
+        # the chunks are fetched as they are read instead
+        logging.warning("Error prefetching AORC chunks: %s", e)
+
+
+def _initialize_worker(
+    paths: list[str], cache_dir: str | None, cache_bytes: int, compute_policy: str, compute_threads: int | None
+) -> None:
+    """Apply the compute policy of a worker process and open the yearly AORC datasets it will read."""
+    configure_compute(compute_policy, compute_threads)
+    warm_aorc_registry(paths, cache_dir, cache_bytes)
+
+
+def _configure_aorc_cache(catalog: StormCatalog, cache_bytes: int | None) -> tuple[str | None, int]:
+    """
+    Set the AORC chunk cache of the current process to the cache directory of a catalog.
+
+    Args:
+        catalog (StormCatalog): The storm catalog.
+        cache_bytes (int | None): Size cap of the cache, or None to read S3 directly.
+
+    Returns
+    -------
+        tuple[str | None, int]: The cache directory and size cap, for the initializer of worker processes.
+    """
+    cache_dir = catalog.spm.aorc_cache_dir if cache_bytes else None
+    cache_bytes = cache_bytes or AORC_CHUNK_CACHE_BYTES
+    aorc_registry().configure_cache(cache_dir, cache_bytes)
+    return cache_dir, cache_bytes
+
+
 def serial_processor(
     func: callable,
     catalog: StormCatalog,
@@ -608,7 +1010,7 @@ def serial_processor(
         catalog (StormCatalog): The storm catalog.
         storm_duration (int): The duration of the storm.
         output_csv (str): Path to the output CSV file.
-        event_dates (list[datetime]): List of event dates.
+        event_dates (list[datetime]): List of event dates, or of blocks of event dates for batched functions.
         with_tb (bool): Whether to include traceback in error logs.
     """
     if not os.path.exists(output_csv):
@@ -621,15 +1023,16 @@ def serial_processor(
         for date in event_dates:
             try:
                 r = func(catalog, date, storm_duration)
-                f.write(storm_search_results_to_csv_line(r))
-                logging.info("%s processed (%d remaining)", r["storm_date"], count)
                 count -= 1
+                for result in r if isinstance(r, list) else [r]:
+                    f.write(storm_search_results_to_csv_line(result))
+                    logging.info("%s processed (%d remaining)", result["storm_date"], count)
             except Exception as e:
                 if with_tb:
                     tb = traceback.format_exc()
-                    logging.error("Error processing: %s\n%s", e, tb)
+                    logging.error("Error processing %s: %s\n%s", _dates_label(date), e, tb)
                 else:
-                    logging.error("Error processing: %s", e)
+                    logging.error("Error processing %s: %s", _dates_label(date), e)
 
 
 def multi_processor(
@@ -641,6 +1044,10 @@ def multi_processor(
     num_workers: int = None,
     use_threads: bool = False,
     with_tb: bool = False,
+    cache_dir: str = None,
+    cache_bytes: int = AORC_CHUNK_CACHE_BYTES,
+    compute_policy: str = None,
+    compute_threads: int = None,
 ):
     """
     Run function in parallel using multiple processors or threads.
@@ -652,15 +1059,34 @@ def multi_processor(
         catalog (StormCatalog): The storm catalog.
         storm_duration (int): The duration of the storm.
         output_csv (str): Path to the output CSV file.
-        event_dates (list[datetime]): List of event dates.
+        event_dates (list[datetime]): List of event dates, or of blocks of event dates for batched functions.
         num_workers (int, optional): Number of workers to use.
         use_threads (bool): Whether to use threads instead of processes.
         with_tb (bool): Whether to include traceback in error logs.
+        cache_dir (str, optional): Directory of the AORC chunk cache of worker processes, or None to read S3 directly.
+        cache_bytes (int): Size cap of the AORC chunk cache.
+        compute_policy (str, optional): Compute policy of the workers, one of `COMPUTE_POLICIES`. The "shared"
+            policy runs one worker process. Threads share the dask scheduler of this process, set by the policy while
+            they run. The default dask scheduler and thread pools are kept if None.
+        compute_threads (int, optional): Threads of each worker process of the "threads" or "shared" policy.
     """
     if use_threads:
         executor = ThreadPoolExecutor
+        executor_kwargs = {}
     else:
+        # open the yearly AORC datasets once in each worker process rather than for every event
         executor = ProcessPoolExecutor
+        num_workers = compute_processes(compute_policy, num_workers)
+        executor_kwargs = {
+            "initializer": _initialize_worker,
+            "initargs": (
+                _event_year_paths(event_dates, storm_duration, catalog),
+                cache_dir,
+                cache_bytes,
+                compute_policy,
+                compute_threads,
+            ),
+        }
 
     if not os.path.exists(output_csv):
         # append_mode=True
@@ -669,23 +1095,26 @@ def multi_processor(
 
     count = len(event_dates)
 
-    with open(output_csv, "a", encoding="utf-8") as f:
-        with executor(max_workers=num_workers) as executor:
-            futures = [executor.submit(func, catalog, date, storm_duration) for date in event_dates]
+    # threads share the dask scheduler of this process, so the policy is set here while they run
+    thread_config = dask_config(compute_policy, compute_threads) if use_threads else {}
+    with open(output_csv, "a", encoding="utf-8") as f, dask.config.set(thread_config):
+        with executor(max_workers=num_workers, **executor_kwargs) as executor:
+            futures = {executor.submit(func, catalog, date, storm_duration): date for date in event_dates}
             for future in as_completed(futures):
                 count -= 1
                 try:
                     r = future.result()
-                    f.write(storm_search_results_to_csv_line(r))
-                    logging.info("%s processed (%d remaining)", r["storm_date"], count)
+                    for result in r if isinstance(r, list) else [r]:
+                        f.write(storm_search_results_to_csv_line(result))
+                        logging.info("%s processed (%d remaining)", result["storm_date"], count)
 
                 except Exception as e:
                     if with_tb:
                         tb = traceback.format_exc()
-                        logging.error("Error processing: %s\n%s", e, tb)
+                        logging.error("Error processing %s: %s\n%s", _dates_label(futures[future]), e, tb)
                         continue
                     else:
-                        logging.error("Error processing: %s", e)
+                        logging.error("Error processing %s: %s", _dates_label(futures[future]), e)
                         continue
 
 
@@ -698,6 +1127,14 @@ def collect_event_stats(
     use_threads: bool = False,
     with_tb: bool = False,
     use_parallel_processing: bool = True,
+    batch_size: int = 1,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    pipeline: bool = False,
+    cache_bytes: int = None,
+    compute_policy: str = None,
+    compute_threads: int = None,
+    transpose_engine: str = None,
 ):
     """
     Collect statistics for storm events.
@@ -711,6 +1148,21 @@ def collect_event_stats(
         use_threads (bool): Whether to use threads instead of processes.
         with_tb (bool): Whether to include traceback in error logs.
         use_parallel_processing (bool): Whether to process storm stats using parallel processing.
+        batch_size (int): Number of consecutive event dates searched together with `storm_search_batch`.
+        precision (str): Float dtype of the accumulations and transpositions, "float64" or "float32".
+        scratch_dir (str, optional): Directory for memory-mapped transposition scratch files.
+        pipeline (bool): Whether to stream the AORC data of each year once with `storm_search_stream`, rather than
+            reading the accumulation of each event date (or block of `batch_size` dates) on its own.
+        cache_bytes (int, optional): Size cap of an on-disk cache of the AORC chunks read from S3, kept in the catalog
+            directory and shared by the workers, so re-runs and resumed collections download each chunk once. No
+            cache is used if None.
+        compute_policy (str, optional): How the dask, BLAS and numba threads of each process are sized:
+            "synchronous" for one thread per process, "threads" for `compute_threads` per process, or "shared" for one
+            process with a threaded scheduler over `compute_threads` (by default every core). The default dask
+            scheduler and thread pools are kept if None.
+        compute_threads (int, optional): Threads of each process of the "threads" or "shared" policy.
+        transpose_engine (str, optional): Engine of the transposition search of each event date, one of `TRANSPOSE_ENGINES`.
+            Blocks of dates and pipelines are searched with batched correlations, and use it for dates searched alone.
     """
     if not collection_id:
         collection_id = catalog.spm.storm_collection_id(storm_duration)
@@ -728,11 +1180,31 @@ def collect_event_stats(
     elif not num_workers and use_threads:
         num_workers = 15
 
+    if pipeline:
+        years = {}
+        for event_date in sorted(event_dates):
+            years.setdefault(event_date.year, []).append(event_date)
+        event_dates = list(years.values())
+        search_func = partial(
+            storm_search_stream, precision=precision, scratch_dir=scratch_dir, transpose_engine=transpose_engine
+        )
+    elif batch_size > 1:
+        sorted_dates = sorted(event_dates)
+        event_dates = [sorted_dates[i : i + batch_size] for i in range(0, len(sorted_dates), batch_size)]
+        search_func = partial(
+            storm_search_batch, precision=precision, scratch_dir=scratch_dir, transpose_engine=transpose_engine
+        )
+    else:
+        search_func = partial(
+            storm_search, precision=precision, scratch_dir=scratch_dir, transpose_engine=transpose_engine
+        )
+
+    cache_dir, cache_bytes = _configure_aorc_cache(catalog, cache_bytes)
     output_csv = os.path.join(collection_dir, "storm-stats.csv")
     if use_parallel_processing:
         logging.info("Using %s cpu's for collecting event stats", num_workers)
         multi_processor(
-            func=storm_search,
+            func=search_func,
             catalog=catalog,
             storm_duration=storm_duration,
             output_csv=output_csv,
@@ -740,17 +1212,133 @@ def collect_event_stats(
             num_workers=num_workers,
             use_threads=use_threads,
             with_tb=with_tb,
+            cache_dir=cache_dir,
+            cache_bytes=cache_bytes,
+            compute_policy=compute_policy,
+            compute_threads=compute_threads,
         )
     else:
         logging.info("Processing event stats serially.")
-        serial_processor(
-            func=storm_search,
-            catalog=catalog,
-            storm_duration=storm_duration,
-            output_csv=output_csv,
-            event_dates=event_dates,
-            with_tb=with_tb,
-        )
+        with dask.config.set(dask_config(compute_policy, compute_threads)):
+            serial_processor(
+                func=search_func,
+                catalog=catalog,
+                storm_duration=storm_duration,
+                output_csv=output_csv,
+                event_dates=event_dates,
+                with_tb=with_tb,
+            )
+    aorc_registry().log_cache_stats()
+
+
+def collect_watersheds_event_stats(
+    event_dates: list[datetime],
+    catalogs: list[StormCatalog],
+    storm_duration: int = 72,
+    num_workers: int = None,
+    use_threads: bool = False,
+    with_tb: bool = False,
+    use_parallel_processing: bool = True,
+    precision: str = "float64",
+    cache_bytes: int = None,
+    compute_policy: str = None,
+    compute_threads: int = None,
+):
+    """
+    Collect statistics for storm events for several catalogs sharing a transposition region, reading AORC once per date.
+
+    Each event date is searched for every catalog with `storm_search_watersheds`, and the results of each catalog are
+    appended to the storm-stats.csv of its collection, as `collect_event_stats` writes it, so each catalog can then be
+    ranked and its items created with `new_collection`.
+
+    Args:
+        event_dates (list[datetime]): List of event dates.
+        catalogs (list[StormCatalog]): The storm catalogs, e.g. for nested or neighbouring sub-basins.
+        storm_duration (int): The duration of the storm.
+        num_workers (int, optional): Number of workers to use.
+        use_threads (bool): Whether to use threads instead of processes.
+        with_tb (bool): Whether to include traceback in error logs.
+        use_parallel_processing (bool): Whether to process storm stats using parallel processing.
+        precision (str): Float dtype of the accumulations and transpositions, "float64" or "float32".
+        cache_bytes (int, optional): Size cap of an on-disk cache of the AORC chunks read from S3, kept in the
+            directory of the first catalog. No cache is used if None.
+        compute_policy (str, optional): Compute policy of the workers, one of `COMPUTE_POLICIES`.
+        compute_threads (int, optional): Threads of each worker process of the "threads" or "shared" policy.
+    """
+    if not catalogs:
+        raise ValueError("At least one catalog is required")
+
+    output_csvs = []
+    for catalog in catalogs:
+        collection_dir = catalog.spm.collection_dir(catalog.spm.storm_collection_id(storm_duration))
+        if not os.path.exists(collection_dir):
+            os.makedirs(collection_dir)
+        output_csv = os.path.join(collection_dir, "storm-stats.csv")
+        if not os.path.exists(output_csv):
+            with open(output_csv, "w", encoding="utf-8") as f:
+                f.write("storm_date,min,mean,max,x,y\n")
+        output_csvs.append(output_csv)
+
+    if not num_workers and not use_threads:
+        num_workers = max(os.cpu_count() - 2, 1)
+    elif not num_workers and use_threads:
+        num_workers = 15
+
+    search_func = partial(storm_search_watersheds, precision=precision)
+    cache_dir, cache_bytes = _configure_aorc_cache(catalogs[0], cache_bytes)
+    files = [open(output_csv, "a", encoding="utf-8") for output_csv in output_csvs]
+
+    def write_results(date: datetime, results: list[dict | None]) -> None:
+        for f, result in zip(files, results):
+            if result is not None:
+                f.write(storm_search_results_to_csv_line(result))
+        logging.info("%s processed for %d catalogs", date.strftime("%Y-%m-%dT%H"), len(catalogs))
+
+    def log_error(date: datetime, e: Exception) -> None:
+        if with_tb:
+            logging.error("Error processing %s: %s\n%s", _dates_label(date), e, traceback.format_exc())
+        else:
+            logging.error("Error processing %s: %s", _dates_label(date), e)
+
+    try:
+        if not use_parallel_processing:
+            logging.info("Processing event stats serially.")
+            with dask.config.set(dask_config(compute_policy, compute_threads)):
+                for date in event_dates:
+                    try:
+                        write_results(date, search_func(catalogs, date, storm_duration))
+                    except Exception as e:
+                        log_error(date, e)
+            return
+
+        logging.info("Using %s cpu's for collecting event stats", num_workers)
+        if use_threads:
+            executor = ThreadPoolExecutor(max_workers=num_workers)
+            thread_config = dask_config(compute_policy, compute_threads)
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=compute_processes(compute_policy, num_workers),
+                initializer=_initialize_worker,
+                initargs=(
+                    _event_year_paths(event_dates, storm_duration, catalogs[0]),
+                    cache_dir,
+                    cache_bytes,
+                    compute_policy,
+                    compute_threads,
+                ),
+            )
+            thread_config = {}
+        with executor, dask.config.set(thread_config):
+            futures = {executor.submit(search_func, catalogs, date, storm_duration): date for date in event_dates}
+            for future in as_completed(futures):
+                try:
+                    write_results(futures[future], future.result())
+                except Exception as e:
+                    log_error(futures[future], e)
+    finally:
+        for f in files:
+            f.close()
+        aorc_registry().log_cache_stats()
 
 
 def create_items(
@@ -760,6 +1348,15 @@ def create_items(
     storm_duration: int = 72,
     num_workers: int = None,
     with_tb: bool = False,
+    alternate_transpositions: int = 0,
+    min_separation: int = 0,
+    rotation_angles: list[float] = None,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    cache_bytes: int = None,
+    compute_policy: str = None,
+    compute_threads: int = None,
+    transpose_engine: str = None,
 ) -> List:
     """
     Create items for storm events, setting the item ID to `por_rank` instead of storm_date.
@@ -771,6 +1368,17 @@ def create_items(
         storm_duration (int): The duration of the storm.
         num_workers (int, optional): Number of workers to use.
         with_tb (bool): Whether to include traceback in error logs.
+        alternate_transpositions (int): Number of runner-up transpositions to record on each item.
+        min_separation (int): Minimum distance in cells between recorded transpositions.
+        rotation_angles (list[float], optional): Rotations of the watershed, in degrees, searched along with
+            translations.
+        precision (str): Float dtype of the AORC accumulations, "float64" or "float32".
+        scratch_dir (str, optional): Directory for memory-mapped transposition scratch arrays.
+        cache_bytes (int, optional): Size cap of the on-disk AORC chunk cache of the catalog. No cache is used if None.
+        compute_policy (str, optional): Compute policy of the worker processes, one of `COMPUTE_POLICIES`.
+        compute_threads (int, optional): Threads of each worker process of the "threads" or "shared" policy.
+        transpose_engine (str, optional): Engine of the transposition search of each item, one of
+            `TRANSPOSE_ENGINES`. Defaults to "loop" for translations and "convolution" for rotations.
 
     Returns
     -------
@@ -791,8 +1399,21 @@ def create_items(
         num_workers = os.cpu_count()
 
     storm_data = [(e["storm_date"], e["por_rank"]) for e in event_dates]
-
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+    cache_dir, cache_bytes = _configure_aorc_cache(catalog, cache_bytes)
+    # fetch the chunks shared by the storms once, before the workers read them
+    _prefetch_windows(catalog, [storm_date for storm_date, _ in storm_data], storm_duration, cache_dir, cache_bytes)
+
+    with ProcessPoolExecutor(
+        max_workers=compute_processes(compute_policy, num_workers),
+        initializer=_initialize_worker,
+        initargs=(
+            _event_year_paths([storm_date for storm_date, _ in storm_data], storm_duration, catalog),
+            cache_dir,
+            cache_bytes,
+            compute_policy,
+            compute_threads,
+        ),
+    ) as executor:
         futures = [
             executor.submit(
                 storm_search,
@@ -802,6 +1423,12 @@ def create_items(
                 por_rank=por_rank,
                 collection_id=collection_id,
                 return_item=True,
+                alternate_transpositions=alternate_transpositions,
+                min_separation=min_separation,
+                rotation_angles=rotation_angles,
+                precision=precision,
+                scratch_dir=scratch_dir,
+                transpose_engine=transpose_engine,
             )
             for storm_date, por_rank in storm_data
         ]
@@ -820,9 +1447,53 @@ def create_items(
                 else:
                     logging.error("Error processing: %s", e)
 
+    aorc_registry().log_cache_stats()
     return event_items
 
 
+def extract_catalog_aorc(
+    catalog: Union[str | StormCatalog],
+    start_year: int = 1979,
+    end_year: int = None,
+    variables: list[str] = None,
+    compressor: Any = None,
+    cumulative: bool = True,
+) -> list[str]:
+    """
+    Extract the AORC data of the transposition region of a catalog into its local AORC store.
+
+    Storm searches of the catalog read the local store rather than S3 for the years it covers. Years already extracted
+    are skipped, so an interrupted extraction can be run again to resume it. A cumulative precipitation cube of the
+    years is built as well, so the accumulation of any storm is the difference of two hours of the cube.
+
+    Args:
+        catalog (Union[str | StormCatalog]): The storm catalog or path to the catalog file.
+        start_year (int): The first year to extract.
+        end_year (int, optional): The last year to extract. Defaults to the current year.
+        variables (list[str], optional): The variables to extract. Defaults to precipitation.
+        compressor (numcodecs.abc.Codec, optional): The compressor of the local store.
+        cumulative (bool): Whether to build the cumulative precipitation cube of the local store.
+
+    Returns
+    -------
+        list[str]: The paths of the local year stores.
+    """
+    if isinstance(catalog, str):
+        catalog = StormCatalog.from_file(catalog)
+    end_year = end_year or datetime.now().year
+    paths = extract_aorc_region(
+        catalog.spm.aorc_store_dir,
+        shape(catalog.transposition_region.geometry),
+        start_year,
+        end_year,
+        variables=variables,
+        compressor=compressor,
+    )
+    if cumulative:
+        build_cumulative_cube(catalog.spm.aorc_store_dir, start_year, end_year)
+    return paths
+
+
 def init_storm_catalog(
     catalog_id: str, config: dict, local_catalog_dir: str, create_valid_transposition_region: bool = False
 ) -> pystac.Catalog:
@@ -864,12 +1535,14 @@ def init_storm_catalog(
         hydro_domain_type="watershed",
         description=watershed_config.get("description"),
         title="Watershed",
+        subbasins=watershed_config.get("subbasins_file"),
+        subbasin_name_field=watershed_config.get("subbasin_name_field"),
     )
     watershed.save_object(dest_href=spm.catalog_asset(watershed_config.get("id")), include_self_link=False)
 
     if create_valid_transposition_region:
         logging.info("Creating `valid_transposition_region` item for catalog: %s", catalog_id)
-        vtr_polygon = valid_spaces_item(watershed, transposition_region)
+        vtr_polygon = valid_spaces_item(watershed, transposition_region, plan_dir=spm.transposition_plan_dir)
         vtr_id = f"{tr_config.get('id')}_valid"
         vtr = HydroDomain(
             item_id=vtr_id,
@@ -1024,6 +1697,14 @@ def new_collection(
     num_workers: int = None,
     with_tb: bool = False,
     create_new_items: bool = True,
+    batch_size: int = 1,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    pipeline: bool = False,
+    cache_bytes: int = None,
+    compute_policy: str = None,
+    compute_threads: int = None,
+    transpose_engine: str = None,
 ):
     """
     Create a new storm collection.
@@ -1040,6 +1721,17 @@ def new_collection(
         num_workers (int, optional): Number of cpu's to use during processing.
         with_tb (bool): Whether to include traceback in error logs.
         create_new_items (bool): Create items (or skip if items exist)
+        batch_size (int): Number of consecutive dates searched together when collecting event stats.
+        precision (str): Float dtype used when collecting event stats, "float64" or "float32".
+        scratch_dir (str, optional): Directory for memory-mapped transposition scratch files.
+        pipeline (bool): Whether to collect event stats by streaming the AORC data of each year once, rather than
+            reading the accumulation of each date (or block of `batch_size` dates) on its own.
+        cache_bytes (int, optional): Size cap of the on-disk AORC chunk cache of the catalog, shared by the event stats
+            and items. No cache is used if None.
+        compute_policy (str, optional): Compute policy of the worker processes, one of `COMPUTE_POLICIES`.
+        compute_threads (int, optional): Threads of each worker process of the "threads" or "shared" policy.
+        transpose_engine (str, optional): Engine of the transposition searches of the event stats and items, one of
+            `TRANSPOSE_ENGINES`. The "convolution" engine is much faster than the exact "loop" search.
     """
     initialize_logger()
 
@@ -1054,7 +1746,7 @@ def new_collection(
         end_date = datetime.now().strftime("%Y-%m-%dT%H")
 
     # logging.info(f"specific_dates: {specific_dates}")
-    if not specific_dates:
+    if specific_dates is None:
         logging.info("Generating date range from %s to %s", start_date, end_date)
         dates = generate_date_range(start_date, end_date, every_n_hours=check_every_n_hours)
     elif len(specific_dates) > 0:
@@ -1073,7 +1765,20 @@ def new_collection(
     if dates:
         logging.info("Collecting event stats for %d dates", len(dates))
         collect_event_stats(
-            dates, storm_catalog, collection_id, storm_duration, num_workers=num_workers, with_tb=with_tb
+            dates,
+            storm_catalog,
+            collection_id,
+            storm_duration,
+            num_workers=num_workers,
+            with_tb=with_tb,
+            batch_size=batch_size,
+            precision=precision,
+            scratch_dir=scratch_dir,
+            pipeline=pipeline,
+            cache_bytes=cache_bytes,
+            compute_policy=compute_policy,
+            compute_threads=compute_threads,
+            transpose_engine=transpose_engine,
         )
     stats_csv = os.path.join(storm_catalog.spm.collection_dir(collection_id), "storm-stats.csv")
     try:
@@ -1089,7 +1794,16 @@ def new_collection(
 
     if create_new_items:
         event_items = create_items(
-            top_events.to_dict(orient="records"), storm_catalog, storm_duration=storm_duration, with_tb=with_tb
+            top_events.to_dict(orient="records"),
+            storm_catalog,
+            storm_duration=storm_duration,
+            with_tb=with_tb,
+            precision=precision,
+            scratch_dir=scratch_dir,
+            cache_bytes=cache_bytes,
+            compute_policy=compute_policy,
+            compute_threads=compute_threads,
+            transpose_engine=transpose_engine,
         )
         collection = storm_catalog.new_collection_from_items(collection_id, event_items)
 
@@ -1115,6 +1829,14 @@ def resume_collection(
     num_workers: int = None,
     with_tb: bool = False,
     create_items: bool = True,
+    batch_size: int = 1,
+    precision: str = "float64",
+    scratch_dir: str = None,
+    pipeline: bool = False,
+    cache_bytes: int = None,
+    compute_policy: str = None,
+    compute_threads: int = None,
+    transpose_engine: str = None,
 ):
     """
     Resume a storm collection.
@@ -1129,6 +1851,17 @@ def resume_collection(
         check_every_n_hours (int): The interval in hours to check for storms.
         num_workers (int, optional): Number of cpu's to use during processing.
         with_tb (bool): Whether to include traceback in error logs.
+        batch_size (int): Number of consecutive dates searched together when collecting event stats.
+        precision (str): Float dtype used when collecting event stats, "float64" or "float32".
+        scratch_dir (str, optional): Directory for memory-mapped transposition scratch files.
+        pipeline (bool): Whether to collect event stats by streaming the AORC data of each year once, rather than
+            reading the accumulation of each date (or block of `batch_size` dates) on its own.
+        cache_bytes (int, optional): Size cap of the on-disk AORC chunk cache of the catalog, shared by the event stats
+            and items. No cache is used if None.
+        compute_policy (str, optional): Compute policy of the worker processes, one of `COMPUTE_POLICIES`.
+        compute_threads (int, optional): Threads of each worker process of the "threads" or "shared" policy.
+        transpose_engine (str, optional): Engine of the transposition searches of the event stats and items, one of
+            `TRANSPOSE_ENGINES`. The "convolution" engine is much faster than the exact "loop" search.
     """
     initialize_logger()
     storm_catalog = StormCatalog.from_file(catalog)
@@ -1154,4 +1887,12 @@ def resume_collection(
         num_workers=num_workers,
         with_tb=with_tb,
         create_new_items=create_items,
+        batch_size=batch_size,
+        precision=precision,
+        scratch_dir=scratch_dir,
+        pipeline=pipeline,
+        cache_bytes=cache_bytes,
+        compute_policy=compute_policy,
+        compute_threads=compute_threads,
+        transpose_engine=transpose_engine,
     )
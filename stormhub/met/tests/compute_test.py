@@ -0,0 +1,62 @@
+"""Testing compute policies."""
+
+import multiprocessing
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import dask
+
+from stormhub.met.compute import compute_processes, compute_threads, configure_compute, dask_config
+
+
+def _worker_compute_settings() -> tuple:
+    """Report the dask scheduler and thread environment of a worker process."""
+    return dask.config.get("scheduler"), dask.config.get("num_workers", None), os.environ["OMP_NUM_THREADS"]
+
+
+class TestComputePolicy(unittest.TestCase):
+    def test_threads_and_processes_of_policies(self):
+        """
+        Test the threads and processes of each compute policy.
+        """
+        self.assertEqual(compute_threads("synchronous", 8), 1)
+        self.assertEqual(compute_threads("threads"), 2)
+        self.assertEqual(compute_threads("threads", 4), 4)
+        self.assertEqual(compute_threads("shared"), os.cpu_count())
+        self.assertEqual(compute_processes("threads", 16), 16)
+        self.assertEqual(compute_processes("shared", 16), 1)
+        self.assertEqual(dask_config("synchronous"), {"scheduler": "synchronous"})
+        self.assertEqual(dask_config("threads", 3), {"scheduler": "threads", "num_workers": 3})
+        with self.assertRaises(ValueError):
+            compute_threads("processes")
+        with self.assertRaises(ValueError):
+            compute_threads("threads", 0)
+
+    def test_no_policy_keeps_defaults(self):
+        """
+        Test that no policy leaves the processes and dask scheduler as they are.
+        """
+        self.assertEqual(compute_processes(None, 16), 16)
+        self.assertEqual(dask_config(None), {})
+        scheduler = dask.config.get("scheduler", None)
+        configure_compute(None)
+        self.assertEqual(dask.config.get("scheduler", None), scheduler)
+
+    def test_configures_worker_processes(self):
+        """
+        Test that a pool initializer applies the policy to the dask scheduler and thread variables of its workers.
+        """
+        for policy, expected in (("synchronous", ("synchronous", None, "1")), ("threads", ("threads", 3, "3"))):
+            # spawn, as forking after numba has started its threading layer in this process can hang
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=configure_compute,
+                initargs=(policy, 3),
+            ) as executor:
+                self.assertEqual(executor.submit(_worker_compute_settings).result(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
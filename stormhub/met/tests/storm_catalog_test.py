@@ -0,0 +1,318 @@
+"""Testing storm searches of a catalog against AORC data held in memory."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+from affine import Affine
+from shapely import box
+
+from stormhub.hydro_domain import _read_subbasins, load_subbasins
+from stormhub.met.aorc.cumulative import CumulativeCube
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import MemoryAORCSource, set_aorc_source
+from stormhub.met.rotation import rotation_angles
+from stormhub.met.storm_catalog import (
+    StormCatalog,
+    _event_year_paths,
+    collect_event_stats,
+    collect_watersheds_event_stats,
+    extract_catalog_aorc,
+    new_catalog,
+    storm_search,
+    storm_search_batch,
+    storm_search_stream,
+)
+from stormhub.met.tests.transpose_test import (
+    create_test_data_array,
+    create_test_transposition_domain_polygon,
+    create_test_watershed_polygon,
+    save_polygon_to_geojson,
+)
+
+STORM_DURATION = 24
+
+
+def create_test_aorc_source(start: str = "1980-05-01", hours: int = 24 * 10) -> MemoryAORCSource:
+    """
+    Create a memory AORC source of random hourly precipitation on the test grid, including the hours searched for the
+    valid transposition region of a new catalog.
+    """
+    grid = create_test_data_array(create_test_transposition_domain_polygon(), 0.5)
+    times = pd.date_range(start, periods=hours, freq="h")
+    data = np.random.default_rng(0).random((hours, *grid.shape)) * np.isfinite(grid.to_numpy())
+    ds = xr.Dataset(
+        {"APCP_surface": (("time", "latitude", "longitude"), data)},
+        coords={"time": times, "latitude": grid["latitude"], "longitude": grid["longitude"]},
+    ).rio.write_crs("EPSG:4326")
+    return MemoryAORCSource({times[0].year: ds})
+
+
+def create_test_catalog(directory: str, catalog_id: str = "test", watershed_config: dict = None) -> StormCatalog:
+    """
+    Create a storm catalog of the test watershed and transposition domain.
+    """
+    input_dir = os.path.join(directory, f"{catalog_id}-input")
+    os.makedirs(input_dir)
+    watershed_file = os.path.join(input_dir, "watershed.geojson")
+    domain_file = os.path.join(input_dir, "domain.geojson")
+    save_polygon_to_geojson(create_test_watershed_polygon(), watershed_file)
+    save_polygon_to_geojson(create_test_transposition_domain_polygon(), domain_file)
+    config = {
+        "watershed": {"id": "watershed", "geometry_file": watershed_file, "description": "Test watershed"},
+        "transposition_region": {"id": "domain", "geometry_file": domain_file, "description": "Test domain"},
+    }
+    config["watershed"].update(watershed_config or {})
+    config_file = os.path.join(input_dir, "config.json")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return new_catalog(catalog_id, config_file, directory)
+
+
+def storm_stats_csv(catalog: StormCatalog) -> str:
+    """
+    Get the path of the storm stats of the collection of the test duration.
+    """
+    return os.path.join(catalog.spm.collection_dir(catalog.spm.storm_collection_id(STORM_DURATION)), "storm-stats.csv")
+
+
+def read_storm_stats(catalog: StormCatalog) -> pd.DataFrame:
+    """
+    Read the storm stats of the collection of the test duration, in storm date order.
+    """
+    stats = pd.read_csv(storm_stats_csv(catalog))
+    return stats.sort_values("storm_date").reset_index(drop=True)
+
+
+class StormCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        set_aorc_source(create_test_aorc_source())
+        self.catalog = create_test_catalog(self.directory.name)
+        self.dates = [datetime(1980, 5, 1) + timedelta(hours=6 * i) for i in range(8)]
+
+    def tearDown(self):
+        set_aorc_source(None)
+        aorc_registry().clear()
+        self.directory.cleanup()
+
+    def assertResultsEqual(self, results: list[dict], expected: list[dict]):
+        self.assertEqual([r["storm_date"] for r in results], [r["storm_date"] for r in expected])
+        for result, expected_result in zip(results, expected):
+            self.assertEqual(result["aorc:statistics"], expected_result["aorc:statistics"])
+            self.assertTrue(result["centroid"].equals_exact(expected_result["centroid"], 1e-9))
+
+
+class TestStormSearchBatch(StormCatalogTestCase):
+    def test_batch_matches_each_date(self):
+        """
+        Test a block of dates searched together against searching each date alone.
+        """
+        expected = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        self.assertResultsEqual(storm_search_batch(self.catalog, self.dates, STORM_DURATION), expected)
+
+    def test_batch_searches_dates_alone_after_failure(self):
+        """
+        Test that a block that cannot be read together is searched one date at a time, dropping unreadable dates.
+        """
+        dates = self.dates + [datetime(1980, 6, 1)]
+        expected = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        with self.assertLogs(level="ERROR"):
+            results = storm_search_batch(self.catalog, dates, STORM_DURATION)
+        self.assertResultsEqual(results, expected)
+
+    def test_collect_event_stats_in_blocks(self):
+        """
+        Test that the event stats collected in blocks of dates, by threads, match those collected date by date.
+        """
+        collect_event_stats(
+            self.dates, self.catalog, storm_duration=STORM_DURATION, use_parallel_processing=False, batch_size=1
+        )
+        expected = read_storm_stats(self.catalog)
+        os.remove(storm_stats_csv(self.catalog))
+        collect_event_stats(
+            self.dates,
+            self.catalog,
+            storm_duration=STORM_DURATION,
+            num_workers=2,
+            use_threads=True,
+            batch_size=3,
+        )
+        pd.testing.assert_frame_equal(read_storm_stats(self.catalog), expected)
+        self.assertEqual(len(expected), len(self.dates))
+
+
+class TestStormSearchStream(StormCatalogTestCase):
+    def test_stream_matches_each_date(self):
+        """
+        Test dates searched by streaming the AORC data once against searching each date alone.
+        """
+        expected = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        self.assertResultsEqual(storm_search_stream(self.catalog, self.dates, STORM_DURATION, batch_size=3), expected)
+
+    def test_collect_event_stats_pipeline(self):
+        """
+        Test that the event stats collected by streaming match those collected date by date, warning of a date whose
+        storm runs past the end of the data.
+        """
+        collect_event_stats(self.dates, self.catalog, storm_duration=STORM_DURATION, use_parallel_processing=False)
+        expected = read_storm_stats(self.catalog)
+        os.remove(storm_stats_csv(self.catalog))
+        with self.assertLogs(level="WARNING") as logs:
+            collect_event_stats(
+                self.dates + [datetime(1980, 5, 10, 12)],
+                self.catalog,
+                storm_duration=STORM_DURATION,
+                use_parallel_processing=False,
+                pipeline=True,
+            )
+        self.assertIn("Hours missing from the AORC data for the window after 1980-05-10 12:00:00", logs.output[-1])
+        pd.testing.assert_frame_equal(read_storm_stats(self.catalog), expected)
+
+
+class TestStormSearchItem(StormCatalogTestCase):
+    def test_saves_rotated_item(self):
+        """
+        Test that an item searched with rotations, and its alternate transpositions, is saved with its transforms.
+        """
+        item = storm_search(
+            self.catalog,
+            self.dates[0],
+            STORM_DURATION,
+            por_rank=1,
+            return_item=True,
+            alternate_transpositions=2,
+            rotation_angles=list(rotation_angles(10, 5)),
+        )
+        self.assertEqual(item._search_engine(), "convolution")
+        collection_id = self.catalog.spm.storm_collection_id(STORM_DURATION)
+        with open(self.catalog.spm.collection_item(collection_id, item.id), encoding="utf-8") as f:
+            properties = json.load(f)["properties"]
+        transform = Affine(*(properties["aorc:transform"][term] for term in "abcdef"))
+        self.assertEqual(transform, item.max_transpose()[1])
+        self.assertIn(properties["aorc:rotation"], [-10, -5, 0, 5, 10])
+        self.assertEqual([t["rank"] for t in properties["aorc:alternate_transforms"]], [2, 3])
+
+
+class TestSubbasinHyetographs(StormCatalogTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        set_aorc_source(create_test_aorc_source())
+        watershed = create_test_watershed_polygon()
+        subbasins_file = os.path.join(self.directory.name, "subbasins.geojson")
+        gpd.GeoDataFrame(
+            {"name": ["west", "east"]},
+            geometry=[watershed.intersection(box(0, 0, 2.5, 5)), watershed.intersection(box(2.5, 0, 5, 5))],
+            crs="EPSG:4326",
+        ).to_file(subbasins_file, driver="GeoJSON")
+        self.catalog = create_test_catalog(
+            self.directory.name, watershed_config={"subbasins_file": subbasins_file, "subbasin_name_field": "name"}
+        )
+        self.dates = [datetime(1980, 5, 1), datetime(1980, 5, 2)]
+
+    def test_load_subbasins_reads_file_once(self):
+        """
+        Test that the sub-basins of a watershed are loaded by name, reading the file once.
+        """
+        _read_subbasins.cache_clear()
+        subbasins = load_subbasins(self.catalog.watershed)
+        self.assertEqual(list(subbasins), ["west", "east"])
+        self.assertAlmostEqual(
+            sum(subbasin.area for subbasin in subbasins.values()), create_test_watershed_polygon().area
+        )
+        self.assertEqual(load_subbasins(self.catalog.watershed), subbasins)
+        self.assertEqual(_read_subbasins.cache_info().misses, 1)
+
+    def test_hyetographs_match_storm_mean(self):
+        """
+        Test that the hyetographs of the sub-basins of searched items average to the storm mean, with the sub-basins
+        rasterized once for the catalog.
+        """
+        subbasins = list(load_subbasins(self.catalog.watershed).values())
+        items = [
+            storm_search(self.catalog, date, STORM_DURATION, por_rank=rank, return_item=True)
+            for rank, date in enumerate(self.dates, start=1)
+        ]
+        labels = items[0].transpose.subbasin_labels(subbasins)
+        self.assertIs(items[1].transpose.subbasin_labels(subbasins), labels)
+        cells = np.bincount(labels.ravel(), minlength=3)[1:]
+        for item in items:
+            hyetographs = pd.read_csv(
+                os.path.join(item.local_directory, f"{item.id}.subbasin-hyetographs.csv"), index_col="time"
+            )
+            self.assertEqual(list(hyetographs.columns), ["west", "east"])
+            self.assertEqual(len(hyetographs), STORM_DURATION)
+            mean = (hyetographs.sum().to_numpy() * cells).sum() / cells.sum()
+            self.assertAlmostEqual(mean, item.properties["aorc:statistics"]["mean"], delta=0.006)
+
+
+class TestCollectWatershedsEventStats(StormCatalogTestCase):
+    def test_matches_each_catalog(self):
+        """
+        Test that the event stats of catalogs collected together match those of each catalog collected alone.
+        """
+        nested_file = os.path.join(self.directory.name, "nested.geojson")
+        save_polygon_to_geojson(box(2.5, 1.5, 3.5, 2.5), nested_file)
+        nested = create_test_catalog(self.directory.name, "nested", {"geometry_file": nested_file})
+        catalogs = [self.catalog, nested]
+        expected = []
+        for catalog in catalogs:
+            collect_event_stats(self.dates, catalog, storm_duration=STORM_DURATION, use_parallel_processing=False)
+            expected.append(read_storm_stats(catalog))
+            os.remove(storm_stats_csv(catalog))
+        self.assertFalse(expected[0].equals(expected[1]))
+
+        collect_watersheds_event_stats(
+            self.dates, catalogs, storm_duration=STORM_DURATION, num_workers=2, use_threads=True
+        )
+        for catalog, catalog_expected in zip(catalogs, expected):
+            pd.testing.assert_frame_equal(read_storm_stats(catalog), catalog_expected)
+
+
+class TestExtractCatalogAORC(StormCatalogTestCase):
+    def test_searches_read_local_store(self):
+        """
+        Test that searches of a catalog whose AORC data was extracted read the local store, as do the worker processes
+        warmed for them, and match searches of the source.
+        """
+        expected = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        self.assertEqual(_event_year_paths(self.dates, STORM_DURATION, self.catalog), ["memory://aorc/1980.zarr"])
+        paths = extract_catalog_aorc(self.catalog, 1980, 1980, cumulative=False)
+        self.assertEqual(paths, [os.path.join(self.catalog.spm.aorc_store_dir, "1980.zarr")])
+        self.assertEqual(_event_year_paths(self.dates, STORM_DURATION, self.catalog), paths)
+        # the source no longer has the year, so the searches can only read the local store
+        set_aorc_source(MemoryAORCSource())
+        aorc_registry().clear()
+        self.assertResultsEqual([storm_search(self.catalog, date, STORM_DURATION) for date in self.dates], expected)
+
+    def test_searches_read_cumulative_cube(self):
+        """
+        Test that searches of a catalog with a cumulative cube sum each storm from the cube, opened once, and match
+        searches of the source.
+        """
+        expected = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        extract_catalog_aorc(self.catalog, 1980, 1980)
+        # neither the source nor the local store has the year, so the searches can only read the cube
+        shutil.rmtree(os.path.join(self.catalog.spm.aorc_store_dir, "1980.zarr"))
+        set_aorc_source(MemoryAORCSource())
+        aorc_registry().clear()
+        results = [storm_search(self.catalog, date, STORM_DURATION) for date in self.dates]
+        self.assertEqual([r["storm_date"] for r in results], [r["storm_date"] for r in expected])
+        for result, expected_result in zip(results, expected):
+            for stat in ("min", "mean", "max"):
+                self.assertAlmostEqual(
+                    result["aorc:statistics"][stat], expected_result["aorc:statistics"][stat], delta=0.011
+                )
+        cube = CumulativeCube.from_store(self.catalog.spm.aorc_store_dir)
+        self.assertIs(CumulativeCube.from_store(self.catalog.spm.aorc_store_dir), cube)
+
+
+if __name__ == "__main__":
+    unittest.main()
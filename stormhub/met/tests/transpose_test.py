@@ -1,16 +1,23 @@
 """Testing functions."""
 
+import os
+import tempfile
 import unittest
 from math import floor
 
 import fiona
 import numpy as np
+import pandas as pd
 import rioxarray
 import xarray as xr
 from affine import Affine
-from shapely import Polygon
+from shapely import Polygon, box
+from shapely.affinity import affine_transform
 
-from stormhub.met.transpose import Transpose
+from stormhub.met.kernels import correlate_mask, correlate_masks, evaluate_kernels
+from stormhub.met.rotation import local_rotation, max_rotated_transpose, rotation_angles, top_rotated_transpositions
+from stormhub.met.sst import StochasticStormTransposition
+from stormhub.met.transpose import Transpose, TranspositionPlan, max_transpose_watersheds
 
 
 def shapely_polygon_to_geojson(polygon: Polygon) -> dict:
@@ -104,6 +111,26 @@ def create_test_data_array(transposition_domain_polygon: Polygon, res: float) ->
     return rio_da
 
 
+def create_test_aorc_stores(directory: str, years: list[int], hours: int = 48) -> list[str]:
+    """
+    Write yearly AORC-like Zarr stores of hourly precipitation on the test grid, starting at the start of each year.
+    """
+    grid = create_test_data_array(create_test_transposition_domain_polygon(), 0.5)
+    paths = []
+    for year in years:
+        times = pd.date_range(f"{year}-01-01", periods=hours, freq="h")
+        rng = np.random.default_rng(year)
+        data = rng.random((hours, *grid.shape)) * grid.to_numpy()
+        ds = xr.Dataset(
+            {"APCP_surface": (("time", "latitude", "longitude"), data, {"crs": "EPSG:4326"})},
+            coords={"time": times, "latitude": grid["latitude"], "longitude": grid["longitude"]},
+        )
+        path = os.path.join(directory, f"{year}.zarr")
+        ds.to_zarr(path, consolidated=True)
+        paths.append(path)
+    return paths
+
+
 class TestTransposeFunction(unittest.TestCase):
     def setUp(self):
         self.watershed = create_test_watershed_polygon()
@@ -151,5 +178,419 @@ class TestTransposeFunction(unittest.TestCase):
         self.assertEqual(max_affine, test_affine)
 
 
+class TestTransposeConvolutionEngine(TestTransposeFunction):
+    engine = "convolution"
+
+    def setUp(self):
+        super().setUp()
+        self.transpose = Transpose(self.data_array, self.watershed, "longitude", "latitude", engine=self.engine)
+
+    def test_shift_means_match_masked_means(self):
+        """
+        Test the correlated means against the masked mean of each valid shift.
+        """
+        means = self.transpose.shift_means()
+        window = self.transpose.watershed_window
+        for x_delta, y_delta in self.transpose.valid_shifts:
+            expected = np.nanmean(self.transpose._shifted_window(x_delta, y_delta))
+            self.assertAlmostEqual(means[window.row_off + y_delta, window.col_off + x_delta], expected)
+
+    def test_valid_shifts_match_loop(self):
+        """
+        Test the vectorized valid shifts against the loop engine.
+        """
+        loop = Transpose(self.data_array, self.watershed, "longitude", "latitude", engine="loop")
+        self.assertEqual(self.transpose.valid_shifts.shape[1], 2)
+        np.testing.assert_array_equal(self.transpose.valid_shifts, loop.valid_shifts)
+
+    def test_ties_match_loop(self):
+        """
+        Test that shifts with equal means are broken by the order of the valid shifts, as by the loop engine.
+        """
+        # on a finer grid the FFT means of a uniform field differ in their last bits
+        data_array = create_test_data_array(self.transposition_domain, 0.5)
+        flat = data_array.copy(data=np.where(np.isfinite(data_array.to_numpy()), 0.1, np.nan))
+        expected = Transpose(flat, self.watershed, "longitude", "latitude", engine="loop").max_transpose()[1]
+        transpose = Transpose(flat, self.watershed, "longitude", "latitude", engine=self.engine)
+        self.assertEqual(transpose.max_transpose()[1], expected)
+        self.assertEqual(transpose.top_transpositions(1)[0][1], expected)
+        self.assertEqual(transpose.max_transpose_batch(np.stack([flat.to_numpy()] * 2))[1][1], expected)
+        self.assertEqual(max_transpose_watersheds(flat, [self.watershed], "longitude", "latitude")[0][1], expected)
+
+    def test_valid_spaces_match_rolled_masks(self):
+        """
+        Test the dilated valid spaces against the union of the shifted watershed masks.
+        """
+        expected = np.full(self.transpose.watershed_mask.shape, False)
+        for shift in self.transpose.valid_shifts:
+            expected |= np.roll(self.transpose.watershed_mask, shift, axis=(1, 0))
+        np.testing.assert_array_equal(self.transpose.valid_spaces, expected)
+
+    def test_shift_statistics(self):
+        """
+        Test the statistic kernels against masked statistics of each valid shift.
+        """
+        stats = self.transpose.shift_statistics(["mean", "min", "max", "p90", "wet_fraction", "sum"])
+        for i, (x_delta, y_delta) in enumerate(self.transpose.valid_shifts):
+            window = self.transpose._shifted_window(x_delta, y_delta)
+            values = window.compressed()
+            self.assertAlmostEqual(stats["mean"][i], values.mean())
+            self.assertAlmostEqual(stats["min"][i], values.min())
+            self.assertAlmostEqual(stats["max"][i], values.max())
+            self.assertAlmostEqual(stats["p90"][i], np.percentile(values, 90))
+            self.assertAlmostEqual(stats["wet_fraction"][i], (values > 0).mean())
+            self.assertAlmostEqual(stats["sum"][i], values.sum())
+
+    def test_volume_uses_cell_area(self):
+        """
+        Test that the volume kernel scales the sum by the area of a grid cell.
+        """
+        data_array = create_test_data_array(self.transposition_domain, 0.5)
+        transpose = Transpose(data_array, self.watershed, "longitude", "latitude", engine=self.engine)
+        stats = transpose.shift_statistics(["sum", "volume"])
+        np.testing.assert_allclose(stats["volume"], stats["sum"] * 0.25)
+        with self.assertRaises(ValueError):
+            evaluate_kernels(data_array.to_numpy(), transpose.watershed_mask_clipped, [0], [0], ["volume"])
+
+    def test_max_transpose_rank_by(self):
+        max_value = self.transpose.max_transpose(np.min, rank_by="min")[2]
+        self.assertEqual(max_value, self.transpose.shift_statistics(["min"])["min"].max())
+
+    def test_top_transpositions(self):
+        """
+        Test that the top transposition matches the max transpose and that separation is respected.
+        """
+        top = self.transpose.top_transpositions(3, func=np.mean)
+        self.assertEqual(top[0][1], self.transpose.max_transpose()[1])
+        self.assertEqual([t[2] for t in top], sorted([t[2] for t in top], reverse=True))
+        separated = self.transpose.top_transpositions(len(self.transpose.valid_shifts), min_separation=2)
+        shifts = np.array([(aff.c, aff.f) for _, aff, _ in separated])
+        for i in range(len(shifts)):
+            for j in range(i):
+                self.assertGreaterEqual(np.abs(shifts[i] - shifts[j]).max(), 2)
+
+    def test_max_transpose_batch(self):
+        """
+        Test each layer of a batched transposition against transposing that layer alone.
+        """
+        layers = [self.data_array, self.data_array.copy(data=self.data_array.to_numpy()[::-1, ::-1])]
+        stack = xr.concat(layers, dim="time")
+        for layer, result in zip(layers, self.transpose.max_transpose_batch(stack, np.max)):
+            expected = Transpose(layer, self.watershed, "longitude", "latitude").max_transpose(np.max)
+            self.assertEqual(result[1], expected[1])
+            self.assertEqual(result[2], expected[2])
+            self.assertTrue(result[0].equals(expected[0]))
+
+    def test_float32_memmap_matches_float64(self):
+        """
+        Test a float32 transposition with memory-mapped scratch arrays against the float64 transposition.
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            transpose = Transpose(
+                self.data_array,
+                self.watershed,
+                "longitude",
+                "latitude",
+                engine=self.engine,
+                dtype="float32",
+                scratch_dir=scratch_dir,
+            )
+            self.assertEqual(transpose.shift_means().dtype, np.float32)
+            result = transpose.max_transpose(np.max)
+        expected = self.transpose.max_transpose(np.max)
+        self.assertEqual(result[1], expected[1])
+        self.assertAlmostEqual(result[2], expected[2], places=5)
+
+    def test_scratch_correlates_in_tiles(self):
+        """
+        Test that tiled correlations with a scratch directory match the whole grid correlations.
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            transpose = Transpose(
+                self.data_array,
+                self.watershed,
+                "longitude",
+                "latitude",
+                engine=self.engine,
+                tile_size=(1, 2),
+                scratch_dir=scratch_dir,
+            )
+            np.testing.assert_array_equal(transpose.valid_shifts, self.transpose.valid_shifts)
+            np.testing.assert_allclose(transpose.shift_means(), self.transpose.shift_means())
+
+    def test_invalid_engine(self):
+        with self.assertRaises(ValueError):
+            Transpose(self.data_array, self.watershed, "longitude", "latitude", engine="unknown")
+
+
+class TestTransposeNumbaEngine(TestTransposeConvolutionEngine):
+    """Runs with the convolution engine when numba is not installed."""
+
+    engine = "numba"
+
+
+class TestTransposeBranchAndBoundEngine(TestTransposeConvolutionEngine):
+    engine = "branch_and_bound"
+
+    def test_matches_exhaustive_search_with_pruning(self):
+        """
+        Test branch-and-bound against the exhaustive search on a larger random grid.
+        """
+        rng = np.random.default_rng(0)
+        rows, cols = np.mgrid[0:60, 0:80]
+        data = 100 * np.exp(-((rows - 40) ** 2 + (cols - 15) ** 2) / 50) + rng.gamma(2.0, 1.0, size=(60, 80))
+        data[:5, :] = np.nan
+        data_array = xr.DataArray(
+            data,
+            dims=["latitude", "longitude"],
+            coords={"latitude": np.arange(60) + 0.5, "longitude": np.arange(80) + 0.5},
+        ).rio.write_crs("EPSG:4326")
+        watershed = Polygon([(30, 20), (36, 22), (38, 29), (31, 30)])
+        exhaustive = Transpose(data_array, watershed, "longitude", "latitude", engine="convolution")
+        pruned = Transpose(data_array, watershed, "longitude", "latitude", engine=self.engine, block_size=4)
+        self.assertEqual(pruned.max_transpose()[1], exhaustive.max_transpose()[1])
+        report = pruned.search_report
+        # validity is only evaluated within refined blocks, never over the whole grid
+        self.assertIsNone(pruned._valid_shifts)
+        mask_rows, mask_cols = pruned.watershed_mask_clipped.shape
+        self.assertEqual(report["candidates"], (60 - mask_rows + 1) * (80 - mask_cols + 1))
+        self.assertEqual(report["evaluated"] + report["pruned"], report["candidates"])
+        self.assertGreater(report["pruned"], 0)
+
+
+class TestTransposeChunkedEngine(TestTransposeConvolutionEngine):
+    engine = "chunked"
+
+    def setUp(self):
+        super().setUp()
+        self.data_array = self.data_array.chunk({"latitude": 2, "longitude": 2})
+        self.transpose = Transpose(
+            self.data_array, self.watershed, "longitude", "latitude", engine=self.engine, tile_size=(1, 2)
+        )
+
+    def test_whole_grid_not_loaded(self):
+        self.transpose.max_transpose(np.max)
+        self.transpose.valid_spaces_polygon
+        self.assertIsNone(self.transpose._valid_shifts)
+        self.assertIsNone(self.transpose._np_data_array)
+
+
+class TestSubbasinMeans(unittest.TestCase):
+    def setUp(self):
+        self.watershed = create_test_watershed_polygon()
+        self.transposition_domain = create_test_transposition_domain_polygon()
+        self.data_array = create_test_data_array(self.transposition_domain, 0.5)
+        self.transpose = Transpose(self.data_array, self.watershed, "longitude", "latitude", engine="convolution")
+        min_x, min_y, max_x, max_y = self.watershed.bounds
+        self.subbasins = [
+            self.watershed.intersection(box(min_x, min_y, 2.5, max_y)),
+            self.watershed.intersection(box(2.5, min_y, max_x, max_y)),
+        ]
+
+    def test_labels_cover_watershed_mask(self):
+        """
+        Test that sub-basins tiling the watershed label every cell of the watershed mask.
+        """
+        labels = self.transpose.subbasin_labels(self.subbasins)
+        self.assertEqual(labels.shape, self.transpose.watershed_mask_clipped.shape)
+        np.testing.assert_array_equal(labels > 0, self.transpose.watershed_mask_clipped)
+        self.assertEqual(set(np.unique(labels)), {0, 1, 2})
+
+    def test_means_match_masked_means(self):
+        """
+        Test the bincount sub-basin means of each layer against masked means of the shifted window.
+        """
+        grid = self.data_array.to_numpy()
+        stack = np.stack([grid, grid[::-1, ::-1], grid * 2])
+        stack[1, 0, :] = np.nan
+        labels = self.transpose.subbasin_labels(self.subbasins)
+        x_delta, y_delta = self.transpose.valid_shifts[-1]
+        means = self.transpose.subbasin_means(labels, stack, x_delta, y_delta, count=3)
+        self.assertEqual(means.shape, (3, 3))
+        self.assertTrue(np.isnan(means[:, 2]).all())
+        for layer in range(3):
+            window = self.transpose._shifted_window(x_delta, y_delta, stack[layer]).data
+            for label in (1, 2):
+                self.assertAlmostEqual(means[layer, label - 1], np.nanmean(window[labels == label]))
+
+
+class TestTranspositionPlan(unittest.TestCase):
+    def setUp(self):
+        self.watershed = create_test_watershed_polygon()
+        self.transposition_domain = create_test_transposition_domain_polygon()
+        self.data_array = create_test_data_array(self.transposition_domain, 1)
+
+    def test_saved_plan_matches_rasterized_mask(self):
+        """
+        Test that a transposition using a saved and reloaded plan matches one that rasterizes the mask.
+        """
+        with tempfile.TemporaryDirectory() as plan_dir:
+            created = TranspositionPlan.load_or_create(
+                plan_dir, self.data_array, self.watershed, self.transposition_domain
+            )
+            TranspositionPlan._loaded.clear()
+            plan = TranspositionPlan.load(plan_dir, created.key)
+        self.assertIsNotNone(plan)
+        expected = Transpose(self.data_array, self.watershed, "longitude", "latitude")
+        transpose = Transpose(self.data_array, self.watershed, "longitude", "latitude", plan=plan)
+        np.testing.assert_array_equal(transpose.watershed_mask_clipped, expected.watershed_mask_clipped)
+        self.assertEqual(transpose.watershed_window, expected.watershed_window)
+        self.assertEqual(transpose.max_transpose()[1], expected.max_transpose()[1])
+        self.assertTrue(transpose.max_transpose()[0].equals(expected.max_transpose()[0]))
+
+    def test_plan_for_other_grid(self):
+        plan = TranspositionPlan.from_transpose(
+            Transpose(self.data_array, self.watershed, "longitude", "latitude"), self.transposition_domain
+        )
+        with self.assertRaises(ValueError):
+            Transpose(self.data_array[1:, 1:], self.watershed, "longitude", "latitude", plan=plan)
+
+
+class TestMaxTransposeWatersheds(unittest.TestCase):
+    def setUp(self):
+        self.transposition_domain = create_test_transposition_domain_polygon()
+        self.data_array = create_test_data_array(self.transposition_domain, 0.5)
+        self.watersheds = [create_test_watershed_polygon(), Polygon([(1, 1), (2, 1), (2, 2), (1, 2)])]
+
+    def test_matches_each_watershed(self):
+        """
+        Test the batched transposition of several watersheds against transposing each watershed alone.
+        """
+        results = max_transpose_watersheds(self.data_array, self.watersheds, "longitude", "latitude", np.max)
+        self.assertEqual(len(results), len(self.watersheds))
+        for watershed, result in zip(self.watersheds, results):
+            expected = Transpose(
+                self.data_array, watershed, "longitude", "latitude", engine="convolution"
+            ).max_transpose(np.max)
+            self.assertEqual(result[1], expected[1])
+            self.assertEqual(result[2], expected[2])
+            self.assertTrue(result[0].equals(expected[0]))
+
+    def test_correlate_masks_match_correlate_mask(self):
+        grid = self.data_array.to_numpy()
+        masks = [np.ones((2, 3), dtype=bool), np.array([[True, False], [True, True]])]
+        for correlation, mask in zip(correlate_masks(grid, masks), masks):
+            np.testing.assert_allclose(correlation, correlate_mask(grid, mask))
+
+
+class TestMaxRotatedTranspose(unittest.TestCase):
+    def setUp(self):
+        self.watershed = create_test_watershed_polygon()
+        self.transposition_domain = create_test_transposition_domain_polygon()
+        self.data_array = create_test_data_array(self.transposition_domain, 0.5)
+
+    def test_no_rotation_matches_translation(self):
+        """
+        Test a search of only the zero angle against the translation search.
+        """
+        polygon, aff, value, angle = max_rotated_transpose(
+            self.data_array, self.watershed, "longitude", "latitude", [0.0], np.max
+        )
+        expected = Transpose(
+            self.data_array, self.watershed, "longitude", "latitude", engine="convolution"
+        ).max_transpose(np.max)
+        self.assertEqual(angle, 0.0)
+        self.assertTrue(aff.almost_equals(expected[1]))
+        self.assertEqual(value, expected[2])
+        self.assertTrue(polygon.equals(expected[0]))
+
+    def test_best_rotation(self):
+        """
+        Test that the best rotation is at least as good as no rotation and is recorded in the transform.
+        """
+        angles = rotation_angles(90, 45)
+        np.testing.assert_array_equal(angles, [0, -45, 45, -90, 90])
+        polygon, aff, value, angle = max_rotated_transpose(
+            self.data_array, self.watershed, "longitude", "latitude", angles, np.mean
+        )
+        unrotated = max_rotated_transpose(self.data_array, self.watershed, "longitude", "latitude", [0.0], np.mean)
+        self.assertIn(angle, angles)
+        self.assertGreaterEqual(value, unrotated[2])
+        self.assertAlmostEqual(aff.a, np.cos(np.radians(angle)))
+        self.assertAlmostEqual(aff.d, np.cos(np.radians(self.watershed.centroid.y)) * np.sin(np.radians(angle)))
+        # the transform carries the watershed onto the transposed (rasterized) watershed
+        transformed = affine_transform(self.watershed, aff.to_shapely())
+        self.assertTrue(polygon.buffer(0.5).contains(transformed))
+
+    def test_rotation_keeps_projected_shape(self):
+        """
+        Test that a rotation at high latitude keeps the shape of the watershed in the local equal-scale frame.
+        """
+        watershed = Polygon([(-100, 60), (-98, 60), (-98, 61), (-100, 61)])
+        centroid = watershed.centroid
+        scale = np.cos(np.radians(centroid.y))
+
+        def projected(polygon: Polygon) -> np.ndarray:
+            return np.array(polygon.exterior.coords) * [scale, 1.0]
+
+        rotation = local_rotation(centroid, 30)
+        rotated = affine_transform(watershed, rotation.to_shapely())
+        sides = np.linalg.norm(np.diff(projected(watershed), axis=0), axis=1)
+        rotated_sides = np.linalg.norm(np.diff(projected(rotated), axis=0), axis=1)
+        np.testing.assert_allclose(rotated_sides, sides)
+        self.assertAlmostEqual(rotated.area, watershed.area)
+        self.assertTrue(rotated.centroid.equals_exact(centroid, 1e-9))
+        # in the local frame the rotation is a rigid motion
+        to_local = Affine.scale(scale, 1.0)
+        linear = to_local * rotation * ~to_local
+        np.testing.assert_allclose(
+            [[linear.a, linear.b], [linear.d, linear.e]],
+            [[np.cos(np.radians(30)), -np.sin(np.radians(30))], [np.sin(np.radians(30)), np.cos(np.radians(30))]],
+        )
+
+    def test_top_rotated_transpositions(self):
+        """
+        Test that alternates are ranked across all angles, the first being the max rotated transposition.
+        """
+        angles = rotation_angles(90, 45)
+        expected = max_rotated_transpose(self.data_array, self.watershed, "longitude", "latitude", angles, np.mean)
+        top = top_rotated_transpositions(
+            self.data_array, self.watershed, "longitude", "latitude", angles, 3, min_separation=2, func=np.mean
+        )
+        self.assertEqual(len(top), 3)
+        self.assertTrue(top[0][0].equals(expected[0]))
+        self.assertTrue(top[0][1].almost_equals(expected[1]))
+        self.assertEqual(top[0][2], expected[2])
+        self.assertEqual(top[0][3], expected[3])
+        values = [value for _, _, value, _ in top]
+        self.assertEqual(values, sorted(values, reverse=True))
+        # rotations are about the centroid, so the transformed centroids are min_separation cells apart
+        centroids = [affine_transform(self.watershed.centroid, aff.to_shapely()) for _, aff, _, _ in top]
+        for i, first in enumerate(centroids):
+            for second in centroids[i + 1 :]:
+                self.assertGreaterEqual(max(abs(first.x - second.x), abs(first.y - second.y)), 2 * 0.5 - 1e-9)
+
+
+class TestStochasticStormTransposition(unittest.TestCase):
+    def setUp(self):
+        self.watershed = create_test_watershed_polygon()
+        self.transposition_domain = create_test_transposition_domain_polygon()
+        data_array = create_test_data_array(self.transposition_domain, 0.5)
+        layers = [data_array, data_array.copy(data=data_array.to_numpy()[::-1, ::-1])]
+        self.stack = xr.concat(layers, dim=pd.Index(pd.date_range("2000-01-01", periods=2), name="time"))
+        self.sst = StochasticStormTransposition(self.stack, self.watershed, "longitude", "latitude")
+
+    def test_depths_match_masked_means(self):
+        """
+        Test sampled depths against the masked mean of the sampled storm at the sampled shift.
+        """
+        sample = self.sst.sample(50, seed=1)
+        self.assertEqual(len(sample), 50)
+        transpose = self.sst.transpose
+        for storm, x_delta, y_delta, depth in sample[["storm_index", "x_delta", "y_delta", "depth"]].itertuples(
+            index=False
+        ):
+            window = transpose._shifted_window(x_delta, y_delta, self.stack.to_numpy()[storm])
+            self.assertAlmostEqual(depth, np.nanmean(window))
+
+    def test_seeded_sample_is_reproducible(self):
+        """
+        Test that a seed gives the same sample.
+        """
+        expected = self.sst.sample(1000, seed=7, block_size=300)
+        pd.testing.assert_frame_equal(self.sst.sample(1000, seed=7, block_size=300), expected)
+        self.assertFalse(self.sst.sample(1000, seed=8, block_size=300).equals(expected))
+
+
 if __name__ == "__main__":
     unittest.main()
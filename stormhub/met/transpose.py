@@ -1,16 +1,58 @@
 """Class to handle transpoition functionality."""
 
-from typing import Any, Callable
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Iterator
 
+import dask
+import dask.array as da
 import numpy as np
 import xarray as xr
 from affine import Affine
-from rasterio.features import shapes
+from rasterio.features import rasterize, shapes
 from rasterio.mask import geometry_mask
 from rasterio.windows import Window, get_data_window
+from rasterio.windows import transform as window_transform
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import binary_dilation, maximum_filter
 from shapely import Polygon
 from shapely.affinity import translate
-from shapely.geometry import shape
+from shapely.geometry import mapping, shape
+
+from stormhub.met import numba_backend
+from stormhub.met.kernels import StatisticKernel, correlate_mask, correlate_masks, evaluate_kernels
+
+TRANSPOSE_ENGINES = ("loop", "convolution", "numba", "branch_and_bound", "chunked")
+"""Engines available to `Transpose.max_transpose`."""
+TIE_TOLERANCE_EPS = 64
+"""Multiple of the machine epsilon of the data, relative to the greatest mean, within which FFT means are ties"""
+
+
+def _first_max(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """
+    Find the first of the values within rounding tolerance of the greatest value, along an axis.
+
+    Means from FFT correlation carry rounding errors, so shifts with exactly equal means may differ in their last
+    bits. Treating values within `TIE_TOLERANCE_EPS` machine epsilons (relative to the greatest value) as ties breaks
+    exact ties by position, as the "loop" engine does; shifts whose exact means differ by less than the tolerance are
+    also broken by position, so may resolve differently than in the "loop" engine.
+
+    Args:
+        values (np.ndarray): Floating point values, -inf for invalid shifts.
+        axis (int): The axis searched.
+
+    Returns
+    -------
+        np.ndarray: The index of the first tied greatest value along the axis.
+    """
+    best = values.max(axis=axis, keepdims=True)
+    scale = np.maximum(1.0, np.abs(np.where(np.isfinite(best), best, 0)))
+    tolerance = TIE_TOLERANCE_EPS * np.finfo(values.dtype).eps * scale
+    return np.argmax(values >= best - tolerance, axis=axis)
 
 
 class Transpose:
@@ -23,9 +65,23 @@ class Transpose:
         watershed (Polygon): The watershed polygon.
         x_var (str): The x variable name in the data array.
         y_var (str): The y variable name in the data array.
+        engine (str): The engine used to search shifts, one of `TRANSPOSE_ENGINES`.
+        plan (TranspositionPlan): A precomputed watershed mask and window for the grid of the data array.
     """
 
-    def __init__(self, data_array: xr.DataArray, watershed: Polygon, x_var: str, y_var: str) -> None:
+    def __init__(
+        self,
+        data_array: xr.DataArray,
+        watershed: Polygon,
+        x_var: str,
+        y_var: str,
+        engine: str = "loop",
+        plan: "TranspositionPlan | None" = None,
+        block_size: int = 8,
+        tile_size: tuple[int, int] | None = None,
+        dtype: str | np.dtype | None = None,
+        scratch_dir: str | None = None,
+    ) -> None:
         """
         Initialize the Transpose class.
 
@@ -34,7 +90,37 @@ class Transpose:
             watershed (Polygon): The watershed polygon.
             x_var (str): The x variable name in the data array.
             y_var (str): The y variable name in the data array.
+            engine (str): The engine used to search shifts. "loop" evaluates each shift in turn, "convolution"
+                evaluates the basin mean for every shift at once by correlating the grid with the watershed mask,
+                "numba" evaluates each shift in compiled parallel loops and falls back to "convolution" when numba
+                is not installed, "branch_and_bound" bounds the mean of blocks of shifts at coarse resolution and
+                only evaluates blocks that can still beat the best shift found so far, "chunked" searches overlapping
+                tiles of a (dask backed) data array so the whole grid is never held in memory.
+            plan (TranspositionPlan, optional): A precomputed watershed mask and window. If provided the mask is
+                not rasterized again. The plan must have been created for the grid of the data array.
+            block_size (int): The number of shifts along each axis grouped into a block by the "branch_and_bound"
+                engine.
+            tile_size (tuple[int, int], optional): The number of window origins (rows, columns) in each tile of the
+                "chunked" engine, and of the tiled correlations used with a scratch directory. Defaults to four times
+                the size of the watershed window.
+            dtype (str | np.dtype, optional): The dtype the data array is converted to, e.g. "float32" to halve the
+                memory of the grid and of the correlations. Defaults to the dtype of the data array.
+            scratch_dir (str, optional): A directory where the numpy copy of the data array and the grid of shift
+                means are backed by temporary memory-mapped files rather than held in RAM. Valid shifts and shift
+                means are then correlated tile by tile, so no full size intermediate arrays are held in RAM.
         """
+        if engine not in TRANSPOSE_ENGINES:
+            raise ValueError(f"engine must be one of: {', '.join(TRANSPOSE_ENGINES)}, not {engine}")
+        if engine == "numba" and not numba_backend.NUMBA_AVAILABLE:
+            logging.warning("numba is not installed, falling back to the convolution transpose engine")
+            engine = "convolution"
+        self.engine = engine
+        self.block_size = block_size
+        self.tile_size = tile_size
+        self.dtype = np.dtype(dtype) if dtype else None
+        self.scratch_dir = scratch_dir
+        self._chunked_max_origin = None
+        self.search_report: dict[str, int] | None = None
         self.data_array = data_array
         self.watershed = watershed
         self.x_var = x_var
@@ -44,6 +130,7 @@ class Transpose:
         self.width = self.data_array.rio.width
         self.height = self.data_array.rio.height
         self._np_data_array = None
+        self._plan = None
         self._watershed_window = None
         self._watershed_mask = None
         self._watershed_mask_clipped = None
@@ -52,6 +139,22 @@ class Transpose:
         self._valid_spaces_polygon = None
         self._data_array_x_coords = None
         self._data_array_y_coords = None
+        self._watershed_mask_polygon = None
+        if plan is not None:
+            self._apply_plan(plan)
+
+    def _apply_plan(self, plan: "TranspositionPlan") -> None:
+        """Use the watershed mask, window and mask polygon of a precomputed plan."""
+        if plan.shape != (self.height, self.width) or not plan.transform.almost_equals(self.transform):
+            raise ValueError(
+                f"Transposition plan {plan.key} was created for a grid of shape {plan.shape} and transform "
+                f"{tuple(plan.transform)[:6]}, not {(self.height, self.width)} and {tuple(self.transform)[:6]}"
+            )
+        self._plan = plan
+        self._watershed_mask = plan.watershed_mask
+        self._watershed_window = plan.watershed_window
+        self._watershed_mask_clipped = plan.watershed_mask_clipped
+        self._watershed_mask_polygon = plan.watershed_mask_polygon
 
     def _calculate_watershed_mask_and_window(self) -> None:
         """
@@ -109,9 +212,30 @@ class Transpose:
             np.ndarray: The data array as a numpy array.
         """
         if not isinstance(self._np_data_array, np.ndarray):
-            self._np_data_array = self.data_array.to_numpy()
+            data_array = self.data_array.astype(self.dtype) if self.dtype else self.data_array
+            if self.scratch_dir:
+                self._np_data_array = self._scratch_array(data_array.shape, data_array.dtype)
+                if isinstance(data_array.data, da.Array):
+                    # write chunk by chunk so the whole grid is never held in memory
+                    da.store(data_array.data, self._np_data_array)
+                else:
+                    self._np_data_array[:] = data_array.to_numpy()
+            else:
+                self._np_data_array = data_array.to_numpy()
         return self._np_data_array
 
+    def _scratch_array(self, shape: tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """
+        Allocate an array, backed by a temporary memory-mapped file in the scratch directory if one is set.
+
+        The file is removed when it is closed, and the mapping stays valid for the life of the array.
+        """
+        if not self.scratch_dir:
+            return np.empty(shape, dtype=dtype)
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        with tempfile.TemporaryFile(dir=self.scratch_dir, prefix="stormhub-transpose-") as f:
+            return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
     @property
     def watershed_window(self) -> Window:
         """
@@ -152,66 +276,102 @@ class Transpose:
         return self._watershed_mask_clipped
 
     @property
-    def valid_shifts(self) -> list[tuple[int, int]]:
+    def valid_shifts(self) -> np.ndarray:
         """
-        Calculate and return a list of valid shift values for the watershed mask.
+        Calculate and return the valid shift values for the watershed mask.
 
         This method determines the valid shifts that can be applied to the watershed mask
-        within the bounds of the data array. It iterates over possible shifts and checks
-        if the shifted mask is still within the valid data region.
+        within the bounds of the data array, i.e. the shifts where every cell of the shifted
+        mask lies on finite data. The "loop" engine checks each candidate shift in turn, other
+        engines find every valid shift in one pass with `_valid_shifts_vectorized`.
 
         Returns
         -------
-            list[tuple[int, int]]: A list of tuples representing the valid (x, y) shifts.
+            np.ndarray: An (N, 2) integer array of the valid (x, y) shifts, ordered by x then y.
         """
         if self._valid_shifts is None:
-            original_window_row_slice, original_window_col_slice = self.watershed_window.toslices()
-            shifts: list[tuple[int, int]] = []
-            min_x_delta = 0 - self.watershed_window.col_off
-            min_y_delta = 0 - self.watershed_window.row_off
-            max_x_delta = self.width - (self.watershed_window.col_off + self.watershed_window.width)
-            max_y_delta = self.height - (self.watershed_window.row_off + self.watershed_window.height)
-            x_delta = min_x_delta
+            if self.engine == "loop":
+                self._valid_shifts = self._valid_shifts_loop()
+            elif self.engine == "chunked":
+                self._valid_shifts = self._valid_shifts_chunked()
+            elif self.engine == "numba":
+                origins = np.argwhere(numba_backend.valid_origins(self.np_data_array, self.watershed_mask_clipped).T)
+                self._valid_shifts = origins - np.array(
+                    [self.watershed_window.col_off, self.watershed_window.row_off], dtype=int
+                )
+            else:
+                self._valid_shifts = self._valid_shifts_vectorized()
+        return self._valid_shifts
+
+    def _valid_shifts_loop(self) -> np.ndarray:
+        """Check every candidate shift in turn for non-finite data under the shifted mask."""
+        original_window_row_slice, original_window_col_slice = self.watershed_window.toslices()
+        shifts: list[tuple[int, int]] = []
+        min_x_delta = 0 - self.watershed_window.col_off
+        min_y_delta = 0 - self.watershed_window.row_off
+        max_x_delta = self.width - (self.watershed_window.col_off + self.watershed_window.width)
+        max_y_delta = self.height - (self.watershed_window.row_off + self.watershed_window.height)
+        x_delta = min_x_delta
+        y_delta = min_y_delta
+        while x_delta <= max_x_delta:
+            while y_delta <= max_y_delta:
+                adjusted_row_start = original_window_row_slice.start + y_delta
+                adjusted_row_stop = original_window_row_slice.stop + y_delta
+                adjusted_col_start = original_window_col_slice.start + x_delta
+                adjusted_col_stop = original_window_col_slice.stop + x_delta
+                data_clipped = self.np_data_array[
+                    adjusted_row_start:adjusted_row_stop, adjusted_col_start:adjusted_col_stop
+                ]
+                data_mask = np.isfinite(data_clipped)
+                combined_mask = np.logical_and(self.watershed_mask_clipped, data_mask)
+                if np.array_equal(combined_mask, self.watershed_mask_clipped):
+                    shifts.append((x_delta, y_delta))
+                y_delta += 1
+            x_delta += 1
             y_delta = min_y_delta
-            while x_delta <= max_x_delta:
-                while y_delta <= max_y_delta:
-                    adjusted_row_start = original_window_row_slice.start + y_delta
-                    adjusted_row_stop = original_window_row_slice.stop + y_delta
-                    adjusted_col_start = original_window_col_slice.start + x_delta
-                    adjusted_col_stop = original_window_col_slice.stop + x_delta
-                    data_clipped = self.np_data_array[
-                        adjusted_row_start:adjusted_row_stop, adjusted_col_start:adjusted_col_stop
-                    ]
-                    data_mask = np.isfinite(data_clipped)
-                    combined_mask = np.logical_and(self.watershed_mask_clipped, data_mask)
-                    if np.array_equal(combined_mask, self.watershed_mask_clipped):
-                        shifts.append((x_delta, y_delta))
-                    y_delta += 1
-                x_delta += 1
-                y_delta = min_y_delta
-            self._valid_shifts = shifts
+        return np.array(shifts, dtype=int).reshape(-1, 2)
 
-        return self._valid_shifts
+    def _valid_shifts_vectorized(self) -> np.ndarray:
+        """
+        Find every valid shift in one pass.
+
+        The non-finite indicator grid is correlated with the clipped watershed mask, giving the number of
+        non-finite cells under the mask for every window origin. Origins with a count of zero are valid.
+        """
+        height, width = self.watershed_mask_clipped.shape
+        data = self.np_data_array
+        valid = np.full((max(self.height - height + 1, 0), max(self.width - width + 1, 0)), False)
+        for rows, cols in self._origin_tiles(tiled=bool(self.scratch_dir)):
+            tile = data[rows.start : rows.stop + height - 1, cols.start : cols.stop + width - 1]
+            valid[rows, cols] = np.rint(self._correlate_mask(~np.isfinite(tile))) == 0
+        # transpose so that argwhere orders origins by column then row, matching the loop engine
+        origins = np.argwhere(valid.T)
+        return origins - np.array([self.watershed_window.col_off, self.watershed_window.row_off], dtype=int)
 
     @property
     def valid_spaces(self) -> np.ndarray:
         """
         Calculate and return the valid spaces mask.
 
-        This method initializes the valid mask as the watershed mask value, iterates over
-        the list of shift values, applies the shifts to the watershed mask, and performs
-        a logical OR with the valid mask and the rolled watershed mask.
+        This method marks the window origin of every valid shift in an indicator grid and dilates
+        it by the clipped watershed mask, so that each cell covered by a shifted watershed mask is set.
+        Shifted masks are never wrapped around the edges of the data array.
 
         Returns
         -------
             np.ndarray: The valid spaces mask as a boolean numpy array.
         """
+        if not isinstance(self._valid_spaces, np.ndarray) and self.engine == "chunked":
+            self._valid_spaces = self._valid_spaces_chunked()
         if not isinstance(self._valid_spaces, np.ndarray):
-            valid_spaces = np.full(self.watershed_mask.shape, False, dtype=bool)
-            for shift in self.valid_shifts:
-                rolled = np.roll(self.watershed_mask, shift, axis=(1, 0))
-                valid_spaces = np.logical_or(valid_spaces, rolled)
-            self._valid_spaces = valid_spaces
+            shifts = self.valid_shifts
+            origins = np.full(self.watershed_mask.shape, False, dtype=bool)
+            origins[shifts[:, 1] + self.watershed_window.row_off, shifts[:, 0] + self.watershed_window.col_off] = True
+            height, width = self.watershed_mask_clipped.shape
+            # anchor the structuring element at its top left cell so each origin is dilated down and to the right
+            self._valid_spaces = binary_dilation(
+                origins, structure=self.watershed_mask_clipped, origin=(-(height // 2), -(width // 2))
+            )
         return self._valid_spaces
 
     def _array_to_polygon(self, arr: np.ndarray) -> Polygon:
@@ -248,42 +408,831 @@ class Transpose:
             self._valid_spaces_polygon = self._array_to_polygon(self.valid_spaces)
         return self._valid_spaces_polygon
 
-    def max_transpose(self, func: Callable[[np.ndarray], Any] | None = None) -> tuple[Polygon, Affine, Any | None]:
+    @property
+    def watershed_mask_polygon(self) -> Polygon:
         """
-        Calculate the maximum transpose of the watershed mask over the data array.
+        Get the watershed mask as a polygon following the cell edges of the data array.
 
-        This method initializes the max transpose array, max shift, and stats collection as None.
-        It iterates over the list of shift values, applies the shifts to the watershed mask,
-        calculates the stats, and if the stats collection has a greater mean than the max stats,
-        it overwrites the max stats, max shift, and max transpose array.
+        Returns
+        -------
+            Polygon: The watershed mask polygon.
+        """
+        if self._watershed_mask_polygon is None:
+            self._watershed_mask_polygon = self._array_to_polygon(self.watershed_mask)
+        return self._watershed_mask_polygon
+
+    def _shifted_window(self, x_delta: int, y_delta: int, data: np.ndarray | None = None) -> np.ma.MaskedArray:
+        """
+        Get the data under the watershed mask after applying a shift.
 
         Args:
-            func (Callable[[np.ndarray], Any] | None): A callable to apply to the data array.
+            x_delta (int): The shift in columns.
+            y_delta (int): The shift in rows.
+            data (np.ndarray | None): A 2D array on the grid of the data array. Defaults to the data array.
 
         Returns
         -------
-            tuple[Polygon, Affine, Any | None]: The resulting polygon, affine transformation, and results.
+            np.ma.MaskedArray: The shifted window of the data array, masked outside the watershed.
         """
         original_window_row_slice, original_window_col_slice = self.watershed_window.toslices()
+        row_slice = slice(original_window_row_slice.start + y_delta, original_window_row_slice.stop + y_delta)
+        col_slice = slice(original_window_col_slice.start + x_delta, original_window_col_slice.stop + x_delta)
+        if data is not None:
+            data_clipped = data[row_slice, col_slice]
+        elif self.engine == "chunked":
+            # read only the shifted window rather than the whole data array
+            data_clipped = self.data_array[row_slice, col_slice].to_numpy()
+        else:
+            data_clipped = self.np_data_array[row_slice, col_slice]
+        return np.ma.masked_array(data_clipped, ~self.watershed_mask_clipped)
+
+    def subbasin_labels(self, subbasins: list[Polygon]) -> np.ndarray:
+        """
+        Rasterize sub-basins of the watershed into an integer label grid aligned with the watershed window.
+
+        Sub-basins are numbered from 1 in the order given. A cell takes the label of the sub-basin containing its
+        center, and cells of the watershed mask whose center is in no sub-basin (e.g. along the watershed boundary,
+        which the mask rasterizes with all touched cells) take the label of a sub-basin touching them. Cells outside
+        the watershed mask are 0.
+
+        Args:
+            subbasins (list[Polygon]): The sub-basin polygons.
+
+        Returns
+        -------
+            np.ndarray: An integer array with the shape of `watershed_mask_clipped`.
+        """
+        if self._plan is not None:
+            return self._plan.subbasin_labels(subbasins)
+        return _rasterize_subbasin_labels(
+            subbasins, self.watershed_mask_clipped, window_transform(self.watershed_window, self.transform)
+        )
+
+    def subbasin_means(
+        self,
+        labels: np.ndarray,
+        stack: xr.DataArray | np.ndarray,
+        x_delta: int,
+        y_delta: int,
+        count: int | None = None,
+    ) -> np.ndarray:
+        """
+        Average each sub-basin of a label grid over every layer of a stack of grids after applying a shift.
+
+        Only the shifted window of the stack is read, and the means of all sub-basins and layers come from one
+        `np.bincount` over the (layer, label) index of each finite cell.
+
+        Args:
+            labels (np.ndarray): A label grid from `subbasin_labels`.
+            stack (xr.DataArray | np.ndarray): A (layer, y, x) stack of grids on the grid of the data array, e.g. the
+                hourly precipitation of a storm.
+            x_delta (int): The shift in columns.
+            y_delta (int): The shift in rows.
+            count (int, optional): The number of sub-basins. Defaults to the greatest label.
+
+        Returns
+        -------
+            np.ndarray: A (layer, sub-basin) array of means. Sub-basins without finite cells in a layer are NaN.
+        """
+        count = int(labels.max()) if count is None else count
+        row_slice, col_slice = self.watershed_window.toslices()
+        window = stack[
+            :,
+            row_slice.start + y_delta : row_slice.stop + y_delta,
+            col_slice.start + x_delta : col_slice.stop + x_delta,
+        ]
+        window = window.to_numpy() if isinstance(window, xr.DataArray) else np.asarray(window)
+        layers = window.shape[0]
+        cells = np.isfinite(window) & (labels > 0)
+        index = (np.arange(layers)[:, None, None] * (count + 1) + labels)[cells]
+        size = layers * (count + 1)
+        sums = np.bincount(index, weights=window[cells], minlength=size).reshape(layers, count + 1)
+        counts = np.bincount(index, minlength=size).reshape(layers, count + 1)
+        means = np.full(sums.shape, np.nan)
+        np.divide(sums, counts, out=means, where=counts > 0)
+        return means[:, 1:]
+
+    def _correlate_mask(self, grid: np.ndarray) -> np.ndarray:
+        """
+        Correlate a grid, or a stack of grids, with the clipped watershed mask.
+
+        Args:
+            grid (np.ndarray): A 2D array with the same shape as the data array, or a 3D array of such layers.
+
+        Returns
+        -------
+            np.ndarray: The sum of the grid under the clipped mask for every window origin (row, column)
+            that keeps the window within the grid, per layer for a 3D array.
+        """
+        return correlate_mask(grid, self.watershed_mask_clipped)
+
+    def shift_means(self) -> np.ndarray:
+        """
+        Calculate the watershed mean for every possible window origin at once.
+
+        The summed grid (with non-finite cells set to zero) and the grid of finite cells are each correlated with
+        the clipped watershed mask, so each output cell holds the sum and count of the finite values under the mask
+        when the top left of the watershed window is placed on that cell.
+
+        With a scratch directory the origins are correlated tile by tile, so the correlations and their inputs are
+        only ever the size of a tile, and the means are written to a memory-mapped array.
+
+        Returns
+        -------
+            np.ndarray: A 2D array of watershed means indexed by window origin (row, column). Origins with no finite
+            values under the mask are NaN.
+        """
+        height, width = self.watershed_mask_clipped.shape
+        data = self.np_data_array
+        means = self._scratch_array(
+            (max(self.height - height + 1, 0), max(self.width - width + 1, 0)),
+            np.result_type(data.dtype, np.float32),
+        )
+        for rows, cols in self._origin_tiles(tiled=bool(self.scratch_dir)):
+            tile = data[rows.start : rows.stop + height - 1, cols.start : cols.stop + width - 1]
+            finite = np.isfinite(tile)
+            sums = self._correlate_mask(np.where(finite, tile, 0))
+            counts = np.rint(self._correlate_mask(finite)).astype(sums.dtype)
+            tile_means = means[rows, cols]
+            tile_means[:] = np.nan
+            np.divide(sums, counts, out=tile_means, where=counts > 0)
+        return means
+
+    def valid_shift_means(self) -> np.ndarray:
+        """
+        Calculate the watershed mean for each valid shift.
+
+        Returns
+        -------
+            np.ndarray: The watershed means, aligned with `valid_shifts`.
+        """
+        shifts = self.valid_shifts
+        if self.engine == "loop":
+            return np.array([np.nanmean(self._shifted_window(x_delta, y_delta)) for x_delta, y_delta in shifts])
+        if self.engine == "numba":
+            return numba_backend.origin_means(
+                self.np_data_array,
+                self.watershed_mask_clipped,
+                shifts[:, 1] + self.watershed_window.row_off,
+                shifts[:, 0] + self.watershed_window.col_off,
+            )
+        return self.shift_means()[
+            shifts[:, 1] + self.watershed_window.row_off, shifts[:, 0] + self.watershed_window.col_off
+        ]
+
+    def shift_statistics(self, kernels: list[str | StatisticKernel]) -> dict[str, np.ndarray]:
+        """
+        Evaluate statistic kernels under the watershed mask for every valid shift at once.
+
+        Volume kernels without a cell area use the area of a grid cell, in the squared units of the grid's CRS.
+
+        Args:
+            kernels (list[str | StatisticKernel]): The statistics to evaluate, as kernels or names such as
+                "mean", "min", "max", "sum", "volume", "wet_fraction" or "p90".
+
+        Returns
+        -------
+            dict[str, np.ndarray]: The values of each statistic, by name, aligned with `valid_shifts`.
+        """
+        kernels = [StatisticKernel.from_spec(kernel) for kernel in kernels]
+        cell_area = abs(self.x_cellsize * self.y_cellsize)
+        kernels = [
+            StatisticKernel("volume", cell_area=cell_area, name=kernel.name)
+            if kernel.kind == "volume" and kernel.cell_area is None
+            else kernel
+            for kernel in kernels
+        ]
+        shifts = self.valid_shifts
+        return evaluate_kernels(
+            self.np_data_array,
+            self.watershed_mask_clipped,
+            shifts[:, 1] + self.watershed_window.row_off,
+            shifts[:, 0] + self.watershed_window.col_off,
+            kernels,
+        )
+
+    def _ranking_values(self, rank_by: str | StatisticKernel) -> np.ndarray:
+        """Get the values used to rank the valid shifts."""
+        if rank_by == "mean":
+            return self.valid_shift_means()
+        kernel = StatisticKernel.from_spec(rank_by)
+        return self.shift_statistics([kernel])[kernel.name]
+
+    def _max_shift_loop(self) -> tuple[int, int]:
+        """Find the shift with the greatest watershed mean by evaluating each valid shift in turn."""
         max_mean = None
         max_shift = None
-        results = None
         for x_delta, y_delta in self.valid_shifts:
-            adjusted_row_start = original_window_row_slice.start + y_delta
-            adjusted_row_stop = original_window_row_slice.stop + y_delta
-            adjusted_col_start = original_window_col_slice.start + x_delta
-            adjusted_col_stop = original_window_col_slice.stop + x_delta
-            data_clipped = self.np_data_array[
-                adjusted_row_start:adjusted_row_stop, adjusted_col_start:adjusted_col_stop
-            ]
-            data_clipped_masked = np.ma.masked_array(data_clipped, ~self.watershed_mask_clipped)
-            mean = np.nanmean(data_clipped_masked)
+            mean = np.nanmean(self._shifted_window(x_delta, y_delta))
             if max_mean is None or mean > max_mean:
                 max_mean = mean
-                max_shift = (float(x_delta * self.x_cellsize), float(y_delta * self.y_cellsize))
-                if func:
-                    results = func(data_clipped_masked)
-        poly = self._array_to_polygon(self.watershed_mask)
-        poly = translate(poly, *max_shift)
+                max_shift = (int(x_delta), int(y_delta))
+        return max_shift
+
+    def _origin_tiles(self, tiled: bool = True) -> Iterator[tuple[slice, slice]]:
+        """
+        Split the window origins into tiles.
+
+        Args:
+            tiled (bool): Whether to split the origins into tiles of `tile_size`, rather than yield all the origins
+                as one tile.
+
+        Yields
+        ------
+            tuple[slice, slice]: The rows and columns of the window origins of each tile.
+        """
+        mask = self.watershed_mask_clipped
+        n_rows = self.height - mask.shape[0] + 1
+        n_cols = self.width - mask.shape[1] + 1
+        if n_rows <= 0 or n_cols <= 0:
+            return
+        if not tiled:
+            yield slice(0, n_rows), slice(0, n_cols)
+            return
+        tile_rows, tile_cols = self.tile_size or (4 * mask.shape[0], 4 * mask.shape[1])
+        for row_start in range(0, n_rows, tile_rows):
+            for col_start in range(0, n_cols, tile_cols):
+                yield (
+                    slice(row_start, min(row_start + tile_rows, n_rows)),
+                    slice(col_start, min(col_start + tile_cols, n_cols)),
+                )
+
+    def _map_tiles(self, func: Callable[..., Any]) -> Iterator[Any]:
+        """
+        Apply a function to overlapping tiles of the data array as dask tasks.
+
+        The window origins are split into tiles, and each tile reads the data under every window starting within it,
+        i.e. the tile extended by the watershed window less one cell. Tasks are computed a few at a time so that only
+        the tiles being searched, and their results, are held in memory.
+
+        Args:
+            func (Callable[..., Any]): Called as func(tile, mask, row_start, col_start) for each tile.
+
+        Yields
+        ------
+            Any: The result of each tile, computed in groups of one tile per CPU.
+        """
+        mask = self.watershed_mask_clipped
+        tile_rows, tile_cols = self.tile_size or (4 * mask.shape[0], 4 * mask.shape[1])
+        data = (self.data_array.astype(self.dtype) if self.dtype else self.data_array).data
+        if not isinstance(data, da.Array):
+            data = da.from_array(data, chunks=(tile_rows + mask.shape[0] - 1, tile_cols + mask.shape[1] - 1))
+        tasks = []
+        for rows, cols in self._origin_tiles():
+            tile = data[rows.start : rows.stop + mask.shape[0] - 1, cols.start : cols.stop + mask.shape[1] - 1]
+            tasks.append(dask.delayed(func)(tile, mask, rows.start, cols.start))
+        group_size = os.cpu_count() or 1
+        for start in range(0, len(tasks), group_size):
+            yield from dask.compute(*tasks[start : start + group_size])
+
+    def _valid_shifts_chunked(self) -> np.ndarray:
+        """Find every valid shift tile by tile, holding only one boolean per window origin."""
+        mask = self.watershed_mask_clipped
+        valid = np.full((self.height - mask.shape[0] + 1, self.width - mask.shape[1] + 1), False)
+        for row_start, col_start, tile_valid in self._map_tiles(_valid_tile_origins):
+            valid[row_start : row_start + tile_valid.shape[0], col_start : col_start + tile_valid.shape[1]] = tile_valid
+        # transpose so that argwhere orders origins by column then row, matching the loop engine
+        origins = np.argwhere(valid.T)
+        return origins - np.array([self.watershed_window.col_off, self.watershed_window.row_off], dtype=int)
+
+    def _valid_spaces_chunked(self) -> np.ndarray:
+        """Dilate the valid window origins of each tile by the mask and combine the tiles into the valid spaces."""
+        valid_spaces = np.full(self.watershed_mask.shape, False)
+        for row_start, col_start, tile_spaces in self._map_tiles(_valid_tile_spaces):
+            valid_spaces[
+                row_start : row_start + tile_spaces.shape[0], col_start : col_start + tile_spaces.shape[1]
+            ] |= tile_spaces
+        return valid_spaces
+
+    def _max_shift_chunked(self) -> tuple[int, int]:
+        """Find the shift with the greatest watershed mean by reducing the winner of each tile."""
+        if self._chunked_max_origin is None:
+            winners = [winner for winner in self._map_tiles(_search_tile) if winner is not None]
+            if not winners:
+                return None
+            # the first origin by column and row among the greatest means, with ties within rounding tolerance
+            winners.sort(key=lambda winner: (winner[1], winner[2]))
+            _, col, row = winners[int(_first_max(np.array([winner[0] for winner in winners])))]
+            self._chunked_max_origin = (col, row)
+        col, row = self._chunked_max_origin
+        return col - self.watershed_window.col_off, row - self.watershed_window.row_off
+
+    def _max_shift_branch_and_bound(self) -> tuple[int, int]:
+        """
+        Find the shift with the greatest watershed mean with a coarse-to-fine branch-and-bound search.
+
+        The window origins are grouped into square blocks. The grid is reduced to the greatest finite value of each
+        2 x 2 group of blocks of cells, and correlating that coarse grid with the number of mask cells in each block
+        of the mask gives an upper bound on the watershed mean of every shift in a block of origins, computed entirely
+        at block resolution. The bound is -inf where some cell under the mask is not finite for every origin in the
+        block, so blocks without a valid shift are discarded at the coarse level too, without evaluating validity at
+        full resolution. Blocks are refined in order
+        of decreasing bound, checking validity and evaluating the exact mean of their window origins, until the bound
+        of the next block is below the best mean found so far. Ties are broken by the order of `valid_shifts`, so the
+        result is identical to an exhaustive search. The number of window origins evaluated and pruned is stored in
+        `search_report`.
+        """
+        mask = self.watershed_mask_clipped
+        cell_count = int(mask.sum())
+        block = self.block_size
+        n_rows = self.height - mask.shape[0] + 1
+        n_cols = self.width - mask.shape[1] + 1
+        if n_rows <= 0 or n_cols <= 0:
+            return None
+        block_rows = np.arange(0, n_rows, block)
+        block_cols = np.arange(0, n_cols, block)
+
+        # coarse level: bound the mean of every window origin within each block of origins. A mask cell at row
+        # offset a lies, for every origin of block I, within rows [(I + a // block) * block, + 2 * block) of the grid,
+        # so the greatest value over 2 x 2 blocks of cells, correlated at block resolution with the number of mask
+        # cells in each block of the mask, bounds the sums of the whole block of origins
+        finite_data = np.where(np.isfinite(self.np_data_array), self.np_data_array, -np.inf)
+        coarse = maximum_filter(finite_data, size=2 * block, origin=-block, mode="constant", cval=-np.inf)
+        coarse = coarse[::block, ::block]
+        padded_mask = np.pad(mask, [(0, -size % block) for size in mask.shape])
+        coarse_counts = padded_mask.reshape(
+            padded_mask.shape[0] // block, block, padded_mask.shape[1] // block, block
+        ).sum(axis=(1, 3))
+        coarse_nonfinite = ~np.isfinite(coarse)
+        sums = correlate_mask(np.where(coarse_nonfinite, 0, coarse), coarse_counts)
+        # a cell under the mask that is not finite for every origin of the block rules out the whole block
+        blocked = np.rint(correlate_mask(coarse_nonfinite, coarse_counts > 0)) > 0
+        bounds = np.where(blocked, -np.inf, sums / cell_count)[: len(block_rows), : len(block_cols)]
+
+        # fine level: evaluate the blocks that can still beat the best shift found so far
+        data_windows = sliding_window_view(self.np_data_array, mask.shape)
+        best_mean = -np.inf
+        best_origin = None
+        evaluated = 0
+        blocks_refined = 0
+        for flat_index in np.argsort(-bounds, axis=None, kind="stable"):
+            bound = bounds.flat[flat_index]
+            # allow for rounding differences between the bound and exact sums so no tied shift is pruned
+            if not np.isfinite(bound) or bound < best_mean - 1e-9 * max(1.0, abs(best_mean)):
+                break
+            block_row = block_rows[flat_index // len(block_cols)]
+            block_col = block_cols[flat_index % len(block_cols)]
+            # order origins by column then row, matching `valid_shifts`
+            cols, rows = np.meshgrid(
+                np.arange(block_col, min(block_col + block, n_cols)),
+                np.arange(block_row, min(block_row + block, n_rows)),
+                indexing="ij",
+            )
+            cols, rows = cols.ravel(), rows.ravel()
+            values = data_windows[rows, cols][:, mask]
+            evaluated += len(rows)
+            blocks_refined += 1
+            means = np.where(np.isfinite(values).all(axis=1), values.sum(axis=1) / cell_count, -np.inf)
+            index = int(np.argmax(means))
+            if not np.isfinite(means[index]):
+                continue
+            origin = (int(cols[index]), int(rows[index]))
+            if means[index] > best_mean or (means[index] == best_mean and origin < best_origin):
+                best_mean = means[index]
+                best_origin = origin
+
+        self.search_report = {
+            "candidates": n_rows * n_cols,
+            "evaluated": evaluated,
+            "pruned": n_rows * n_cols - evaluated,
+            "blocks": int(np.isfinite(bounds).sum()),
+            "blocks_refined": blocks_refined,
+        }
+        logging.debug("Branch-and-bound transpose search: %s", self.search_report)
+        if best_origin is None:
+            return None
+        return best_origin[0] - self.watershed_window.col_off, best_origin[1] - self.watershed_window.row_off
+
+    def _max_shift_ranked(self, rank_by: str | StatisticKernel = "mean") -> tuple[int, int]:
+        """Find the shift with the greatest statistic from the statistic of all valid shifts."""
+        shifts = self.valid_shifts
+        if len(shifts) == 0:
+            return None
+        # ties within rounding tolerance are broken by the order of `valid_shifts`
+        x_delta, y_delta = shifts[int(_first_max(self._ranking_values(rank_by)))]
+        return int(x_delta), int(y_delta)
+
+    def max_transpose(
+        self, func: Callable[[np.ndarray], Any] | None = None, rank_by: str | StatisticKernel = "mean"
+    ) -> tuple[Polygon, Affine, Any | None]:
+        """
+        Calculate the maximum transpose of the watershed mask over the data array.
+
+        The shift with the greatest watershed mean is found with the engine selected for this instance, and the
+        optional callable is applied to the data under the watershed mask at that shift. Shifts may instead be
+        ranked by another statistic kernel, which is evaluated for all valid shifts at once.
+
+        Args:
+            func (Callable[[np.ndarray], Any] | None): A callable to apply to the data array.
+            rank_by (str | StatisticKernel): The statistic used to rank shifts, e.g. "mean", "max" or "p90".
+
+        Returns
+        -------
+            tuple[Polygon, Affine, Any | None]: The resulting polygon, affine transformation, and results.
+        """
+        if self.engine == "loop" and rank_by == "mean":
+            max_shift = self._max_shift_loop()
+        elif self.engine == "branch_and_bound" and rank_by == "mean":
+            max_shift = self._max_shift_branch_and_bound()
+        elif self.engine == "chunked" and rank_by == "mean":
+            max_shift = self._max_shift_chunked()
+        else:
+            max_shift = self._max_shift_ranked(rank_by)
+        if max_shift is None:
+            raise ValueError("No valid shifts found for the watershed within the data array")
+        x_delta, y_delta = max_shift
+        results = func(self._shifted_window(x_delta, y_delta)) if func else None
+        return (*self._shift_to_geometry(x_delta, y_delta), results)
+
+    def top_transpositions(
+        self,
+        k: int,
+        min_separation: int = 0,
+        func: Callable[[np.ndarray], Any] | None = None,
+        rank_by: str | StatisticKernel = "mean",
+    ) -> list[tuple[Polygon, Affine, Any | None]]:
+        """
+        Calculate the k highest ranked transpositions of the watershed mask over the data array.
+
+        The valid shifts are ranked by watershed mean (or another statistic) in one pass and accepted in order, skipping any shift
+        closer than `min_separation` cells (in both x and y) to a shift that was already accepted. The first
+        transposition is the same as the one from `max_transpose`.
+
+        Args:
+            k (int): The number of transpositions to return.
+            min_separation (int): The minimum distance in cells, along x or y, between accepted shifts.
+            func (Callable[[np.ndarray], Any] | None): A callable to apply to the data array for each transposition.
+            rank_by (str | StatisticKernel): The statistic used to rank shifts, e.g. "mean", "max" or "p90".
+
+        Returns
+        -------
+            list[tuple[Polygon, Affine, Any | None]]: The resulting polygon, affine transformation, and results for
+            each transposition, highest ranked first. Fewer than k are returned if the valid shifts run out.
+        """
+        shifts = self.valid_shifts
+        # a stable sort keeps the order of `valid_shifts` for ties, and the shift of `max_transpose` leads so near-ties
+        # within rounding tolerance (see `_first_max`) resolve the same way
+        values = self._ranking_values(rank_by)
+        order = np.argsort(-values, kind="stable")
+        if len(order):
+            first = int(_first_max(values))
+            order = np.concatenate([[first], order[order != first]])
+        ranked = shifts[order]
+        accepted = np.empty((0, 2), dtype=int)
+        for shift in ranked:
+            if len(accepted) >= k:
+                break
+            if min_separation > 0 and len(accepted) > 0:
+                if np.abs(accepted - shift).max(axis=1).min() < min_separation:
+                    continue
+            accepted = np.vstack([accepted, shift])
+
+        transpositions = []
+        for x_delta, y_delta in accepted:
+            results = func(self._shifted_window(x_delta, y_delta)) if func else None
+            transpositions.append((*self._shift_to_geometry(int(x_delta), int(y_delta)), results))
+        return transpositions
+
+    def _shift_to_geometry(self, x_delta: int, y_delta: int) -> tuple[Polygon, Affine]:
+        """Convert a shift in cells to the translated watershed mask polygon and its affine transformation."""
+        max_shift = (float(x_delta * self.x_cellsize), float(y_delta * self.y_cellsize))
+        poly = translate(self.watershed_mask_polygon, *max_shift)
         aff = Affine.translation(*max_shift)
-        return poly, aff, results
+        return poly, aff
+
+    def max_transpose_batch(
+        self, stack: xr.DataArray | np.ndarray, func: Callable[[np.ndarray], Any] | None = None
+    ) -> list[tuple[Polygon, Affine, Any | None] | None]:
+        """
+        Calculate the maximum transpose of the watershed mask for every layer of a stack of grids.
+
+        Each layer (e.g. the accumulation following one candidate start date) must be on the grid of the
+        data array. Valid shifts and watershed means are found for all layers at once by correlating the
+        stack with the clipped watershed mask, so the only per layer work is applying the optional callable.
+
+        Args:
+            stack (xr.DataArray | np.ndarray): A (layer, y, x) stack of grids.
+            func (Callable[[np.ndarray], Any] | None): A callable to apply to the data array of each layer.
+
+        Returns
+        -------
+            list[tuple[Polygon, Affine, Any | None] | None]: The resulting polygon, affine transformation, and
+            results for each layer, or None for layers without a valid shift.
+        """
+        if isinstance(stack, xr.DataArray):
+            stack = stack.to_numpy()
+        if stack.ndim != 3 or stack.shape[1:] != (self.height, self.width):
+            raise ValueError(f"Expected a stack of shape (layer, {self.height}, {self.width}), got {stack.shape}")
+        finite = np.isfinite(stack)
+        nonfinite_counts = np.rint(self._correlate_mask(~finite))
+        sums = self._correlate_mask(np.where(finite, stack, 0))
+        means = np.where(nonfinite_counts == 0, sums / self.watershed_mask_clipped.sum(), -np.inf)
+        # order origins by column then row within each layer, as `valid_shifts` is ordered, and break ties within
+        # rounding tolerance by that order (see `_first_max`)
+        means = means.transpose(0, 2, 1).reshape(len(stack), -1)
+        best = _first_max(means, axis=1)
+        best_cols, best_rows = np.unravel_index(best, (sums.shape[2], sums.shape[1]))
+
+        results = []
+        for layer, (index, row, col) in enumerate(zip(best, best_rows, best_cols)):
+            if not np.isfinite(means[layer, index]):
+                results.append(None)
+                continue
+            x_delta = int(col) - self.watershed_window.col_off
+            y_delta = int(row) - self.watershed_window.row_off
+            layer_results = func(self._shifted_window(x_delta, y_delta, stack[layer])) if func else None
+            results.append((*self._shift_to_geometry(x_delta, y_delta), layer_results))
+        return results
+
+
+def max_transpose_watersheds(
+    data_array: xr.DataArray,
+    watersheds: list[Polygon],
+    x_var: str,
+    y_var: str,
+    func: Callable[[np.ndarray], Any] | None = None,
+    plans: list["TranspositionPlan | None"] | None = None,
+    dtype: str | np.dtype | None = None,
+) -> list[tuple[Polygon, Affine, Any | None] | None]:
+    """
+    Calculate the maximum transpose of several watersheds over one data array.
+
+    The data array is read once and the grid, and its grid of finite cells, are Fourier transformed once. Each
+    watershed mask is then correlated against the shared transforms, so adding a watershed (e.g. a nested or
+    neighbouring basin sharing the transposition region) only costs one mask transform and one inverse transform.
+    Shifts are chosen as by the "convolution" engine of `Transpose.max_transpose`.
+
+    Args:
+        data_array (xr.DataArray): The data array to be transposed.
+        watersheds (list[Polygon]): The watershed polygons.
+        x_var (str): The x variable name in the data array.
+        y_var (str): The y variable name in the data array.
+        func (Callable[[np.ndarray], Any] | None): A callable to apply to the data under each transposed watershed.
+        plans (list[TranspositionPlan | None], optional): A precomputed plan for each watershed, or None to
+            rasterize its mask.
+        dtype (str | np.dtype, optional): The dtype the data array is converted to.
+
+    Returns
+    -------
+        list[tuple[Polygon, Affine, Any | None] | None]: The resulting polygon, affine transformation, and results for
+        each watershed, or None for watersheds without a valid shift.
+    """
+    plans = plans or [None] * len(watersheds)
+    if len(plans) != len(watersheds):
+        raise ValueError(f"Expected one plan per watershed, got {len(plans)} plans for {len(watersheds)} watersheds")
+    transposes = [
+        Transpose(data_array, watershed, x_var, y_var, engine="convolution", plan=plan, dtype=dtype)
+        for watershed, plan in zip(watersheds, plans)
+    ]
+    if not transposes:
+        return []
+    data = transposes[0].np_data_array
+    for transpose in transposes[1:]:
+        transpose._np_data_array = data
+    finite = np.isfinite(data)
+    masks = [transpose.watershed_mask_clipped for transpose in transposes]
+    all_sums = correlate_masks(np.where(finite, data, 0), masks)
+    all_nonfinite_counts = correlate_masks(~finite, masks)
+
+    results = []
+    for transpose, mask, sums, nonfinite_counts in zip(transposes, masks, all_sums, all_nonfinite_counts):
+        means = np.where(np.rint(nonfinite_counts) == 0, sums / mask.sum(), -np.inf)
+        # order origins by column then row, as `valid_shifts` is ordered, and break ties within rounding tolerance by
+        # that order (see `_first_max`)
+        index = int(_first_max(means.T.ravel()))
+        col, row = np.unravel_index(index, means.T.shape)
+        if not np.isfinite(means[row, col]):
+            results.append(None)
+            continue
+        x_delta = int(col) - transpose.watershed_window.col_off
+        y_delta = int(row) - transpose.watershed_window.row_off
+        watershed_results = func(transpose._shifted_window(x_delta, y_delta)) if func else None
+        results.append((*transpose._shift_to_geometry(x_delta, y_delta), watershed_results))
+    return results
+
+
+def _rasterize_subbasin_labels(subbasins: list[Polygon], mask: np.ndarray, transform: Affine) -> np.ndarray:
+    """Rasterize sub-basins into a label grid over a clipped watershed mask, as described in `subbasin_labels`."""
+    if len(subbasins) == 0:
+        raise ValueError("At least one sub-basin is required")
+    labelled = [(subbasin, label) for label, subbasin in enumerate(subbasins, start=1)]
+    kwargs = {"out_shape": mask.shape, "transform": transform, "fill": 0, "dtype": np.int32}
+    labels = rasterize(labelled, **kwargs)
+    touched = rasterize(labelled, all_touched=True, **kwargs)
+    labels = np.where(labels > 0, labels, touched)
+    labels[~mask] = 0
+    return labels
+
+
+def _tile_valid_origins(tile: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Find the window origins of a tile where every cell under the mask is finite."""
+    return np.rint(correlate_mask(~np.isfinite(tile), mask)) == 0
+
+
+def _valid_tile_origins(
+    tile: np.ndarray, mask: np.ndarray, row_start: int, col_start: int
+) -> tuple[int, int, np.ndarray]:
+    """
+    Find the valid window origins of one tile of a grid.
+
+    Returns
+    -------
+        tuple[int, int, np.ndarray]: The row and column of the first window origin of the tile, and a boolean array
+        of the valid window origins of the tile.
+    """
+    return row_start, col_start, _tile_valid_origins(tile, mask)
+
+
+def _valid_tile_spaces(
+    tile: np.ndarray, mask: np.ndarray, row_start: int, col_start: int
+) -> tuple[int, int, np.ndarray]:
+    """
+    Find the cells of one tile of a grid covered by the mask at a valid window origin of the tile.
+
+    Returns
+    -------
+        tuple[int, int, np.ndarray]: The row and column of the top left cell of the tile in the grid, and a boolean
+        array with the shape of the tile.
+    """
+    origins = np.full(tile.shape, False)
+    valid = _tile_valid_origins(tile, mask)
+    origins[: valid.shape[0], : valid.shape[1]] = valid
+    height, width = mask.shape
+    # anchor the structuring element at its top left cell so each origin is dilated down and to the right
+    return row_start, col_start, binary_dilation(origins, structure=mask, origin=(-(height // 2), -(width // 2)))
+
+
+def _search_tile(tile: np.ndarray, mask: np.ndarray, row_start: int, col_start: int) -> tuple[float, int, int] | None:
+    """
+    Search the window origins of one tile of a grid.
+
+    Args:
+        tile (np.ndarray): The data under every window starting in the tile.
+        mask (np.ndarray): The clipped watershed mask.
+        row_start (int): The row of the first window origin of the tile in the grid.
+        col_start (int): The column of the first window origin of the tile in the grid.
+
+    Returns
+    -------
+        tuple[float, int, int] | None: The greatest mean with its origin column and row in the grid, or None if the
+        tile has no valid origins.
+    """
+    valid = _tile_valid_origins(tile, mask)
+    if not valid.any():
+        return None
+    sums = correlate_mask(np.where(np.isfinite(tile), tile, 0), mask)
+    means = np.where(valid, sums / mask.sum(), -np.inf)
+    # the first greatest mean with origins ordered by column then row, with ties within rounding tolerance
+    col_offset, row_offset = divmod(int(_first_max(means.T.ravel())), means.shape[0])
+    return float(means[row_offset, col_offset]), col_offset + col_start, row_offset + row_start
+
+
+class TranspositionPlan:
+    """
+    The watershed mask, window and mask polygon of a watershed on a grid, which are shared by every storm in a catalog.
+
+    Plans are keyed by a hash of the watershed geometry, the transposition region geometry and the grid definition,
+    and saved under a directory as a `.npz` file holding the mask with a `.json` file holding the rest.
+
+    Attributes
+    ----------
+        key (str): The plan key.
+        watershed_mask (np.ndarray): The watershed mask as a 2D boolean numpy array.
+        watershed_window (Window): The window of the watershed in the grid.
+        watershed_mask_polygon (Polygon): The watershed mask polygon.
+        transform (Affine): The grid transform.
+        shape (tuple[int, int]): The grid shape (height, width).
+    """
+
+    _loaded: dict[tuple[str, str], "TranspositionPlan"] = {}
+
+    def __init__(
+        self,
+        key: str,
+        watershed_mask: np.ndarray,
+        watershed_window: Window,
+        watershed_mask_polygon: Polygon,
+        transform: Affine,
+    ) -> None:
+        self.key = key
+        self.watershed_mask = watershed_mask
+        self.watershed_window = watershed_window
+        self.watershed_mask_polygon = watershed_mask_polygon
+        self.transform = transform
+        self.shape = watershed_mask.shape
+        row_slice, col_slice = watershed_window.toslices()
+        self.watershed_mask_clipped = watershed_mask[row_slice, col_slice]
+        self._subbasin_labels: dict[str, np.ndarray] = {}
+
+    def subbasin_labels(self, subbasins: list[Polygon]) -> np.ndarray:
+        """
+        Get the sub-basin label grid of the watershed window (see `Transpose.subbasin_labels`), rasterized once.
+
+        Labels are kept by the plan for each set of sub-basins, so the storms of a catalog, which share its loaded
+        plan, rasterize them once per process.
+
+        Args:
+            subbasins (list[Polygon]): The sub-basin polygons.
+
+        Returns
+        -------
+            np.ndarray: A read-only integer array with the shape of `watershed_mask_clipped`.
+        """
+        digest = hashlib.sha256()
+        for subbasin in subbasins:
+            digest.update(subbasin.wkb)
+        key = digest.hexdigest()
+        if key not in self._subbasin_labels:
+            labels = _rasterize_subbasin_labels(
+                subbasins, self.watershed_mask_clipped, window_transform(self.watershed_window, self.transform)
+            )
+            labels.flags.writeable = False
+            self._subbasin_labels[key] = labels
+        return self._subbasin_labels[key]
+
+    @staticmethod
+    def plan_key(watershed: Polygon, transposition_region: Polygon, transform: Affine, shape: tuple[int, int]) -> str:
+        """Hash the watershed and transposition region geometries and the grid definition into a plan key."""
+        digest = hashlib.sha256()
+        digest.update(watershed.wkb)
+        digest.update(transposition_region.wkb)
+        digest.update(json.dumps([*tuple(transform)[:6], *shape]).encode())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def from_transpose(cls, transpose: Transpose, transposition_region: Polygon) -> "TranspositionPlan":
+        """Create a plan from the watershed mask and window of a Transpose instance."""
+        return cls(
+            cls.plan_key(
+                transpose.watershed, transposition_region, transpose.transform, transpose.watershed_mask.shape
+            ),
+            transpose.watershed_mask,
+            transpose.watershed_window,
+            transpose.watershed_mask_polygon,
+            transpose.transform,
+        )
+
+    def save(self, plan_dir: str) -> None:
+        """Save the plan as `<key>.npz` and `<key>.json` under a directory."""
+        os.makedirs(plan_dir, exist_ok=True)
+        metadata = {
+            "key": self.key,
+            "shape": list(self.shape),
+            "transform": list(self.transform)[:6],
+            "watershed_window": {
+                "col_off": int(self.watershed_window.col_off),
+                "row_off": int(self.watershed_window.row_off),
+                "width": int(self.watershed_window.width),
+                "height": int(self.watershed_window.height),
+            },
+            "watershed_mask_polygon": mapping(self.watershed_mask_polygon),
+        }
+        # write to temporary files and rename so that concurrent workers, processes or threads, never read a partial
+        # plan or rename each other's files
+        npz_path = os.path.join(plan_dir, f"{self.key}.npz")
+        json_path = os.path.join(plan_dir, f"{self.key}.json")
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(f"{npz_path}.{suffix}", "wb") as f:
+            np.savez_compressed(f, watershed_mask=self.watershed_mask)
+        os.replace(f"{npz_path}.{suffix}", npz_path)
+        with open(f"{json_path}.{suffix}", "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(f"{json_path}.{suffix}", json_path)
+
+    @classmethod
+    def load(cls, plan_dir: str, key: str) -> "TranspositionPlan | None":
+        """Load a plan saved under a directory, or return None if it does not exist."""
+        if (plan_dir, key) in cls._loaded:
+            return cls._loaded[(plan_dir, key)]
+        npz_path = os.path.join(plan_dir, f"{key}.npz")
+        json_path = os.path.join(plan_dir, f"{key}.json")
+        if not os.path.exists(npz_path) or not os.path.exists(json_path):
+            return None
+        with open(json_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        with np.load(npz_path) as npz:
+            watershed_mask = npz["watershed_mask"]
+        plan = cls(
+            metadata["key"],
+            watershed_mask,
+            Window(**metadata["watershed_window"]),
+            shape(metadata["watershed_mask_polygon"]),
+            Affine(*metadata["transform"]),
+        )
+        cls._loaded[(plan_dir, key)] = plan
+        return plan
+
+    @classmethod
+    def load_or_create(
+        cls, plan_dir: str, data_array: xr.DataArray, watershed: Polygon, transposition_region: Polygon
+    ) -> "TranspositionPlan":
+        """Load the plan for a watershed on the grid of a data array, creating and saving it if it does not exist."""
+        key = cls.plan_key(watershed, transposition_region, data_array.rio.transform(), data_array.rio.shape)
+        plan = cls.load(plan_dir, key)
+        if plan is None:
+            logging.info("Creating transposition plan %s in %s", key, plan_dir)
+            transpose = Transpose(data_array, watershed, data_array.rio.x_dim, data_array.rio.y_dim)
+            plan = cls.from_transpose(transpose, transposition_region)
+            plan.save(plan_dir)
+            cls._loaded[(plan_dir, key)] = plan
+        return plan
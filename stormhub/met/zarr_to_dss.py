@@ -6,13 +6,18 @@ import math
 from typing import List, Tuple, Literal
 from affine import Affine
 from hecdss import HecDss, gridded_data
+import dask
 import numpy as np
 from pandas import Timestamp
 import geopandas as gpd
 from geopandas import GeoDataFrame
-import s3fs
 import xarray as xr
-from stormhub.met.consts import NOAA_AORC_S3_BASE_URL, KM_TO_M_CONVERSION_FACTOR, SHG_WKT
+from stormhub.met.aorc.aorc import read_aorc_window
+from stormhub.met.aorc.clip import clip_region
+from stormhub.met.compute import dask_config
+from stormhub.met.aorc.registry import aorc_registry
+from stormhub.met.aorc.source import aorc_source
+from stormhub.met.consts import KM_TO_M_CONVERSION_FACTOR, SHG_WKT
 
 
 class MeasurementType(Enum):
@@ -91,14 +96,8 @@ class NOAADataVariable(Enum):
 
 
 def get_aorc_paths(storm_start: datetime, storm_end: datetime) -> list[str]:
-    """Construct s3 paths for AORC dataset given storm start and end time."""
-    aorc_paths = []
-    if storm_start.year == storm_end.year:
-        aorc_paths.append(f"{NOAA_AORC_S3_BASE_URL}/{storm_start.year}.zarr")
-    else:
-        for year in range(storm_start.year, storm_end.year + 1):  # plus one since end range is exclusive
-            aorc_paths.append(f"{NOAA_AORC_S3_BASE_URL}/{year}.zarr")
-    return aorc_paths
+    """Construct paths of the AORC source for AORC dataset given storm start and end time."""
+    return aorc_source().year_paths(storm_start, storm_end)
 
 
 def date_range_dss_path_format(date: datetime, measurement_type: MeasurementType) -> Tuple[str, str]:
@@ -273,9 +272,7 @@ def get_s3_zarr_data(
         end_dt: The end datetime to filter the data.
         variables_of_interest: A list of variables to select from the dataset. If empty, all variables will be read.
     """
-    s3 = s3fs.S3FileSystem(anon=True)
-    fileset = [s3fs.S3Map(root=path, s3=s3, check=False) for path in s3_paths]
-    ds = xr.open_mfdataset(fileset, engine="zarr", chunks="auto", consolidated=True)
+    ds = aorc_registry().open(s3_paths)
 
     # subset data to only the variables
     if variables_of_interest:
@@ -285,15 +282,8 @@ def get_s3_zarr_data(
     aoi_gdf = aoi_gdf.to_crs(ds.rio.crs)
     aoi_shape = aoi_gdf.geometry.iloc[0]
 
-    # get a rough subsection of the dataset based on time and aoi in order to reduce it's size
-    # this results in a speed improvement for rio.clip if the xarray.Dataset is sufficiently sized
-    bounds = aoi_shape.bounds
-    ds = ds.sel(
-        time=slice(start_dt, end_dt), longitude=slice(bounds[0], bounds[2]), latitude=slice(bounds[1], bounds[3])
-    )
-
-    # clip ds to exact shape
-    ds = ds.rio.clip([aoi_shape], drop=True, all_touched=True)
+    # clip ds to exact shape, with the mask of the aoi rasterized once per process
+    ds = clip_region(ds.sel(time=slice(start_dt, end_dt)), aoi_shape)
 
     return ds
 
@@ -365,17 +355,54 @@ def noaa_zarr_to_dss(
     storm_start: datetime,
     storm_duration: int,
     variables_of_interest: List[NOAADataVariable],
+    compute_policy: str = None,
+    compute_threads: int = None,
+    window: xr.Dataset = None,
+):
+    """Given a geometry and datetime information about a storm, writes variables of interest from NOAA dataset to DSS.
+
+    Every variable of interest is read in one pass with `read_aorc_window`. A window already read, e.g. the
+    `aorc_source_data` of an `AORCItem` created with the same variables, is clipped to the area of interest instead of
+    being read again.
+
+    The dask scheduler of the read follows `compute_policy` (see `stormhub.met.compute`) when given, e.g.
+    "synchronous" when exporting storms from a pool of worker processes.
+    """
+    with dask.config.set(dask_config(compute_policy, compute_threads)):
+        _noaa_zarr_to_dss(
+            output_dss_path,
+            aoi_geometry_gpkg_path,
+            aoi_name,
+            storm_start,
+            storm_duration,
+            variables_of_interest,
+            window,
+        )
+
+
+def _noaa_zarr_to_dss(
+    output_dss_path: str,
+    aoi_geometry_gpkg_path: str,
+    aoi_name: str,
+    storm_start: datetime,
+    storm_duration: int,
+    variables_of_interest: List[NOAADataVariable],
+    window: xr.Dataset = None,
 ):
-    """Given a geometry and datetime information about a storm, writes variables of interest from NOAA dataset to DSS."""
     # arrange parameters
     aoi_gdf = gpd.read_file(aoi_geometry_gpkg_path)
     storm_end = storm_start + timedelta(hours=storm_duration)
-    storm_start += timedelta(hours=1)  # do this to make start time exclusive
-    aorc_paths = get_aorc_paths(storm_start, storm_end)
     voi_keys = [voi.value for voi in variables_of_interest]
 
-    # get aorc data
-    aorc_data = get_s3_zarr_data(aorc_paths, aoi_gdf, storm_start, storm_end, voi_keys)
+    # get aorc data, with the start time exclusive
+    if window is not None:
+        aoi_shape = aoi_gdf.to_crs(window.rio.crs).geometry.iloc[0]
+        window = window[voi_keys].sel(time=slice(storm_start + timedelta(hours=1), storm_end))
+        aorc_data = clip_region(window, aoi_shape)
+    else:
+        aorc_paths = get_aorc_paths(storm_start + timedelta(hours=1), storm_end)
+        aoi_shape = aoi_gdf.to_crs(aorc_registry().open(aorc_paths).rio.crs).geometry.iloc[0]
+        aorc_data = read_aorc_window(aorc_paths, storm_start, storm_end, aoi_shape, voi_keys)
 
     # write to dss
     for data_variable in variables_of_interest:
@@ -384,7 +411,7 @@ def noaa_zarr_to_dss(
             data = convert_temperature_dataset(data)
         write_to_dss(
             output_dss_path,
-            data=aorc_data[data_variable.value],
+            data=data,
             aoi_name=aoi_name,
             param_name=data_variable.dss_variable_title,
             param_measurement_type=data_variable.measurement_type,
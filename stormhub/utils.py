@@ -112,6 +112,21 @@ class StacPathManager:
         """Build Catalog file path."""
         return os.path.join(self._catalog_dir, "catalog.json")
 
+    @property
+    def transposition_plan_dir(self):
+        """Build transposition plan directory path."""
+        return os.path.join(self._catalog_dir, "transposition-plans")
+
+    @property
+    def aorc_store_dir(self):
+        """Build local AORC store directory path."""
+        return os.path.join(self._catalog_dir, "aorc-store")
+
+    @property
+    def aorc_cache_dir(self):
+        """Build AORC chunk cache directory path."""
+        return os.path.join(self._catalog_dir, "aorc-cache")
+
     def storm_collection_id(self, duration: int) -> str:
         """Build storm collection id."""
         return f"{duration}hr-events"